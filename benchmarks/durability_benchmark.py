@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the durability policies of the save path.
+Saves the same captures with save_depth_images under every policy, into a directory on the disk being measured,
+reporting the captures saved per second, the time spent syncing and the worst time a capture took to save and sync.
+Run it on the disk the experiments are saved to, a RAM backed /tmp makes syncing free.
+
+Usage, from the repository root:
+    python benchmarks/durability_benchmark.py
+    python benchmarks/durability_benchmark.py -n 50 -d /media/usb -color png -depth npz
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_PATH)
+sys.path.insert(0, REPO_PATH)
+
+import numpy as np
+
+from util import DURABILITY_BATCH_CAPTURES, resolution_width
+from components.depth_camera_feed import save_depth_images
+from components.durable_writes import DURABILITY_POLICIES, DurableWriter
+from components.frame_transform import FrameOrienter
+from components.image_writers import COLOR_FORMATS, DEPTH_FORMATS
+
+
+def measure(durability, exp_path, color_arr, depth_arr, ncaptures, color_format, depth_format):
+    """Saves ncaptures captures under a durability policy, the way a save worker does.
+
+    Returns:
+        dict: captures per second, ms per capture spent syncing, worst ms a capture took to save and sync
+    """
+    writer = DurableWriter(durability)
+    color_orienter, depth_orienter = FrameOrienter(), FrameOrienter()
+    sync_sec, worst_sec = 0.0, 0.0
+
+    start = time.perf_counter()
+    for i in range(ncaptures):
+        capture_start = time.perf_counter()
+        save_depth_images(color_arr, depth_arr, exp_path, "%s_%03d" % (durability, i), depth_format,
+                          color_orienter, depth_orienter, color_format, writer=writer)
+        capture_sync_sec = writer.capture_done()
+        sync_sec += capture_sync_sec
+        worst_sec = max(worst_sec, time.perf_counter() - capture_start)
+    # the save worker syncs what is left when it stops
+    sync_sec += writer.sync()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "captures_per_sec": ncaptures / elapsed,
+        "sync_ms_per_capture": 1000 * sync_sec / ncaptures,
+        "worst_ms": 1000 * worst_sec,
+    }
+
+
+def main():
+    parser = ArgumentParser(prog="python benchmarks/durability_benchmark.py", description="Durability policy microbenchmark.")
+    parser.add_argument('-n', dest="ncaptures", type=int, default=30, help="captures per policy")
+    parser.add_argument('-d', dest="directory", default=REPO_PATH, help="directory on the disk to measure, defaults to the repository's")
+    parser.add_argument('-res', dest="res", type=int, default=1280, choices=[1280, 640])
+    parser.add_argument('-color', dest="color_format", default="bmp", choices=list(COLOR_FORMATS))
+    parser.add_argument('-depth', dest="depth_format", default="npy", choices=list(DEPTH_FORMATS))
+    args = parser.parse_args()
+
+    height, width = resolution_width[args.res], args.res
+    rng = np.random.default_rng(0)
+    color_arr = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    depth_arr = rng.integers(0, 5000, (height, width), dtype=np.uint16)
+
+    print("%ix%i, %i captures per policy, %s color, %s depth, in %s" % (
+        width, height, args.ncaptures, args.color_format, args.depth_format, args.directory))
+    for durability in DURABILITY_POLICIES:
+        exp_path = tempfile.mkdtemp(prefix="durability_benchmark_", dir=args.directory)
+        try:
+            for directory in ("RGB", "Depth"):
+                os.makedirs(os.path.join(exp_path, directory))
+            result = measure(durability, exp_path, color_arr, depth_arr, args.ncaptures, args.color_format, args.depth_format)
+        finally:
+            shutil.rmtree(exp_path)
+
+        at_risk = {"capture": "none", "batched": "up to %i captures" % DURABILITY_BATCH_CAPTURES, "none": "until the OS writes them"}
+        print("%-8s %6.1f captures/s  %7.2f ms/capture syncing  %7.1f ms worst capture  lost on power loss: %s" % (
+            durability, result["captures_per_sec"], result["sync_ms_per_capture"], result["worst_ms"], at_risk[durability]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the frame orientation stage of the save path.
+Compares the legacy rotate, copy and channel reversal with the FrameOrienter, reporting the time
+and the bytes allocated per frame.
+
+Usage, from the repository root:
+    python benchmarks/orientation_benchmark.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_PATH)
+sys.path.insert(0, REPO_PATH)
+
+import numpy as np
+
+from util import FRAME_ROTATION, resolution_width
+from components.frame_transform import FrameOrienter
+
+
+def legacy_orient(color_arr, depth_arr):
+    """The orientation done by save_depth_images before the FrameOrienter, the color ends up RGB for Pillow."""
+    color_arr = np.ascontiguousarray(np.rot90(color_arr, 1).copy()[:, :, ::-1]) # Image.fromarray copies it contiguous
+    depth_arr = np.rot90(depth_arr, 1).copy()
+    return color_arr, depth_arr
+
+def make_orienter_orient(rotation, channel_order):
+    """The orientation done by save_depth_images now, with orienters reused across frames."""
+    color_orienter = FrameOrienter(rotation, channel_order)
+    depth_orienter = FrameOrienter(rotation)
+
+    def orient(color_arr, depth_arr):
+        return color_orienter.apply(color_arr), depth_orienter.apply(depth_arr)
+    return orient
+
+def measure(orient, color_arr, depth_arr, nframes):
+    """Runs an orientation over nframes frames.
+
+    Returns:
+        dict: ms per frame, and the bytes allocated per frame on top of what was already allocated
+    """
+    orient(color_arr, depth_arr) # warm up, the orienters allocate their buffers once
+
+    start = time.perf_counter()
+    for _ in range(nframes):
+        orient(color_arr, depth_arr)
+    elapsed = time.perf_counter() - start
+
+    # numpy reports its buffers to tracemalloc, the peak over the baseline is what a frame allocates
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(nframes):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        orient(color_arr, depth_arr)
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        "ms_per_frame": 1000 * elapsed / nframes,
+        "bytes_allocated_per_frame": allocated / nframes,
+    }
+
+
+def main():
+    parser = ArgumentParser(prog="python benchmarks/orientation_benchmark.py", description="Frame orientation microbenchmark.")
+    parser.add_argument('-n', dest="nframes", type=int, default=50, help="frames per measurement")
+    parser.add_argument('-res', dest="res", type=int, default=1280, choices=[1280, 640])
+    args = parser.parse_args()
+
+    height, width = resolution_width[args.res], args.res
+    rng = np.random.default_rng(0)
+    color_arr = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    depth_arr = rng.integers(0, 5000, (height, width), dtype=np.uint16)
+
+    frame_nbytes = color_arr.nbytes + depth_arr.nbytes
+    print("%ix%i, %i frames, %i bytes per color+depth frame" % (width, height, args.nframes, frame_nbytes))
+    for name, orient in (("legacy rot90/copy/[::-1]", legacy_orient),
+                         ("FrameOrienter rgb", make_orienter_orient(FRAME_ROTATION, "rgb")),
+                         ("FrameOrienter bgr", make_orienter_orient(FRAME_ROTATION, "bgr"))):
+        result = measure(orient, color_arr, depth_arr, args.nframes)
+        print("%-26s %7.2f ms/frame  %10.0f bytes allocated/frame (%.1f frame buffers)" % (
+            name, result["ms_per_frame"], result["bytes_allocated_per_frame"], result["bytes_allocated_per_frame"] / frame_nbytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+End-to-end stream and capture benchmark.
+Runs the PlotCamLite window headless against the synthetic camera, and measures:
+    - producer fps, frames the camera process published to the frame ring
+    - display fps, frames the GUI displayed
+    - display latency, sensor timestamp of a frame to it being painted
+    - capture latency, take_picture to the save worker reporting the capture on disk, per depth format,
+      with the color format and depth processing preset picked
+    - color encoding time and size of the saved color images
+    - trigger to frame latency, take_picture to the sensor timestamp of the frame saved for it
+    - cpu % and peak rss of the GUI, camera and save worker processes (needs psutil)
+for every resolution and fps, and writes the results as JSON.
+
+Usage, from the repository root:
+    python benchmarks/stream_benchmark.py -o bench.json
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+# the app resolves its resources from the working directory
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_PATH)
+sys.path.insert(0, REPO_PATH)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QApplication
+
+from util import DEFAULT_COLOR_FORMAT, PCL_EXP_PATH, PNG_COMPRESSION, VERSION_NUMBER, pcl_config, resolution_width
+from components.depth_processing import DEPTH_PROCESSING_PRESETS
+from components.image_writers import COLOR_FORMATS, DEPTH_FORMATS
+from components.main_window import PlotCamLiteWindow_Monitor
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SAMPLE_PERIOD_MS = 250  # how often process memory is sampled
+BENCHMARK_EXP_NAME = "_benchmark"
+
+
+def summarize(values):
+    """Summarizes a list of latencies.
+
+    Args:
+        values (list): latencies in ms
+
+    Returns:
+        dict: count, mean and percentiles, None if there are no values
+    """
+    if not values:
+        return None
+
+    values = np.asarray(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(values.max()),
+    }
+
+
+class BenchmarkWindow(PlotCamLiteWindow_Monitor):
+    """
+    The PlotCamLite window, timing every displayed frame and every capture.
+    """
+
+    def __init__(self):
+        self.display_latencies = []
+        self.capture_start_times = {}  # request id -> (depth format, take_picture time)
+        self.capture_latencies = {fmt: [] for fmt in DEPTH_FORMATS}
+        self.trigger_to_frame_latencies = []
+        self.color_encode_times = []
+        self.color_sizes = []
+        self.failed_captures = 0
+        super().__init__()
+
+    def on_frame_painted(self, seq):
+        self.display_latencies.append(time.time() * 1000 - self.frame_ring.info(seq, "timestamp"))
+        super().on_frame_painted(seq)
+
+    def take_picture(self):
+        request_id = self.next_request_id
+        super().take_picture()
+        if self.next_request_id != request_id:
+            self.capture_start_times[request_id] = (self.experiment_settings["depth_format"], time.perf_counter())
+
+    def on_capture_completed(self, request_id, img_name, saved, frame_info):
+        depth_format, start_time = self.capture_start_times.pop(request_id, (None, None))
+        if start_time is not None:
+            if saved:
+                self.capture_latencies[depth_format].append((time.perf_counter() - start_time) * 1000)
+                self.trigger_to_frame_latencies.append(frame_info["frame_timestamp"] - frame_info["trigger_timestamp"])
+                self.color_encode_times.append(frame_info["color_encode_ms"])
+                self.color_sizes.append(frame_info["color_bytes"])
+            else:
+                self.failed_captures += 1
+        super().on_capture_completed(request_id, img_name, saved, frame_info)
+
+
+class ProcessSampler:
+    """
+    Tracks cpu time and peak memory of the GUI, camera and save worker processes.
+    """
+
+    def __init__(self, camera_pid):
+        self.camera_pid = camera_pid
+        self.peak_rss = {}
+        self.cpu_times = {}  # pid -> (group, first cpu time, last cpu time)
+        self.start_time = time.time()
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.sample)
+        self.timer.start(SAMPLE_PERIOD_MS)
+        self.sample()
+
+    def processes(self):
+        """Returns (group, psutil.Process) of the processes of the app."""
+        camera = psutil.Process(self.camera_pid)
+        processes = [("gui", psutil.Process(os.getpid())), ("camera", camera)]
+        processes += [("save_workers", child) for child in camera.children(recursive=True)]
+        return processes
+
+    def sample(self):
+        try:
+            processes = self.processes()
+        except psutil.NoSuchProcess:
+            return
+
+        rss = {}
+        for group, process in processes:
+            try:
+                with process.oneshot():
+                    cpu = process.cpu_times()
+                    rss[group] = rss.get(group, 0) + process.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+            cpu_time = cpu.user + cpu.system
+            first = self.cpu_times.get(process.pid, (group, cpu_time, cpu_time))[1]
+            self.cpu_times[process.pid] = (group, first, cpu_time)
+
+        for group, nbytes in rss.items():
+            self.peak_rss[group] = max(self.peak_rss.get(group, 0), nbytes)
+
+    def stop(self):
+        """Stops sampling and returns the per group cpu % and peak rss."""
+        self.sample()
+        self.timer.stop()
+        elapsed = time.time() - self.start_time
+        cpu_percent = {}
+        for group, first, last in self.cpu_times.values():
+            cpu_percent[group] = cpu_percent.get(group, 0.0) + 100.0 * (last - first) / elapsed
+
+        return {group: {"cpu_percent": cpu_percent.get(group, 0.0), "peak_rss_mb": self.peak_rss[group] / 2**20}
+                for group in self.peak_rss}
+
+
+def create_benchmark_experiment():
+    """Creates an empty experiment to capture into."""
+    exp_path = os.path.join(PCL_EXP_PATH, BENCHMARK_EXP_NAME)
+    shutil.rmtree(exp_path, ignore_errors=True)
+    for directory in ("RGB", "Depth", "Metadata"):
+        os.makedirs(os.path.join(exp_path, directory))
+    return exp_path
+
+
+def run(app, res, fps, args):
+    """Benchmarks the app at a resolution and fps.
+
+    Args:
+        app (QApplication): the application
+        res (int): stream resolution, 1280 or 640
+        fps (int): stream fps
+        args (Namespace): benchmark options
+
+    Returns:
+        dict: the results
+    """
+    pcl_config["camera"] = "sim"
+    pcl_config["stream_height"] = res
+    pcl_config["stream_width"] = resolution_width[res]
+    pcl_config["stream_fps"] = fps
+
+    exp_path = create_benchmark_experiment()
+    window = BenchmarkWindow()
+    window.show()
+    window.update_experiment(BENCHMARK_EXP_NAME)
+    window.experiment_settings["depth_processing"] = DEPTH_PROCESSING_PRESETS[args.depth_processing]
+    window.experiment_settings["color_format"] = args.color_format
+    window.experiment_settings["png_compression"] = args.png_compression
+
+    # wait for the camera to start streaming
+    deadline = time.time() + args.startup_timeout
+    while not window.streaming_cameras() and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    if not window.streaming_cameras():
+        window.close()
+        raise RuntimeError("The synthetic camera did not start within %.0f s" % args.startup_timeout)
+
+    # warm up, then reset the counters and start measuring
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(int(args.warmup * 1000), loop.quit)
+    loop.exec_()
+    window.display_latencies.clear()
+    start_seq = window.frame_ring.latest_seq
+    start_display_count = window.frameUpdateCount
+    sampler = ProcessSampler(window.camera_streams[0].process.pid) if psutil else None
+    start_time = time.time()
+
+    # take pictures at a steady rate, cycling through the depth formats
+    formats = args.depth_formats
+    capture_count = [0]
+
+    def capture():
+        window.experiment_settings["depth_format"] = formats[capture_count[0] % len(formats)]
+        window.take_picture()
+        capture_count[0] += 1
+
+    capture_timer = QtCore.QTimer()
+    capture_timer.timeout.connect(capture)
+    capture_timer.start(int(args.capture_interval * 1000))
+    QtCore.QTimer.singleShot(int(args.duration * 1000), loop.quit)
+    loop.exec_()
+    capture_timer.stop()
+
+    elapsed = time.time() - start_time
+    producer_frames = window.frame_ring.latest_seq - start_seq
+    display_frames = window.frameUpdateCount - start_display_count
+    processes = sampler.stop() if sampler else None
+
+    # closing finishes the queued captures
+    window.close()
+    shutil.rmtree(exp_path, ignore_errors=True)
+
+    return {
+        "resolution": "%ix%i" % (res, resolution_width[res]),
+        "fps": fps,
+        "color_format": args.color_format,
+        "png_compression": args.png_compression if args.color_format == "png" else None,
+        "depth_processing": args.depth_processing,
+        "duration_sec": elapsed,
+        "producer_fps": producer_frames / elapsed,
+        "display_fps": display_frames / elapsed,
+        "frames_dropped": window.camera_view.frames_dropped,
+        "frames_duplicated": window.camera_view.frames_duplicated,
+        "frames_torn": window.camera_view.frames_torn,
+        "display_latency_ms": summarize(window.display_latencies),
+        "capture_latency_ms": {fmt: summarize(window.capture_latencies[fmt]) for fmt in formats},
+        "trigger_to_frame_ms": summarize(window.trigger_to_frame_latencies),
+        "color_encode_ms": summarize(window.color_encode_times),
+        "color_image_mb": float(np.mean(window.color_sizes)) / 2**20 if window.color_sizes else None,
+        "failed_captures": window.failed_captures,
+        "processes": processes,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        prog="python benchmarks/stream_benchmark.py",
+        description="Headless end-to-end benchmark of the PlotCamLite stream and capture path.")
+    parser.add_argument('-o', '--output', dest="output", default=None, help="path to write the JSON results to, defaults to stdout")
+    parser.add_argument('--res', dest="resolutions", type=int, nargs='+', default=[640, 1280], choices=[1280, 640])
+    parser.add_argument('--fps', dest="fps", type=int, nargs='+', default=[15, 30], choices=[15, 30])
+    parser.add_argument('--depth-formats', dest="depth_formats", nargs='+', default=list(DEPTH_FORMATS), choices=list(DEPTH_FORMATS))
+    parser.add_argument('--color-format', dest="color_format", default=DEFAULT_COLOR_FORMAT, choices=list(COLOR_FORMATS),
+                        help="color format the captures are saved in")
+    parser.add_argument('--png-compression', dest="png_compression", type=int, default=PNG_COMPRESSION, choices=range(10),
+                        metavar="0-9", help="zlib level of the png color format")
+    parser.add_argument('--depth-processing', dest="depth_processing", default="raw", choices=list(DEPTH_PROCESSING_PRESETS),
+                        help="depth processing preset the captures are saved with")
+    parser.add_argument('--duration', dest="duration", type=float, default=10.0, help="seconds measured per configuration")
+    parser.add_argument('--warmup', dest="warmup", type=float, default=2.0, help="seconds streamed before measuring")
+    parser.add_argument('--capture-interval', dest="capture_interval", type=float, default=0.5, help="seconds between captures")
+    parser.add_argument('--startup-timeout', dest="startup_timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if psutil is None:
+        print("psutil is not installed, skipping the cpu and memory numbers", file=sys.stderr)
+
+    app = QApplication(sys.argv)
+    runs = []
+    for res in args.resolutions:
+        for fps in args.fps:
+            print("benchmarking %ix%i @ %i fps" % (res, resolution_width[res], fps), file=sys.stderr)
+            runs.append(run(app, res, fps, args))
+
+    results = {
+        "version": VERSION_NUMBER,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+This code handles the headless batch processing of experiment directories
+"""
+import glob
+import json
+import os
+import signal
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from util import (BATCH_CHUNK_SIZE, BATCH_PROGRESS_FILENAME, DEFAULT_DEPTH_FORMAT, JPEG_QUALITY, PCL_EXP_PATH, PNG_COMPRESSION,
+                  THUMBNAIL_SIZE)
+from .experiment_settings import load_experiment_settings, save_experiment_settings
+from .durable_writes import TMP_SUFFIX
+from .image_writers import (COLOR_EXTENSIONS, COLOR_FORMATS, DEPTH_EXTENSIONS, DEPTH_FORMATS, convert_depth_file,
+                            encode_thumbnail, find_experiments, load_depth, save_color)
+from .metadata import read_entries
+from .recovery import CORRUPT_SUFFIX
+
+VALIDATION_REPORT_MAX = 10  # num of missing or orphaned images listed per experiment, the rest are only counted
+
+
+def list_color(exp_path, extensions=COLOR_EXTENSIONS):
+    """Lists the color images of an experiment.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+        extensions (tuple): extensions of the images to list
+
+    Returns:
+        list: paths of the images relative to the experiment, sorted
+    """
+    return sorted(os.path.join("RGB", fname) for fname in os.listdir(os.path.join(exp_path, "RGB"))
+                  if os.path.splitext(fname)[1].lower() in extensions)
+
+def replace_color(exp_path, relpath, color_format, options):
+    """Converts a color image to another format beside the original.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+        relpath (str): path of the image relative to the experiment
+        color_format (str): one of image_writers.COLOR_FORMATS
+        options (dict): the batch options, the original is deleted unless "keep" is set
+
+    Returns:
+        str: what was done
+    """
+    fname = os.path.join(exp_path, relpath)
+    color_arr = cv2.imread(fname, cv2.IMREAD_COLOR)
+    if color_arr is None:
+        raise IOError("Could not read %s" % fname)
+
+    color_dir, basename = os.path.split(fname)
+    _, nbytes, encode_sec = save_color(color_arr, color_dir, os.path.splitext(basename)[0], color_format, options["png_compression"])
+    if not options["keep"]:
+        os.remove(fname)
+    return "converted to %s, %.0f kB in %.0f ms" % (color_format, nbytes / 1024, encode_sec * 1000)
+
+def color_to_png(exp_path, relpath, options):
+    """Lossless, about a third of the size of the bitmap."""
+    return replace_color(exp_path, relpath, "png", options)
+
+def color_to_webp(exp_path, relpath, options):
+    """Lossless, smaller than png but several times slower."""
+    return replace_color(exp_path, relpath, "webp", options)
+
+def color_to_jpeg(exp_path, relpath, options):
+    """Lossy, at JPEG_QUALITY."""
+    return replace_color(exp_path, relpath, "jpeg", options)
+
+def list_txt_depth(exp_path):
+    """Lists the legacy txt depth files of an experiment, relative to it."""
+    return sorted(os.path.join("Depth", fname) for fname in os.listdir(os.path.join(exp_path, "Depth"))
+                  if fname.lower().endswith(".txt"))
+
+def convert_depth(exp_path, relpath, options):
+    """Converts a txt depth file to the "depth_format" option."""
+    convert_depth_file(os.path.join(exp_path, relpath), options["depth_format"], remove_original=not options["keep"])
+    return "converted to %s" % options["depth_format"]
+
+def make_thumbnail(exp_path, relpath, options):
+    """Writes a jpeg of a color image shrunk to "thumbnail_size" on its long side into the experiment's Thumbnails directory."""
+    fname = os.path.join(exp_path, relpath)
+    color_arr = cv2.imread(fname, cv2.IMREAD_REDUCED_COLOR_2) # decoding at half size is faster, thumbnails don't need more
+    if color_arr is None:
+        raise IOError("Could not read %s" % fname)
+
+    thumbnail = encode_thumbnail(color_arr, options["thumbnail_size"], jpeg_quality=options["jpeg_quality"])
+
+    thumbnail_dir = os.path.join(exp_path, "Thumbnails")
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    thumbnail_fname = os.path.join(thumbnail_dir, os.path.splitext(os.path.basename(fname))[0] + ".jpg")
+    with open(thumbnail_fname, "wb") as f:
+        f.write(thumbnail)
+    return "thumbnail written"
+
+def validate_capture(exp_path, relpath, options):
+    """Checks that a color image and the depth file of the same name both load, and that their sizes match."""
+    fname = os.path.join(exp_path, relpath)
+    image_name = os.path.splitext(os.path.basename(fname))[0]
+    depth_fnames = [depth_fname for depth_fname in glob.glob(os.path.join(exp_path, "Depth", glob.escape(image_name) + ".*"))
+                    if os.path.splitext(depth_fname)[1] in {extension for extension, _ in DEPTH_FORMATS.values()}]
+    if not depth_fnames:
+        raise ValueError("%s has no depth file" % image_name)
+
+    color_arr = cv2.imread(fname, cv2.IMREAD_COLOR)
+    if color_arr is None:
+        raise ValueError("Could not read %s" % fname)
+    depth_arr = load_depth(depth_fnames[0])
+    if depth_arr is None:
+        raise ValueError("Could not read %s" % depth_fnames[0])
+    if color_arr.shape[:2] != depth_arr.shape[:2]:
+        raise ValueError("%s is %ix%i but its depth is %ix%i"
+                         % (image_name, color_arr.shape[1], color_arr.shape[0], depth_arr.shape[1], depth_arr.shape[0]))
+    return "valid"
+
+# batch operation -> (lister of the files it processes, processor of a single file), run in this order
+BATCH_OPERATIONS = {
+    "png": (lambda exp_path: list_color(exp_path, (".bmp",)), color_to_png),
+    "webp": (lambda exp_path: list_color(exp_path, (".bmp",)), color_to_webp),
+    "jpeg": (lambda exp_path: list_color(exp_path, (".bmp",)), color_to_jpeg),
+    "depth": (list_txt_depth, convert_depth),
+    "thumbnails": (list_color, make_thumbnail),
+    "validate": (list_color, validate_capture),
+}
+
+
+def init_worker():
+    """Runs in every batch worker before its first task.
+    Each worker processes one image at a time, so opencv's own threads would only compete with the other workers.
+    Ctrl+C is left to the main process, a worker interrupted mid-task would leave the pool hanging."""
+    cv2.setNumThreads(1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def process_chunk(operation, exp_path, relpaths, options):
+    """
+    Batch Worker Task.
+    Runs a batch operation over a chunk of files of an experiment, a file failing doesn't stop the rest.
+
+    Args:
+        operation (str): one of BATCH_OPERATIONS
+        exp_path (str): path to a plotcam experiment
+        relpaths (list): paths of the files relative to the experiment
+        options (dict): the batch options
+
+    Returns:
+        list: (relative path, success, what was done or why it failed) of every file
+    """
+    process = BATCH_OPERATIONS[operation][1]
+    results = []
+    for relpath in relpaths:
+        try:
+            results.append((relpath, True, process(exp_path, relpath, options)))
+        except (OSError, ValueError, cv2.error) as e:
+            results.append((relpath, False, str(e)))
+    return results
+
+def get_progress_path(exp_path):
+    """Returns the path of the file the batch records the files it processed in."""
+    return os.path.join(exp_path, "Metadata", BATCH_PROGRESS_FILENAME)
+
+def load_progress(exp_path):
+    """Loads the files of an experiment processed by previous batches.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        set: (operation, relative path) of the files processed
+    """
+    done = set()
+    progress_path = get_progress_path(exp_path)
+    if os.path.exists(progress_path):
+        with open(progress_path, "r") as f:
+            for line in f:
+                try:
+                    done.add(tuple(json.loads(line)))
+                except ValueError:
+                    pass  # a torn last line, left by an interrupted batch
+    return done
+
+def list_image_names(directory, extensions):
+    """Lists the names of the images in a directory, and the files left over by an interrupted save or set aside by recovery.
+
+    Args:
+        directory (str): the experiment's RGB or Depth directory
+        extensions (tuple): extensions of the images
+
+    Returns:
+        tuple: (set of the image names, sorted list of the leftover file names)
+    """
+    names, leftovers = set(), []
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith((TMP_SUFFIX, CORRUPT_SUFFIX)):
+            leftovers.append(fname)
+            continue
+        image_name, extension = os.path.splitext(fname)
+        if extension.lower() in extensions:
+            names.add(image_name)
+    return names, leftovers
+
+def validate_metadata(exp_path):
+    """Cross-checks the metadata entries of an experiment against its images.
+    Multi-camera captures have the camera's serial number in their image name, single camera ones may not.
+    Only files in the color and depth formats count as images, temporary and corrupt files are reported on their own.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        list: problems found, empty if the metadata and images agree
+    """
+    exp_name = os.path.basename(exp_path)
+    entries = read_entries(os.path.join(exp_path, "Metadata", "%s.json" % exp_name))
+    color_names, color_leftovers = list_image_names(os.path.join(exp_path, "RGB"), COLOR_EXTENSIONS)
+    depth_names, depth_leftovers = list_image_names(os.path.join(exp_path, "Depth"), DEPTH_EXTENSIONS)
+    leftovers = color_leftovers + depth_leftovers
+
+    missing = []
+    recorded = set()
+    for entry in entries:
+        image_name = "%s_%s" % (entry["name"], entry["number"])
+        if "camera_serial" in entry and "%s_%s" % (image_name, entry["camera_serial"]) in color_names | depth_names:
+            image_name = "%s_%s" % (image_name, entry["camera_serial"])
+        recorded.add(image_name)
+        if image_name not in color_names or image_name not in depth_names:
+            missing.append(image_name)
+    orphaned = sorted((color_names | depth_names) - recorded)
+
+    problems = []
+    if missing:
+        problems.append("%i metadata entries without both images: %s" % (len(missing), ", ".join(missing[:VALIDATION_REPORT_MAX])))
+    if orphaned:
+        problems.append("%i images without a metadata entry: %s" % (len(orphaned), ", ".join(orphaned[:VALIDATION_REPORT_MAX])))
+    if leftovers:
+        problems.append("%i files left by an interrupted save or set aside by recovery: %s"
+                        % (len(leftovers), ", ".join(leftovers[:VALIDATION_REPORT_MAX])))
+    return problems
+
+def run_operation(executor, operation, exp_path, options, chunk_size):
+    """Runs a batch operation over the files of an experiment the previous batches didn't process,
+    recording every file processed as its chunk completes so an interrupted batch picks up where it left off.
+
+    Args:
+        executor (concurrent.futures.ProcessPoolExecutor): pool of batch workers
+        operation (str): one of BATCH_OPERATIONS
+        exp_path (str): path to a plotcam experiment
+        options (dict): the batch options
+        chunk_size (int): num of files per worker task
+
+    Returns:
+        int: num of files that failed
+    """
+    list_files = BATCH_OPERATIONS[operation][0]
+    done = set() if options["restart"] else load_progress(exp_path)
+    relpaths = [relpath for relpath in list_files(exp_path) if (operation, relpath) not in done]
+    if not relpaths:
+        print("%s: %s, nothing to do" % (exp_path, operation))
+        return 0
+
+    futures = [executor.submit(process_chunk, operation, exp_path, relpaths[i:i + chunk_size], options)
+               for i in range(0, len(relpaths), chunk_size)]
+
+    nprocessed = nfailed = 0
+    end = "\r" if sys.stdout.isatty() else "\n"
+    with open(get_progress_path(exp_path), "a") as progress:
+        try:
+            for future in as_completed(futures):
+                for relpath, success, message in future.result():
+                    nprocessed += 1
+                    if success:
+                        progress.write(json.dumps([operation, relpath]) + "\n")
+                    else:
+                        nfailed += 1
+                        print("  %s failed: %s" % (relpath, message))
+                progress.flush()
+                print("%s: %s %i/%i" % (exp_path, operation, nprocessed, len(relpaths)), end=end)
+        except KeyboardInterrupt:
+            # the chunks already running finish, the rest are left to the next batch.
+            # a second Ctrl+C would interrupt the pool's shutdown and leave it hanging
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for future in futures:
+                future.cancel()
+            raise
+
+    print("%s: %s done, %i of %i files failed" % (exp_path, operation, nfailed, len(relpaths)))
+    return nfailed
+
+def main(argv=None):
+    """
+    Batch main.
+    Runs the batch operations over every experiment given, spreading the files of each across a pool of worker processes.
+
+    Args:
+        argv (list): command line arguments, defaults to sys.argv
+
+    Returns:
+        int: exit status, 1 if any file failed or an experiment didn't validate
+    """
+    parser = ArgumentParser(
+        prog="python plotcam-lite.py batch",
+        description="Post-processes PlotCamLite experiments headless, with a pool of worker processes. "
+                    "Interrupted batches resume where they left off.")
+
+    parser.add_argument(
+        'experiments',
+        nargs='*',
+        default=[PCL_EXP_PATH],
+        help="paths to experiments, or directories of experiments, defaults to %s" % PCL_EXP_PATH,
+    )
+
+    parser.add_argument(
+        '-o', '--operations',
+        dest="operations",
+        nargs='+',
+        default=["validate"],
+        choices=list(BATCH_OPERATIONS),
+        help="operations to run, in the order %s, defaults to validate" % ", ".join(BATCH_OPERATIONS),
+    )
+
+    parser.add_argument(
+        '-f', '--depth-format',
+        dest="depth_format",
+        type=str,
+        default=DEFAULT_DEPTH_FORMAT,
+        choices=[fmt for fmt in DEPTH_FORMATS if fmt != "txt"],
+        help="depth format the depth operation converts txt depth files to, defaults to %s" % DEFAULT_DEPTH_FORMAT,
+    )
+
+    parser.add_argument(
+        '--png-compression',
+        dest="png_compression",
+        type=int,
+        default=PNG_COMPRESSION,
+        choices=range(10),
+        metavar="0-9",
+        help="zlib level the png operation compresses with, defaults to %i" % PNG_COMPRESSION,
+    )
+
+    parser.add_argument(
+        '--keep',
+        dest="keep",
+        action='store_true',
+        help="keep the original files of the conversions",
+    )
+
+    parser.add_argument(
+        '--restart',
+        dest="restart",
+        action='store_true',
+        help="process every file again, not just the ones previous batches didn't",
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        dest="jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="num of worker processes, defaults to the num of cpus",
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        dest="chunk_size",
+        type=int,
+        default=BATCH_CHUNK_SIZE,
+        help="num of files a worker processes per task, defaults to %i" % BATCH_CHUNK_SIZE,
+    )
+
+    args = parser.parse_args(argv)
+    if args.jobs < 1 or args.chunk_size < 1:
+        parser.error("--jobs and --chunk-size must be at least 1")
+
+    experiments = find_experiments(args.experiments)
+    if not experiments:
+        parser.error("no experiments found in %s" % ", ".join(args.experiments))
+
+    options = {
+        "depth_format": args.depth_format,
+        "keep": args.keep,
+        "restart": args.restart,
+        "png_compression": args.png_compression,
+        "jpeg_quality": JPEG_QUALITY,
+        "thumbnail_size": THUMBNAIL_SIZE,
+    }
+    operations = [operation for operation in BATCH_OPERATIONS if operation in args.operations]
+
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker) as executor:
+            for exp_path in experiments:
+                os.makedirs(os.path.join(exp_path, "Metadata"), exist_ok=True)
+                for operation in operations:
+                    nfailed = run_operation(executor, operation, exp_path, options, args.chunk_size)
+                    failed += nfailed
+
+                    # an experiment still capturing txt depth captures in the format it was converted to from now on
+                    if operation == "depth" and not nfailed:
+                        settings = load_experiment_settings(exp_path)
+                        if settings["depth_format"] == "txt":
+                            settings["depth_format"] = args.depth_format
+                            save_experiment_settings(exp_path, settings)
+
+                if "validate" in operations:
+                    problems = validate_metadata(exp_path)
+                    for problem in problems:
+                        print("  %s" % problem)
+                    failed += len(problems)
+    except KeyboardInterrupt:
+        print("\nInterrupted, run the batch again to pick up where it left off")
+        return 130
+
+    return 1 if failed else 0
@@ -0,0 +1,322 @@
+"""
+This code handles the camera sources the stream can be fed from
+"""
+import glob
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from util import FRAME_ROTATION, REPLAY_MAX_FRAMES
+from .depth_processing import CameraCalibration, Intrinsics, pinhole_calibration
+
+# a frame of a camera source, in the camera's orientation.
+# color is a bgr8 (height, width, 3) array and depth a z16 (height, width) array, both only valid until the next read.
+# timestamp is the sensor timestamp in ms, in the same time base as time.time()
+CameraFrame = namedtuple("CameraFrame", ["color", "depth", "frame_number", "timestamp"])
+
+
+class CameraSource:
+    """
+    Base class of the camera sources.
+    A source is created in the GUI process and handed to the camera process, so it must not hold on to any device
+    until it is started.
+    """
+
+    def __init__(self, width, height, fps):
+        """Constructor for CameraSource.
+
+        Args:
+            width (int): width of the frames, in the camera's orientation
+            height (int): height of the frames, in the camera's orientation
+            fps (int): frames per second
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def configure(self, width, height, fps):
+        """Changes the settings of the source, they take effect the next time it is started.
+
+        Args:
+            width (int): width of the frames, in the camera's orientation
+            height (int): height of the frames, in the camera's orientation
+            fps (int): frames per second
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def is_available(self):
+        """Returns true if the source can be started."""
+        return True
+
+    def start(self):
+        """Starts streaming."""
+
+    def calibration(self):
+        """Returns the calibration of the started source, to align its depth to its color.
+        Sources without a sensor have their depth and color aligned pixel for pixel.
+
+        Returns:
+            depth_processing.CameraCalibration: intrinsics of both streams and the extrinsics between them
+        """
+        return pinhole_calibration(self.width, self.height)
+
+    def read(self):
+        """Blocks until the next frame arrives.
+
+        Returns:
+            CameraFrame: the next frame, None if the source had no complete frame
+        """
+        raise NotImplementedError
+
+    def stop(self):
+        """Stops streaming."""
+
+
+class RealSenseSource(CameraSource):
+    """
+    Intel RealSense depth camera, or a RealSense .bag recording played back in real time.
+    """
+
+    def __init__(self, width, height, fps, bag_path=None, serial=None):
+        """Constructor for RealSenseSource.
+
+        Args:
+            width (int): width of the frames
+            height (int): height of the frames
+            fps (int): frames per second
+            bag_path (str): path to a .bag recording to play instead of the connected camera
+            serial (str): serial number of the camera to stream, defaults to the first one connected
+        """
+        super().__init__(width, height, fps)
+        self.bag_path = bag_path
+        self.serial = serial
+        self.pipeline = None
+
+    def is_available(self):
+        if self.bag_path:
+            return os.path.exists(self.bag_path)
+
+        # import in the camera process to avoid runtime COM error
+        import pyrealsense2 as rs
+        devices = rs.context().devices
+        if self.serial:
+            return any(d.get_info(rs.camera_info.serial_number) == self.serial for d in devices)
+        return len(devices) > 0 # only start stream if camera connected
+
+    def start(self):
+        import pyrealsense2 as rs
+
+        # configure realsense pipeline and start recording
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        if self.bag_path:
+            config.enable_device_from_file(self.bag_path, repeat_playback=True)
+        elif self.serial:
+            config.enable_device(self.serial)
+        config.enable_stream(rs.stream.color, self.width, self.height, rs.format.bgr8, self.fps)
+        config.enable_stream(rs.stream.depth, self.width, self.height, rs.format.z16, self.fps)
+        self.pipeline.start(config)
+
+    def calibration(self):
+        import pyrealsense2 as rs
+
+        profile = self.pipeline.get_active_profile()
+        depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        depth_intrinsics = depth_profile.get_intrinsics()
+        color_intrinsics = color_profile.get_intrinsics()
+        extrinsics = depth_profile.get_extrinsics_to(color_profile)
+        return CameraCalibration(
+            Intrinsics(depth_intrinsics.width, depth_intrinsics.height, depth_intrinsics.fx, depth_intrinsics.fy,
+                       depth_intrinsics.ppx, depth_intrinsics.ppy),
+            Intrinsics(color_intrinsics.width, color_intrinsics.height, color_intrinsics.fx, color_intrinsics.fy,
+                       color_intrinsics.ppx, color_intrinsics.ppy),
+            np.reshape(extrinsics.rotation, (3, 3)).T, # the sdk's rotation is column major
+            np.array(extrinsics.translation),
+            profile.get_device().first_depth_sensor().get_depth_scale(),
+        )
+
+    def read(self):
+        # grab frames from the camera
+        frames = self.pipeline.wait_for_frames()
+        color_frame = frames.get_color_frame()
+        depth_frame = frames.get_depth_frame()
+        if not color_frame or not depth_frame:
+            return None
+
+        return CameraFrame(
+            np.asanyarray(color_frame.get_data()),
+            np.asanyarray(depth_frame.get_data()),
+            color_frame.get_frame_number(),
+            frames.get_timestamp(),
+        )
+
+    def stop(self):
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
+
+
+class PacedSource(CameraSource):
+    """
+    Base class of the sources without a sensor, hands out frames at the configured frame rate.
+    """
+
+    def start(self):
+        self.frame_number = 0
+        self.next_frame_time = time.time()
+
+    def wait_for_next_frame(self):
+        """Sleeps until the next frame is due, like the sensor exposing it.
+
+        Returns:
+            float: timestamp of the frame in ms
+        """
+        delay = self.next_frame_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # running late, don't try to catch up
+            self.next_frame_time = time.time()
+
+        timestamp = self.next_frame_time * 1000.0
+        self.next_frame_time += 1.0 / self.fps
+        self.frame_number += 1
+        return timestamp
+
+
+class SyntheticSource(PacedSource):
+    """
+    Synthetic scene, rows of plants over level ground scrolling sideways. Needs no hardware.
+    The scene is rendered once on start, every frame is a view into it so frames cost nothing to produce.
+    """
+
+    SCROLL_PX = 4  # how far the scene moves per frame
+
+    def start(self):
+        super().start()
+        period = self.width  # the scene repeats after this many pixels
+        rows, cols = np.mgrid[0:self.height, 0:self.width + period].astype(np.float32)
+
+        # plants are bumps on a sinusoidal grid, the ground is 1.5 m away and the canopy reaches 0.5 m up
+        canopy = np.clip(np.sin(cols * (2 * np.pi / 160)) * np.sin(rows * (2 * np.pi / 120)), 0, None)
+        depth = 1500 - 500 * canopy
+        depth[(rows.astype(np.int32) * 7 + cols.astype(np.int32) * 13) % 97 == 0] = 0 # sprinkle invalid pixels
+        self.scene_depth = depth.astype(np.uint16)
+
+        # green plants on brown soil, with some texture so the frames aren't flat
+        texture = (np.sin(cols * 0.9) * np.sin(rows * 0.7) * 20).astype(np.float32)
+        color = np.empty((self.height, self.width + period, 3), dtype=np.float32)
+        color[..., 0] = 40 + 20 * canopy + texture # b
+        color[..., 1] = 70 + 150 * canopy + texture # g
+        color[..., 2] = 110 - 60 * canopy + texture # r
+        self.scene_color = np.clip(color, 0, 255).astype(np.uint8)
+        self.period = period
+
+    def read(self):
+        timestamp = self.wait_for_next_frame()
+        offset = (self.frame_number * self.SCROLL_PX) % self.period
+        return CameraFrame(
+            self.scene_color[:, offset:offset + self.width],
+            self.scene_depth[:, offset:offset + self.width],
+            self.frame_number,
+            timestamp,
+        )
+
+    def stop(self):
+        self.scene_color = None
+        self.scene_depth = None
+
+
+class ReplaySource(PacedSource):
+    """
+    Replays the captures of an experiment directory (RGB/ and Depth/) on a loop.
+    The captures are loaded into memory on start so the replay never waits on the disk, and rotated back to the camera's orientation.
+    """
+
+    def __init__(self, width, height, fps, exp_path):
+        """Constructor for ReplaySource.
+
+        Args:
+            width (int): width of the frames
+            height (int): height of the frames
+            fps (int): frames per second
+            exp_path (str): path to the experiment to replay
+        """
+        super().__init__(width, height, fps)
+        self.exp_path = exp_path
+
+    def list_captures(self):
+        """Returns (color path, depth path) pairs of the captures of the experiment that have both images."""
+        depth_fnames = {os.path.splitext(os.path.basename(fname))[0]: fname
+                        for fname in glob.glob(os.path.join(self.exp_path, "Depth", "*"))}
+        captures = []
+        for color_fname in sorted(glob.glob(os.path.join(self.exp_path, "RGB", "*"))):
+            image_name = os.path.splitext(os.path.basename(color_fname))[0]
+            if image_name in depth_fnames:
+                captures.append((color_fname, depth_fnames[image_name]))
+        return captures[:REPLAY_MAX_FRAMES]
+
+    def is_available(self):
+        return len(self.list_captures()) > 0
+
+    def start(self):
+        import cv2
+        from .image_writers import load_depth
+
+        super().start()
+        self.colors = []
+        self.depths = []
+        for color_fname, depth_fname in self.list_captures():
+            # captures are saved rotated, turn them back
+            color = np.rot90(cv2.imread(color_fname, cv2.IMREAD_COLOR), -FRAME_ROTATION // 90)
+            depth = np.rot90(load_depth(depth_fname), -FRAME_ROTATION // 90)
+            if color.shape[:2] != (self.height, self.width):
+                color = cv2.resize(color, (self.width, self.height), interpolation=cv2.INTER_AREA)
+                depth = cv2.resize(depth, (self.width, self.height), interpolation=cv2.INTER_NEAREST)
+            self.colors.append(np.ascontiguousarray(color))
+            self.depths.append(np.ascontiguousarray(depth))
+
+    def read(self):
+        timestamp = self.wait_for_next_frame()
+        ix = self.frame_number % len(self.colors)
+        return CameraFrame(self.colors[ix], self.depths[ix], self.frame_number, timestamp)
+
+    def stop(self):
+        self.colors = []
+        self.depths = []
+
+
+# camera option -> source class
+CAMERA_SOURCES = {
+    "realsense": RealSenseSource,
+    "sim": SyntheticSource,
+    "replay": ReplaySource,
+}
+
+
+def open_camera_source(camera, width, height, fps, replay_path=None, serial=None):
+    """Creates the camera source for the camera option.
+
+    Args:
+        camera (str): one of CAMERA_SOURCES
+        width (int): width of the frames, in the camera's orientation
+        height (int): height of the frames, in the camera's orientation
+        fps (int): frames per second
+        replay_path (str): experiment directory or .bag recording to replay, only used by replay
+        serial (str): serial number of the RealSense camera to stream, only used by realsense
+
+    Returns:
+        CameraSource: the unstarted source
+    """
+    if camera == "replay":
+        if replay_path and replay_path.endswith(".bag"):
+            return RealSenseSource(width, height, fps, bag_path=replay_path)
+        return ReplaySource(width, height, fps, replay_path)
+    if camera == "sim":
+        return SyntheticSource(width, height, fps)
+    return RealSenseSource(width, height, fps, serial=serial)
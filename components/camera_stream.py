@@ -0,0 +1,143 @@
+"""
+This code handles the camera processes the GUI streams from
+"""
+import logging
+import multiprocessing
+import queue
+from multiprocessing import Process
+
+import numpy as np
+
+from util import DEFAULT_DURABILITY, DEPTH_OVERLAY_DECIMATION, STREAM_STOP_TIMEOUT_SEC, TELEMETRY_QUEUE_SIZE
+from .depth_camera_feed import generate_frames
+from .frame_ring import FrameRing
+
+log = logging.getLogger("pcl_camerastream")
+
+
+class CameraStream:
+    """
+    A camera process streaming one camera source into its own frame ring in shared memory,
+    along with a ring of decimated depth frames for the depth overlay.
+    Every camera process runs its own save workers, so the captures of several cameras are saved in parallel.
+    """
+
+    def __init__(self, camera_source, ring_shape, save_status_queue, level_reading, history_size, serial=None,
+                 durability=DEFAULT_DURABILITY):
+        """Constructor for CameraStream, allocates the frame rings.
+
+        Args:
+            camera_source (camera_sources.CameraSource): unstarted source of the frames
+            ring_shape (tuple): dimensions of the frame ring, (number of slots, largest frame height, largest frame width, channels)
+            save_status_queue (multiprocessing.Queue): queue the save workers report on, can be shared by several streams
+            level_reading (multiprocessing.Array): shared x, y accelerometer reading the camera process tags frames with
+            history_size (int): number of frames the camera process keeps to pick captures from
+            serial (str): serial number of the camera, None for the default camera
+            durability (str): when the save workers sync the captures to disk, one of durable_writes.DURABILITY_POLICIES
+        """
+        self.serial = serial
+        self.frame_ring = FrameRing(ring_shape[0], ring_shape[1:])
+        # the decimated depth frames are every DEPTH_OVERLAY_DECIMATION-th pixel of the largest frames
+        depth_ring_shape = (ring_shape[0], -(-ring_shape[1] // DEPTH_OVERLAY_DECIMATION), -(-ring_shape[2] // DEPTH_OVERLAY_DECIMATION))
+        self.depth_ring = FrameRing(depth_ring_shape[0], depth_ring_shape[1:], dtype=np.uint16)
+        self.is_streaming = multiprocessing.Value('i', False)
+        self.telemetry_queue = multiprocessing.Queue(maxsize=TELEMETRY_QUEUE_SIZE)  # the camera process's telemetry snapshots
+
+        read_pipe, self.capture_pipe = multiprocessing.Pipe()
+        self.control_pipe, control_pipe = multiprocessing.Pipe()
+        self.process = Process(
+            target=generate_frames,
+            args=(
+                self.frame_ring.name,
+                ring_shape,
+                self.depth_ring.name,
+                depth_ring_shape,
+                camera_source,
+                save_status_queue,
+                read_pipe,
+                control_pipe,
+                self.is_streaming,
+                level_reading,
+                history_size,
+                durability,
+                self.telemetry_queue,
+            ),
+        )
+
+    @property
+    def name(self):
+        """Serial number of the camera, or "default"."""
+        return self.serial or "default"
+
+    def start(self):
+        """Spawns the camera process."""
+        self.process.start()
+        log.info("Created depth camera process for camera %s, pId = %i" % (self.name, self.process.pid))
+
+    def request_capture(self, request):
+        """Posts a capture request to the camera process.
+
+        Args:
+            request (tuple): (request id, trigger time, selection, window ms, experiment path, image name,
+                color format, png compression level, depth format, depth processing stages)
+        """
+        self.capture_pipe.send(request)
+
+    def telemetry(self):
+        """Takes the telemetry snapshots the camera process sent since the last call, labelled with the camera.
+
+        Returns:
+            list: telemetry.Telemetry snapshots, oldest first
+        """
+        snapshots = []
+        while True:
+            try:
+                snapshot = self.telemetry_queue.get_nowait()
+            except queue.Empty:
+                return snapshots
+            snapshot["process"] = "camera %s" % self.name
+            snapshots.append(snapshot)
+
+    def configure(self, width, height, fps):
+        """Asks the camera process to restart its camera with new settings, without waiting for it.
+
+        Args:
+            width (int): width of the frames, in the camera's orientation
+            height (int): height of the frames, in the camera's orientation
+            fps (int): frames per second
+        """
+        self.control_pipe.send(("configure", width, height, fps))
+
+    def wait_configured(self, timeout):
+        """Waits for the camera process to stream again after configure.
+
+        Args:
+            timeout (float): how long to wait for the camera process in seconds
+
+        Returns:
+            tuple: (configured, width, height, fps) the camera streams at, None if the camera process didn't answer
+        """
+        if not self.control_pipe.poll(timeout):
+            return None
+        return self.control_pipe.recv()[1:]
+
+    def stop(self):
+        """Tells the camera process to stop, it may still be waiting for a camera."""
+        self.is_streaming.value = False
+        self.control_pipe.send(("stop",))
+
+    def join(self):
+        """Waits for the camera process to stop, once its save workers finished the queued saves.
+        A process still running after STREAM_STOP_TIMEOUT_SEC is stuck, it is killed so the GUI can close.
+        """
+        self.process.join(STREAM_STOP_TIMEOUT_SEC)
+        if self.process.is_alive():
+            log.warning("Camera process for camera %s did not stop in %i s, killing it" % (self.name, STREAM_STOP_TIMEOUT_SEC))
+            self.process.terminate()
+            self.process.join()
+
+    def close(self):
+        """Frees the frame rings, once the camera process stopped."""
+        for ring in (self.frame_ring, self.depth_ring):
+            ring.close()
+            ring.unlink()
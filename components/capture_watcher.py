@@ -0,0 +1,54 @@
+"""
+This code handles the capture completion watcher
+"""
+import queue
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from util import SAVE_STATUS_POLL_SEC
+
+
+class CaptureWatcher(QThread):
+    """Background thread that waits on the save workers' status queue, and lets the GUI know whenever a capture request is done.
+
+    Args:
+        QThread (QThread): Base class of Qt threads.
+    """
+
+    captureCompleted = pyqtSignal(int, str, bool, dict)  # request id, image name, saved, frame info
+
+    def __init__(self, save_status_queue):
+        """Constructor for the CaptureWatcher.
+
+        Args:
+            save_status_queue (multiprocessing.Queue): queue the save workers report (request id, image name, success, frame info) on
+        """
+        super().__init__()
+        self.save_status_queue = save_status_queue
+
+    def run(self):
+        """Forwards every status report as a captureCompleted signal until interrupted."""
+        while not self.isInterruptionRequested():
+            try:
+                request_id, img_name, saved, frame_info = self.save_status_queue.get(timeout=SAVE_STATUS_POLL_SEC)
+            except queue.Empty:
+                continue
+            self.captureCompleted.emit(request_id, img_name, saved, frame_info)
+
+    def stop(self):
+        """Stops the thread and waits for it to finish."""
+        self.requestInterruption()
+        self.wait()
+
+    def drain(self):
+        """Returns the status reports still on the queue, call once the thread is stopped.
+
+        Returns:
+            list: (request id, image name, success, frame info) tuples
+        """
+        statuses = []
+        while True:
+            try:
+                statuses.append(self.save_status_queue.get_nowait())
+            except queue.Empty:
+                return statuses
@@ -5,122 +5,440 @@ This code handles the stream functions
 """
 
 import os
-from multiprocessing import Pool, shared_memory, Queue
+import queue
+import time
+from multiprocessing import Process, Queue
 import numpy as np
-from PIL import Image
-import cv2
 
-def generate_frames(shared_mem_name, buffer_shape, width, height, fps, frame_in_use, pending_frame, gui_communication_pipe, is_streaming):
+from util import (CAMERA_DISCOVERY_PERIOD_SEC, CAPTURE_CLOCK_TOLERANCE_MS, DEFAULT_DURABILITY, DEPTH_OVERLAY_CPU_BUDGET, DEPTH_OVERLAY_DECIMATION,
+                  DEPTH_OVERLAY_MAX_HZ, FRAME_ROTATION, IMG_SAVE_REQ_Q_SIZE, INDEX_THUMBNAIL_SIZE, LEGACY_COLOR_FORMAT,
+                  LEGACY_DEPTH_FORMAT, LEVEL_TOLERANCE, NWORKERS, PNG_COMPRESSION, PREVIEW_SIZE, SAVE_WORKER_NICENESS,
+                  TELEMETRY_PERIOD_SEC, TEMPORAL_FILTER_FRAMES)
+from .depth_processing import process_depth
+from .durable_writes import DurableWriter
+from .frame_history import FrameHistory
+from .frame_metrics import depth_stats, sharpness
+from .frame_ring import FrameRing
+from .frame_transform import FrameOrienter
+from .image_writers import encode_thumbnail, save_color, save_depth
+from .telemetry import Telemetry
+
+def generate_frames(shared_mem_name, buffer_shape, depth_shared_mem_name, depth_buffer_shape, camera_source, save_status_queue,
+                    gui_communication_pipe, control_pipe, is_streaming, level_reading, history_size, durability=DEFAULT_DURABILITY,
+                    telemetry_queue=None):
     """
     Depth Camera Video Feed Process.
-    Configures RealSense Depth Camera for stream in an isolated process.
-    Updates the shared memory with most recent frame whenever one arrives.
-    Facilitates saving of frames upon request using a multiproc Pool.
+    Starts the camera source, a RealSense Depth Camera or a simulated one, in an isolated process.
+    Publishes every frame to the shared memory frame ring as soon as it arrives, without waiting on the GUI.
+    Facilitates saving of frames upon request using a pool of save worker processes,
+    the camera loop only copies the frame arrays onto a bounded save queue.
+    Every frame is scored for sharpness and kept in a history of the last frames along with the level reading,
+    capture requests pick the frame to save from the history, either the one closest to when they were triggered
+    or the sharpest level one within a window before the trigger.
+    The depth of the captured frames is post-processed and the color encoded by the save workers, so the stream never waits on them.
+    The save workers write every file through a temporary file and sync them to disk according to the durability policy.
+    The time spent waiting for frames and publishing them and the depth of the save queue are collected as telemetry,
+    and sent to the GUI every TELEMETRY_PERIOD_SEC.
+    A decimated depth frame and its stats are published to a second ring for the live overlay, at a capped rate
+    that drops further if computing them would take more than DEPTH_OVERLAY_CPU_BUDGET of the camera loop.
+    The stream settings are changed over the control pipe, only the camera source is restarted with them,
+    the frame ring is sized for the largest frames and is kept.
+    If there is no camera connected, the process keeps looking for one until it is told to stop.
 
     Args:
-        shared_mem_name (string): name of shared memory block
-        buffer_shape (tuple): dimensions of the array backed by the shared memory
-        width (string): width of the stream
-        height (tuple): height of the stream
-        fps (int): frames per seconds
-        frame_in_use (multiprocessing.Value): shared boolean variable, pseudo mutex 
-        pending_frame(multiprocessing.Value): shared boolean variable, true if a frame needs saving
+        shared_mem_name (string): name of the frame ring's shared memory block
+        buffer_shape (tuple): dimensions of the frame ring, (number of slots, largest frame height, largest frame width, channels)
+        depth_shared_mem_name (string): name of the depth overlay ring's shared memory block
+        depth_buffer_shape (tuple): dimensions of the depth overlay ring, (number of slots, largest decimated height, largest decimated width)
+        camera_source (camera_sources.CameraSource): unstarted source of the frames
+        save_status_queue (multiprocessing.Queue): queue the save workers report (request id, image name, success, frame info) on once a request is done
         gui_communication_pipe (multiprocessing.Connection): read pipe that holds information on saving frames
+        control_pipe (multiprocessing.Connection): duplex pipe the GUI sends ("configure", width, height, fps) messages on,
+            each is answered with ("configured", success, width, height, fps) once the source streams again,
+            and ("stop",) to stop waiting for a camera
         is_streaming (multiprocessing.Value): shared boolean variable signifies when to end the stream
+        level_reading (multiprocessing.Array): shared x, y accelerometer reading, kept up to date by the GUI
+        history_size (int): number of frames kept in the history
+        durability (str): when the save workers sync the captures to disk, one of durable_writes.DURABILITY_POLICIES
+        telemetry_queue (multiprocessing.Queue): queue the telemetry snapshots are sent to the GUI on, None to keep none
     """
-    # import in seperate process to avoid runtime COM error
-    import pyrealsense2 as rs
-    
+    # attach to the frame ring in shared memory
+    frame_ring = FrameRing(buffer_shape[0], buffer_shape[1:], name=shared_mem_name)
+    depth_ring = FrameRing(depth_buffer_shape[0], depth_buffer_shape[1:], dtype=np.uint16, name=depth_shared_mem_name)
+
+    # start the save workers, they crunch through the bounded save queue
+    save_queue = Queue(maxsize=IMG_SAVE_REQ_Q_SIZE)
+    save_workers = [Process(target=save_worker, args=(save_queue, save_status_queue, durability)) for _ in range(NWORKERS)]
+    for worker in save_workers:
+        worker.start()
+
+    capture_requests = []  # requests waiting on a frame exposed after their trigger
+    frame_history = None
+    calibration = None
+
+    telemetry = Telemetry("camera")
+    if telemetry_queue is not None:
+        telemetry_queue.cancel_join_thread()  # exiting doesn't wait for the GUI to take the last snapshots
+
+    try:
+        if wait_for_camera(camera_source, control_pipe): # only start stream if camera connected
+
+            camera_source.start()
+            print("started %s" % type(camera_source).__name__)
+
+            try:
+                frame_history = allocate_frame_history(history_size, camera_source, buffer_shape[3])
+                calibration = camera_source.calibration()
+                next_overlay_time = 0.0
+                next_telemetry_time = time.perf_counter() + TELEMETRY_PERIOD_SEC
+
+                # camera feed loop
+                is_streaming.value = True
+                while is_streaming.value:
+
+                    # apply new stream settings, the requests waiting on a frame get one at the new settings
+                    if control_pipe.poll():
+                        message = control_pipe.recv()
+                        if message[0] == "configure":
+                            configured = configure_source(camera_source, frame_ring, *message[1:])
+                            if configured:
+                                frame_history = None # free the old history first
+                                frame_history = allocate_frame_history(history_size, camera_source, buffer_shape[3])
+                            calibration = camera_source.calibration()
+                            control_pipe.send(("configured", configured, camera_source.width, camera_source.height, camera_source.fps))
+
+                    # grab frames from the camera
+                    read_start = time.perf_counter()
+                    frame = camera_source.read()
+                    if frame is None:
+                        continue
+                    telemetry.observe("wait_for_frames", (time.perf_counter() - read_start) * 1000.0)
+                    telemetry.count("frames")
+
+                    # take in save frame requests, they are left in the pipe while the save queue is full (back-pressure),
+                    # the stream keeps going.
+                    if not save_queue.full() and gui_communication_pipe.poll():
+                        capture_requests.append(gui_communication_pipe.recv())
+
+                    frame_sharpness = sharpness(frame.color)
+                    frame_history.push(frame.color, frame.depth, frame.frame_number, frame.timestamp, frame_sharpness, level_reading[:])
+
+                    # hand the requests their frame from the history to the workers
+                    if capture_requests:
+                        capture_requests = queue_captures(capture_requests, frame_history, save_queue, calibration)
+
+                    # put the frame in the next slot of the ring, the gui rotates it when painting
+                    publish_start = time.perf_counter()
+                    frame_ring.publish(frame.color, timestamp=frame.timestamp, sharpness=frame_sharpness)
+                    now = time.perf_counter()
+                    telemetry.observe("shm_publish", (now - publish_start) * 1000.0)
+
+                    if now >= next_overlay_time:
+                        next_overlay_time = publish_depth_overlay(depth_ring, frame, calibration.depth_scale)
+                        telemetry.observe("depth_overlay", (time.perf_counter() - now) * 1000.0)
+
+                    if now >= next_telemetry_time:
+                        next_telemetry_time = now + TELEMETRY_PERIOD_SEC
+                        send_telemetry(telemetry, telemetry_queue, save_queue, len(capture_requests))
+            finally:
+                camera_source.stop()
+    finally:
+        # clean up even if the camera failed, the process can't exit until the workers are stopped
+        is_streaming.value = False
+
+        # save the requests still in the pipe or waiting on a frame with the newest frame rather than dropping them,
+        # those without any frame are reported failed so the GUI tells the operator
+        while gui_communication_pipe.poll():
+            capture_requests.append(gui_communication_pipe.recv())
+        if capture_requests and frame_history is not None:
+            try:
+                capture_requests = queue_captures(capture_requests, frame_history, save_queue, calibration, flush=True)
+            except Exception as e:
+                print("Could not save the captures requested as the stream stopped: %s" % e)
+        for request in capture_requests:
+            save_status_queue.put((request[0], request[5], False, {"save_error": "the stream stopped before a frame was captured"}))
+
+        # let the workers finish the queued saves, then stop them
+        for _ in save_workers:
+            save_queue.put(None)
+        for worker in save_workers:
+            worker.join()
 
-    # prepare shared memory to be used as a frame buffer
-    existing_shm = shared_memory.SharedMemory(name=shared_mem_name)
-    frame_buf = np.ndarray(buffer_shape, dtype=np.uint8, buffer=existing_shm.buf)
-    if len(rs.context().devices) > 0: # only start stream if camera connected
-        
-        # configure realsense pipeline and start recording
-        pipeline = rs.pipeline()
-        config = rs.config()
-        config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
-        config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
-        pipeline.start(config)
-        print("started pipeline")
-
-        # camera feed loop
-        fIx = 0
-        prev_frames = None
-        is_streaming.value = True
-        while is_streaming.value:
-
-            # grab frames from the camera
-            frames = pipeline.wait_for_frames()
-            color_frame = frames.get_color_frame()
-            depth_frame = frames.get_depth_frame()
-            if not color_frame and not depth_frame:
+        gui_communication_pipe.close()
+        control_pipe.close()
+
+        # detach from shared memory, the gui frees it
+        frame_ring.close()
+        depth_ring.close()
+
+def send_telemetry(telemetry, telemetry_queue, save_queue, nwaiting):
+    """Samples the save queue and sends the period's telemetry to the GUI, dropping it if the GUI fell behind.
+
+    Args:
+        telemetry (telemetry.Telemetry): the camera process's telemetry, a new period is started
+        telemetry_queue (multiprocessing.Queue): queue to the GUI, None to just start a new period
+        save_queue (multiprocessing.Queue): queue of the save requests
+        nwaiting (int): num of capture requests waiting on a frame
+    """
+    try:
+        telemetry.gauge("save_queue", save_queue.qsize())
+    except NotImplementedError:
+        pass  # macOS has no sem_getvalue
+    telemetry.gauge("captures_waiting", nwaiting)
+
+    snapshot = telemetry.snapshot()
+    if telemetry_queue is not None:
+        try:
+            telemetry_queue.put_nowait(snapshot)
+        except queue.Full:
+            pass
+
+def wait_for_camera(camera_source, control_pipe):
+    """Waits for the camera source to become available, checking every CAMERA_DISCOVERY_PERIOD_SEC.
+    Settings sent over the control pipe meanwhile are applied to the source, they take effect once it starts.
+
+    Args:
+        camera_source (camera_sources.CameraSource): unstarted source of the frames
+        control_pipe (multiprocessing.Connection): duplex pipe the GUI sends control messages on
+
+    Returns:
+        bool: true if the source is available, false if the GUI stopped the stream first
+    """
+    if camera_source.is_available():
+        return True
+
+    print("There is no camera connected, waiting for one")
+    while True:
+        if control_pipe.poll(CAMERA_DISCOVERY_PERIOD_SEC):
+            message = control_pipe.recv()
+            if message[0] == "stop":
+                return False
+            if message[0] == "configure":
+                camera_source.configure(*message[1:])
+                control_pipe.send(("configured", True, camera_source.width, camera_source.height, camera_source.fps))
+
+        if camera_source.is_available():
+            print("Found a camera")
+            return True
+
+def allocate_frame_history(history_size, camera_source, nchannels):
+    """Allocates the frame history for the frames of a camera source, its size is fixed by the number of frames and the resolution.
+
+    Args:
+        history_size (int): number of frames kept in the history
+        camera_source (camera_sources.CameraSource): the started source
+        nchannels (int): number of channels of the color frames
+
+    Returns:
+        frame_history.FrameHistory: the empty history
+    """
+    frame_history = FrameHistory(history_size, (camera_source.height, camera_source.width, nchannels),
+                                 (camera_source.height, camera_source.width))
+    print("frame history of %i frames, %.1f MB" % (history_size, frame_history.nbytes / 2**20))
+    return frame_history
+
+def configure_source(camera_source, frame_ring, width, height, fps):
+    """Restarts the camera source with new settings, it is restarted with its old settings if it fails to start with the new ones.
+
+    Args:
+        camera_source (camera_sources.CameraSource): the started source
+        frame_ring (frame_ring.FrameRing): ring the frames are published to, the new frames must fit in it
+        width (int): width of the frames, in the camera's orientation
+        height (int): height of the frames, in the camera's orientation
+        fps (int): frames per second
+
+    Returns:
+        bool: true if the source streams with the new settings
+    """
+    if height * width * frame_ring.frame_shape[2] > frame_ring.frame_size:
+        print("%ix%i frames don't fit in the frame ring" % (width, height))
+        return False
+
+    old_settings = (camera_source.width, camera_source.height, camera_source.fps)
+    camera_source.stop()
+    camera_source.configure(width, height, fps)
+    try:
+        camera_source.start()
+    except Exception as e:
+        print("Could not start %s at %ix%i %i fps: %s" % (type(camera_source).__name__, width, height, fps, e))
+        camera_source.configure(*old_settings)
+        camera_source.start()
+        return False
+
+    print("restarted %s at %ix%i %i fps" % (type(camera_source).__name__, width, height, fps))
+    return True
+
+def publish_depth_overlay(depth_ring, frame, depth_scale):
+    """Publishes every DEPTH_OVERLAY_DECIMATION-th depth pixel of a frame and its stats to the depth overlay ring.
+    The overlay is due again after 1 / DEPTH_OVERLAY_MAX_HZ, or later if this one took more than DEPTH_OVERLAY_CPU_BUDGET of that,
+    so a slow machine updates the overlay less often instead of streaming fewer frames.
+
+    Args:
+        depth_ring (frame_ring.FrameRing): ring of decimated z16 depth frames
+        frame (camera_sources.CameraFrame): the newest frame
+        depth_scale (float): m per depth unit
+
+    Returns:
+        float: time.perf_counter() time the next overlay is due
+    """
+    start = time.perf_counter()
+    # subsampling rather than decimate's block median, the stats don't need it and the strided view costs nothing
+    decimated = frame.depth[::DEPTH_OVERLAY_DECIMATION, ::DEPTH_OVERLAY_DECIMATION]
+    depth_ring.publish(decimated, timestamp=frame.timestamp, **depth_stats(decimated, depth_scale))
+    elapsed = time.perf_counter() - start
+    return start + max(1.0 / DEPTH_OVERLAY_MAX_HZ, elapsed / DEPTH_OVERLAY_CPU_BUDGET)
+
+def queue_captures(capture_requests, frame_history, save_queue, calibration=None, flush=False):
+    """Picks the frames of the capture requests from the frame history, and queues them for the save workers.
+    A "closest" request takes the frame stamped closest to its trigger, it waits for the first frame after the trigger
+    to arrive since that one may be closer than the newest.
+    A "sharpest" request takes the sharpest frame stamped within its window before the trigger that was level,
+    or the closest one if there is none. The window can't reach further back than the history.
+    Frame timestamps are compared give or take CAPTURE_CLOCK_TOLERANCE_MS for the skew between the sensor and host clocks.
+    Requests whose depth is temporally filtered also get the depth of the TEMPORAL_FILTER_FRAMES frames before theirs.
+    When the stream stops, the requests are flushed: those waiting on the frame after their trigger take the newest one.
+
+    Args:
+        capture_requests (list): (request id, trigger time, "closest" or "sharpest", window in ms, experiment path, image name,
+            color format, png compression level, depth format, depth processing stages) requests
+        frame_history (frame_history.FrameHistory): the latest frames
+        save_queue (multiprocessing.Queue): queue of requests for the save workers
+        calibration (depth_processing.CameraCalibration): calibration of the camera, to align the depth to the color
+        flush (bool): true to give every request a frame if there is any, the stream is stopping
+
+    Returns:
+        list: the requests still waiting on a frame, when flushing those left because the history is empty
+    """
+    waiting = []
+    for request in capture_requests:
+        (request_id, trigger_time, selection, window_ms, exp_path, img_name,
+         color_format, png_compression, depth_format, depth_processing) = request
+        trigger_timestamp = trigger_time * 1000.0
+
+        ix = None
+        if selection == "sharpest":
+            ix = frame_history.sharpest(trigger_timestamp - window_ms, trigger_timestamp + CAPTURE_CLOCK_TOLERANCE_MS, LEVEL_TOLERANCE)
+        if ix is None:
+            if not flush and frame_history.newest_timestamp < trigger_timestamp - CAPTURE_CLOCK_TOLERANCE_MS:
+                waiting.append(request) # the frame after the trigger isn't in yet
+                continue
+            ix = frame_history.closest(trigger_timestamp)
+            if ix is None:
+                waiting.append(request) # no frame came in yet
                 continue
-            color_arr = np.asanyarray(color_frame.get_data())
-
-            # wait for the consumer to process frame before overwriting it
-            while frame_in_use.value:
-                pass
-            
-            # handle save frame requests
-            if gui_communication_pipe.poll() and prev_frames:
-                exp_path, img_name = gui_communication_pipe.recv()
-
-                # TODO find the latency of this func, if the stream is heavily interrupted (in a way we dont want)
-                # then can rework the frame saving into a thread
-                save_depth_images(prev_frames, exp_path, img_name)
-                pending_frame.value = False # let em know its done saving
-
-            # put the rotated frame's ndarray in shared memory
-            frame_buf[fIx] = np.rot90(color_arr, 1).copy()
-            fIx = (fIx + 1) % buffer_shape[0]  # 0 index is the buf size
-            prev_frames = frames
-        
-        pipeline.stop()
-    else:
-        print("There is no camera connected")
 
-    is_streaming.Value = False
+        frame_info = frame_history.frame_info(ix)
+        frame_info["trigger_timestamp"] = trigger_timestamp
+        previous_depths = []
+        if "temporal" in depth_processing:
+            previous_depths = [frame_history.depth[i].copy() for i in frame_history.preceding(ix, TEMPORAL_FILTER_FRAMES)]
 
-    # cleanup pipe
-    if gui_communication_pipe.poll():
-        gui_communication_pipe.recv()
-    gui_communication_pipe.close()
+        # the queue pickles the arrays in the background, copy them before the history overwrites the frame
+        save_queue.put((request_id, exp_path, img_name, color_format, png_compression, depth_format, depth_processing, calibration,
+                        frame_history.color[ix].copy(), frame_history.depth[ix].copy(), previous_depths, frame_info))
+    return waiting
+
+def save_worker(save_queue, save_status_queue, durability=DEFAULT_DURABILITY):
+    """
+    Save Worker Process.
+    Pulls save requests off the save queue, post-processes their depth and writes them to disk until it receives None.
+    Reports the outcome of every request on the status queue, with the size of the images, how long the color image took to encode,
+    how long saving and syncing took and jpegs of it shrunk for the experiment index and the review strip added to the frame info,
+    or the error of a request that failed.
+    With the batched durability policy, a batch left unfilled is synced once it is due, even if no request comes in.
+
+    Args:
+        save_queue (multiprocessing.Queue): queue of (request id, experiment path, image name, color format, png compression level,
+            depth format, depth processing stages, calibration, color array, depth array, depth arrays of the frames before it,
+            frame info) requests
+        save_status_queue (multiprocessing.Queue): queue to report (request id, image name, success, frame info) on
+        durability (str): when the captures are synced to disk, one of durable_writes.DURABILITY_POLICIES
+    """
+    # saving yields the cpu to the camera and GUI processes, so post-processing captures doesn't slow the stream
+    if hasattr(os, "nice"):
+        os.nice(SAVE_WORKER_NICENESS)
 
-    # free shared memory
-    existing_shm.close()
+    # the orienters' buffers are reused for every save
+    color_orienter = FrameOrienter(FRAME_ROTATION)
+    depth_orienter = FrameOrienter(FRAME_ROTATION)
+    writer = DurableWriter(durability)
 
-def save_depth_images(frames, experiment_path, image_name):
+    while True:
+        sync_due = writer.sync_due()
+        try:
+            request = save_queue.get(timeout=None if sync_due is None else max(sync_due, 0))
+        except queue.Empty:
+            writer.sync()
+            continue
+        if request is None:
+            break
+
+        (request_id, exp_path, img_name, color_format, png_compression, depth_format, depth_processing, calibration,
+         color_arr, depth_arr, previous_depths, frame_info) = request
+        try:
+            start = time.perf_counter()
+            depth_arr = process_depth(depth_arr, depth_processing, calibration, previous_depths)
+            frame_info["depth_processing_ms"] = (time.perf_counter() - start) * 1000.0
+            start = time.perf_counter()
+            color_bytes, depth_bytes, color_encode_sec, depth_write_sec = save_depth_images(color_arr, depth_arr, exp_path, img_name, depth_format,
+                                                                           color_orienter, depth_orienter, color_format, png_compression,
+                                                                           writer)
+            frame_info["save_ms"] = (time.perf_counter() - start) * 1000.0
+            frame_info["sync_ms"] = writer.capture_done() * 1000.0
+            frame_info["color_bytes"] = color_bytes
+            frame_info["depth_bytes"] = depth_bytes
+            frame_info["color_encode_ms"] = color_encode_sec * 1000.0
+            frame_info["depth_write_ms"] = depth_write_sec * 1000.0
+            # shrunk from the frame in memory, nothing is read back from the disk
+            frame_info["thumbnail"] = encode_thumbnail(color_arr, INDEX_THUMBNAIL_SIZE, FRAME_ROTATION)
+            frame_info["preview"] = encode_thumbnail(color_arr, PREVIEW_SIZE, FRAME_ROTATION)
+        except Exception as e:
+            print("Failed to save image %s: %s" % (img_name, e))
+            frame_info["save_error"] = str(e)
+            save_status_queue.put((request_id, img_name, False, frame_info))
+        else:
+            save_status_queue.put((request_id, img_name, True, frame_info))
+
+    writer.sync()
+
+def save_depth_images(color_arr, depth_arr, experiment_path, image_name, depth_format=LEGACY_DEPTH_FORMAT,
+                      color_orienter=None, depth_orienter=None, color_format=LEGACY_COLOR_FORMAT, png_compression=PNG_COMPRESSION,
+                      writer=None):
     """Saves RGB image and Depth data.
 
     Args:
+        color_arr (ndarray): BGR color frame, as captured by the camera
+        depth_arr (ndarray): z16 depth frame, as captured by the camera
         experiment_path (str): Directory of experiment that images belong to
         image_name (str): Root name to save images as, file extension will be tacked on
+        depth_format (str): format to write the depth data in, one of image_writers.DEPTH_FORMATS
+        color_orienter (frame_transform.FrameOrienter): orients the color frame, pass one in to reuse its buffer across saves
+        depth_orienter (frame_transform.FrameOrienter): orients the depth frame, pass one in to reuse its buffer across saves
+        color_format (str): format to write the color image in, one of image_writers.COLOR_FORMATS
+        png_compression (int): zlib level of the png color format, 0-9
+        writer (durable_writes.DurableWriter): writes the files, the caller marks the capture done on it
+
+    Returns:
+        tuple: (bytes of the color image, bytes of the depth file, seconds spent encoding the color image,
+            seconds spent encoding and writing the depth)
     """
-    # grab the frames
-    depth_frame = frames.get_depth_frame()
-    color_frame = frames.get_color_frame()
-
-    # grab the file names
-    color_fname = os.path.join(experiment_path, "RGB", image_name + ".bmp")
-    depth_fname = os.path.join(experiment_path, "Depth", image_name + ".txt")
-
-    # represent them as numpy arrays
-    color_arr = np.asanyarray(color_frame.get_data())
-    depth_arr = np.asanyarray(depth_frame.get_data())
-
-    # rotate them
-    # convert BGR to RGB by rotating the channels
-    color_arr = np.rot90(color_arr, 1).copy()[:, :, ::-1] 
-    depth_arr = np.rot90(depth_arr, 1).copy()
+    color_orienter = color_orienter or FrameOrienter(FRAME_ROTATION)
+    depth_orienter = depth_orienter or FrameOrienter(FRAME_ROTATION)
+
+    # rotate them in a single copy each, the color stays BGR which is what the color writer expects
+    color_arr = color_orienter.apply(color_arr)
+    depth_arr = depth_orienter.apply(depth_arr)
     
     # to save depth in m, uncomment line below
     #     depth_arr = depth_arr/1000
 
     # save them
-    Image.fromarray(color_arr, "RGB").save(color_fname)
-    np.savetxt(depth_fname, depth_arr, fmt="%.3f \n", newline='')
+    _, color_bytes, color_encode_sec = save_color(color_arr, os.path.join(experiment_path, "RGB"), image_name,
+                                                  color_format, png_compression, writer)
+    start = time.perf_counter()
+    depth_fname = save_depth(depth_arr, os.path.join(experiment_path, "Depth"), image_name, depth_format, writer)
+    depth_write_sec = time.perf_counter() - start
+    return color_bytes, os.path.getsize(depth_fname), color_encode_sec, depth_write_sec
 
 # TODO find a way to do this, no import
 def get_number_of_cameras():
@@ -136,6 +454,11 @@ def get_number_of_cameras():
 
 
 def get_camera_serial():
+    """Returns the name and serial number of every camera connected to the OS
+
+    Returns:
+        list: (name, serial number) of the Intel RealSense cameras connected, None if there are none
+    """
     import pyrealsense2 as rs
     ctx = rs.context()
     camera_serials = []
@@ -144,7 +467,7 @@ def get_camera_serial():
             #print ('Found device: ', d.get_info(rs.camera_info.name), ' ', d.get_info(rs.camera_info.serial_number))
             camera_info = (d.get_info(rs.camera_info.name), d.get_info(rs.camera_info.serial_number))
             camera_serials.append(camera_info)
-            return camera_serials
+        return camera_serials
     else:
         #print("No Intel Device connected")
         return None
\ No newline at end of file
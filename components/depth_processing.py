@@ -0,0 +1,213 @@
+"""
+This code handles the post-processing of the captured depth frames
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from util import (DECIMATION_FACTOR, SPATIAL_FILTER_ALPHA, SPATIAL_FILTER_DELTA, SPATIAL_FILTER_ITERATIONS,
+                  TEMPORAL_FILTER_ALPHA, TEMPORAL_FILTER_DELTA)
+
+# pinhole intrinsics of a stream, in pixels
+Intrinsics = namedtuple("Intrinsics", ["width", "height", "fx", "fy", "ppx", "ppy"])
+
+# calibration of a camera, rotation (3x3) and translation (3, in m) take a point from the depth sensor's frame to the color sensor's,
+# depth_scale is the m per depth unit
+CameraCalibration = namedtuple("CameraCalibration", ["depth", "color", "rotation", "translation", "depth_scale"])
+
+# stages in the order they are applied, the order recommended for the RealSense SDK's filters
+DEPTH_PROCESSING_STAGES = ("decimation", "spatial", "temporal", "hole_filling", "align")
+
+# depth processing preset -> stages
+DEPTH_PROCESSING_PRESETS = {
+    "raw": [],
+    "aligned": ["align"],
+    "filtered": ["spatial", "temporal", "hole_filling", "align"],
+    "decimated": ["decimation", "spatial", "temporal", "hole_filling", "align"],
+}
+
+
+def pinhole_calibration(width, height, hfov=69.0, depth_scale=0.001):
+    """Returns the calibration of a camera whose depth and color are already aligned pixel for pixel,
+    like the synthetic camera and replayed captures.
+
+    Args:
+        width (int): width of the frames
+        height (int): height of the frames
+        hfov (float): horizontal field of view in degrees, defaults to the RealSense color sensor's
+        depth_scale (float): m per depth unit
+
+    Returns:
+        CameraCalibration: identical intrinsics for both streams, no rotation or translation between them
+    """
+    focal = (width / 2) / math.tan(math.radians(hfov) / 2)
+    intrinsics = Intrinsics(width, height, focal, focal, (width - 1) / 2, (height - 1) / 2)
+    return CameraCalibration(intrinsics, intrinsics, np.eye(3), np.zeros(3), depth_scale)
+
+def decimate(depth, intrinsics, factor=DECIMATION_FACTOR):
+    """Shrinks a depth frame by keeping the median of the valid pixels of every factor x factor block.
+
+    Args:
+        depth (ndarray): z16 depth frame, 0 is invalid
+        intrinsics (Intrinsics): intrinsics of the depth frame
+        factor (int): size of the blocks
+
+    Returns:
+        tuple: (decimated depth frame, its intrinsics)
+    """
+    height, width = depth.shape[0] // factor, depth.shape[1] // factor
+    blocks = depth[:height * factor, :width * factor].reshape(height, factor, width, factor).swapaxes(1, 2)
+    blocks = np.sort(blocks.reshape(height, width, factor * factor), axis=2)
+
+    # the invalid pixels sort first, the median of the valid ones follows them. all invalid blocks stay 0
+    nvalid = np.count_nonzero(blocks, axis=2)
+    median_ix = factor * factor - nvalid + np.maximum(nvalid - 1, 0) // 2
+    decimated = np.take_along_axis(blocks, median_ix[..., None], axis=2)[..., 0]
+
+    scaled = Intrinsics(width, height, intrinsics.fx / factor, intrinsics.fy / factor,
+                        (intrinsics.ppx + 0.5) / factor - 0.5, (intrinsics.ppy + 0.5) / factor - 0.5)
+    return decimated, scaled
+
+def spatial_filter(depth, alpha=SPATIAL_FILTER_ALPHA, delta=SPATIAL_FILTER_DELTA, iterations=SPATIAL_FILTER_ITERATIONS):
+    """Edge preserving smoothing, a recursive filter sweeping the frame left, right, up and down like the SDK's spatial filter.
+    Each sweep is vectorized over the rows or columns, only the steps along them are a python loop.
+
+    Args:
+        depth (ndarray): z16 depth frame, 0 is invalid
+        alpha (float): weight of a pixel against its smoothed neighbour
+        delta (float): neighbours further apart than this are an edge and aren't smoothed across
+        iterations (int): num of times the frame is swept
+
+    Returns:
+        ndarray: the smoothed depth frame, invalid pixels stay 0
+    """
+    smoothed = depth.astype(np.float32)
+    valid = depth > 0
+    for _ in range(iterations):
+        # sweep along the rows, then along the columns through transposed views
+        for frame, frame_valid in ((smoothed, valid), (smoothed.T, valid.T)):
+            for steps in (range(1, frame.shape[1]), range(frame.shape[1] - 2, -1, -1)):
+                for x in steps:
+                    prev_x = x - 1 if steps.step > 0 else x + 1
+                    current, previous = frame[:, x], frame[:, prev_x]
+                    smooth = frame_valid[:, x] & frame_valid[:, prev_x] & (np.abs(current - previous) < delta)
+                    np.copyto(current, alpha * current + (1 - alpha) * previous, where=smooth)
+    return np.rint(smoothed).astype(depth.dtype)
+
+def temporal_filter(depth, previous, alpha=TEMPORAL_FILTER_ALPHA, delta=TEMPORAL_FILTER_DELTA):
+    """Averages a depth frame with the frames before it, a moving average that restarts where a pixel changes by more than delta.
+    Pixels invalid in the frame keep their value from the frames before it.
+
+    Args:
+        depth (ndarray): z16 depth frame, 0 is invalid
+        previous (list): the depth frames before it, oldest first
+        alpha (float): weight of the newer frame in the moving average
+        delta (float): change in depth that restarts the average
+
+    Returns:
+        ndarray: the averaged depth frame
+    """
+    averaged = None
+    for frame in list(previous) + [depth]:
+        frame = frame.astype(np.float32)
+        if averaged is None:
+            averaged = frame
+            continue
+
+        valid = frame > 0
+        smooth = valid & (averaged > 0) & (np.abs(frame - averaged) < delta)
+        averaged = np.where(smooth, alpha * frame + (1 - alpha) * averaged, np.where(valid, frame, averaged))
+    return np.rint(averaged).astype(depth.dtype)
+
+def fill_holes(depth):
+    """Fills every invalid pixel with the nearest valid one to its left, like the SDK's hole filling filter's default mode.
+
+    Args:
+        depth (ndarray): z16 depth frame, 0 is invalid
+
+    Returns:
+        ndarray: the filled depth frame, pixels with no valid one to their left stay 0
+    """
+    # column of the last valid pixel up to each pixel
+    source_x = np.where(depth > 0, np.arange(depth.shape[1]), 0)
+    np.maximum.accumulate(source_x, axis=1, out=source_x)
+    return np.take_along_axis(depth, source_x, axis=1)
+
+def align_to_color(depth, depth_intrinsics, calibration):
+    """Reprojects a depth frame into the color sensor's view, so each depth pixel lines up with the color pixel it was seen at.
+    Every depth pixel is deprojected to a point, moved to the color sensor's frame and projected back,
+    and fills the color pixels its footprint covers like the SDK's align does. Where several points land on a pixel the nearest is kept.
+    Lens distortion is ignored, the RealSense depth streams have none and the color's is small.
+
+    Args:
+        depth (ndarray): z16 depth frame, 0 is invalid
+        depth_intrinsics (Intrinsics): intrinsics of the depth frame, they differ from the calibration's after decimation
+        calibration (CameraCalibration): the camera's calibration
+
+    Returns:
+        ndarray: the depth frame aligned to the color frame, at the color's resolution
+    """
+    color = calibration.color
+    rows, cols = np.nonzero(depth)
+    z = depth[rows, cols] * np.float32(calibration.depth_scale)
+    u, v = cols.astype(np.float32), rows.astype(np.float32)
+
+    def project(pixel_u, pixel_v):
+        # deproject the depth pixel at z, move it to the color sensor's frame and project it.
+        # float32 and a row of the rotation at a time, a 3xN matmul in float64 is several times slower
+        point = ((pixel_u - depth_intrinsics.ppx) * (z / depth_intrinsics.fx),
+                 (pixel_v - depth_intrinsics.ppy) * (z / depth_intrinsics.fy),
+                 z)
+        moved_x, moved_y, moved_z = (row[0] * point[0] + row[1] * point[1] + row[2] * point[2] + offset
+                                     for row, offset in zip(np.asarray(calibration.rotation, np.float32),
+                                                            np.asarray(calibration.translation, np.float32)))
+        return moved_x / moved_z * color.fx + color.ppx, moved_y / moved_z * color.fy + color.ppy, moved_z
+
+    # the color pixels whose centres lie within the depth pixel's footprint, at least the one it lands on
+    left, top, _ = project(u - 0.5, v - 0.5)
+    right, bottom, color_z = project(u + 0.5, v + 0.5)
+    x0, y0 = np.ceil(left).astype(np.int64), np.ceil(top).astype(np.int64)
+    x1 = np.maximum(np.ceil(right).astype(np.int64) - 1, x0)
+    y1 = np.maximum(np.ceil(bottom).astype(np.int64) - 1, y0)
+
+    # z-buffer, the nearest point wins each pixel
+    aligned = np.full(color.height * color.width, np.inf, dtype=np.float32)
+    for dy in range(int((y1 - y0).max(initial=0)) + 1):
+        for dx in range(int((x1 - x0).max(initial=0)) + 1):
+            x, y = x0 + dx, y0 + dy
+            inside = (x <= x1) & (y <= y1) & (x >= 0) & (x < color.width) & (y >= 0) & (y < color.height) & (color_z > 0)
+            np.minimum.at(aligned, y[inside] * color.width + x[inside], color_z[inside])
+
+    aligned[np.isinf(aligned)] = 0
+    return np.rint(aligned / calibration.depth_scale).astype(depth.dtype).reshape(color.height, color.width)
+
+def process_depth(depth, stages, calibration, previous=()):
+    """Runs the depth processing stages over a captured depth frame, in the order of DEPTH_PROCESSING_STAGES.
+
+    Args:
+        depth (ndarray): z16 depth frame, as captured by the camera
+        stages (list): stages to run, from DEPTH_PROCESSING_STAGES
+        calibration (CameraCalibration): the camera's calibration, only needed to decimate or align
+        previous (list): the depth frames before the captured one, oldest first, only needed by the temporal filter
+
+    Returns:
+        ndarray: the processed depth frame
+    """
+    unknown = set(stages) - set(DEPTH_PROCESSING_STAGES)
+    if unknown:
+        raise ValueError("Unknown depth processing stages %s" % ", ".join(sorted(unknown)))
+
+    intrinsics = calibration.depth if calibration else None
+    if "decimation" in stages:
+        depth, intrinsics = decimate(depth, intrinsics)
+        previous = [decimate(frame, calibration.depth)[0] for frame in previous]
+    if "spatial" in stages:
+        depth = spatial_filter(depth)
+    if "temporal" in stages:
+        depth = temporal_filter(depth, previous)
+    if "hole_filling" in stages:
+        depth = fill_holes(depth)
+    if "align" in stages:
+        depth = align_to_color(depth, intrinsics, calibration)
+    return depth
@@ -0,0 +1,125 @@
+"""
+This code handles watching the free space of the experiment's disk and how fast the captures are saved to it
+"""
+import logging
+import queue
+import shutil
+from collections import deque
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from util import DISK_CHECK_PERIOD_SEC, SAVE_STATS_WINDOW
+
+log = logging.getLogger("pcl_diskmonitor")
+
+# reason -> (color format, depth format, why) captures are switched to by auto-degrade
+DEGRADED_FORMATS = {
+    "disk": ("jpeg", "npz", "the disk is nearly full"),  # the smallest
+    "backlog": ("jpeg", "npy", "the saves are falling behind"),  # the fastest to encode and write
+}
+
+# rough bytes per pixel of each format, to estimate the size of a capture until one was saved in it
+COLOR_BYTES_PER_PIXEL = {"bmp": 3.0, "png": 2.0, "webp": 1.5, "jpeg": 0.4}
+DEPTH_BYTES_PER_PIXEL = {"txt": 10.0, "npy": 2.0, "npz": 1.2, "png": 1.4}
+
+
+class DiskMonitor(QThread):
+    """Background thread that checks the free space of the disk an experiment is saved to, every DISK_CHECK_PERIOD_SEC
+    and whenever asked to. Checking a slow card or a network drive can block, so the GUI never does it itself.
+
+    Args:
+        QThread (QThread): Base class of Qt threads.
+    """
+
+    diskChecked = pyqtSignal(str, float, float)  # path checked, free bytes, total bytes
+
+    def __init__(self):
+        """Constructor for the DiskMonitor, it waits for a path to watch."""
+        super().__init__()
+        self.path = None
+        self.requests = queue.Queue()  # paths to check right away, None to stop
+
+    def watch(self, path):
+        """Checks the disk of a new path now, and from then on periodically.
+
+        Args:
+            path (str): directory on the disk to watch, the open experiment
+        """
+        self.path = path
+        self.requests.put(path)
+
+    def check_now(self):
+        """Checks the disk watched without waiting for the next periodic check."""
+        if self.path is not None:
+            self.requests.put(self.path)
+
+    def run(self):
+        """Checks the disk until stopped."""
+        path = None
+        while True:
+            try:
+                request = self.requests.get(timeout=DISK_CHECK_PERIOD_SEC)
+            except queue.Empty:
+                if path is None:
+                    continue
+                request = path
+            if request is None:
+                break
+
+            path = request
+            try:
+                usage = shutil.disk_usage(path)
+            except OSError as e:
+                log.warning("Could not check the free space of %s: %s" % (path, e))
+                continue
+            self.diskChecked.emit(path, float(usage.free), float(usage.total))
+
+    def stop(self):
+        """Stops the thread and waits for it to finish."""
+        self.requests.put(None)
+        self.wait()
+
+
+class SaveStats:
+    """
+    The size and save time of the last SAVE_STATS_WINDOW captures, to estimate how many more captures fit on the disk
+    and how fast the save workers write them. Used by the GUI thread only.
+    """
+
+    def __init__(self):
+        """Constructor for SaveStats."""
+        self.captures = deque(maxlen=SAVE_STATS_WINDOW)  # (color format, depth format, bytes, ms saving) of the last captures
+
+    def add(self, color_format, depth_format, nbytes, save_ms):
+        """Records a saved capture.
+
+        Args:
+            color_format (str): format the color image was saved in
+            depth_format (str): format the depth was saved in
+            nbytes (int): bytes of both images
+            save_ms (float): ms the save worker took to encode and write them
+        """
+        self.captures.append((color_format, depth_format, nbytes, save_ms))
+
+    def bytes_per_capture(self, color_format, depth_format, npixels):
+        """Returns the average size of a capture in the given formats, estimated from the frame size if none was saved lately.
+
+        Args:
+            color_format (str): one of image_writers.COLOR_FORMATS
+            depth_format (str): one of image_writers.DEPTH_FORMATS
+            npixels (int): pixels in a frame
+
+        Returns:
+            float: bytes of a capture's images
+        """
+        sizes = [nbytes for color, depth, nbytes, _ in self.captures if (color, depth) == (color_format, depth_format)]
+        if sizes:
+            return sum(sizes) / len(sizes)
+        return npixels * (COLOR_BYTES_PER_PIXEL[color_format] + DEPTH_BYTES_PER_PIXEL[depth_format])
+
+    def throughput(self):
+        """Returns the bytes a save worker writes per second, encoding included, None until a capture was saved."""
+        save_ms = sum(capture[3] for capture in self.captures)
+        if not save_ms:
+            return None
+        return sum(capture[2] for capture in self.captures) / (save_ms / 1000.0)
@@ -0,0 +1,128 @@
+"""
+This code handles writing capture outputs so a crash or power loss never leaves them half written
+"""
+import os
+import time
+
+from util import DEFAULT_DURABILITY, DURABILITY_BATCH_CAPTURES, DURABILITY_BATCH_SEC
+
+DURABILITY_POLICIES = ("capture", "batched", "none")
+TMP_SUFFIX = ".tmp"  # files being written, renamed over their final path once complete
+
+
+def fsync_file(path):
+    """Forces a file written earlier to disk."""
+    # windows only flushes files opened for writing
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+def fsync_directory(path):
+    """Forces a directory's entries to disk, so the files renamed into it survive a power loss.
+    Windows can't open directories, and NTFS journals the renames itself."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DurableWriter:
+    """
+    Writes files to a temporary file beside them, renamed over the final path once complete, so the final path only ever
+    holds a complete file, and forces them to disk according to a durability policy:
+        capture: every file is synced before it is renamed, and the directories once the capture is done,
+                 a capture reported saved survives a power loss
+        batched: the files are synced together every DURABILITY_BATCH_CAPTURES captures or DURABILITY_BATCH_SEC,
+                 a power loss can cost the captures of the last batch
+        none: syncing is left to the OS
+    A writer is used by a single save worker, or a batch worker.
+    """
+
+    def __init__(self, durability=DEFAULT_DURABILITY):
+        """Constructor for DurableWriter.
+
+        Args:
+            durability (str): one of DURABILITY_POLICIES
+        """
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError("Unknown durability policy %s" % durability)
+
+        self.durability = durability
+        self.unsynced = []  # files renamed into place but not synced
+        self.unsynced_dirs = set()  # directories of files renamed into them but not synced
+        self.ncaptures = 0  # captures done since the last sync
+        self.first_unsynced_time = None  # time.time() of the oldest capture not synced
+        self.write_sync_sec = 0.0  # seconds spent syncing the files of the current capture as they were written
+
+    def write(self, fname, write_data):
+        """Writes a file through a temporary file.
+
+        Args:
+            fname (str): final path of the file
+            write_data (callable): writes the file's data to the binary file object it is called with
+        """
+        tmp_path = fname + TMP_SUFFIX
+        try:
+            with open(tmp_path, "wb") as f:
+                write_data(f)
+                if self.durability == "capture":
+                    f.flush()
+                    start = time.perf_counter()
+                    os.fsync(f.fileno())
+                    self.write_sync_sec += time.perf_counter() - start
+            os.replace(tmp_path, fname)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self.durability == "batched":
+            self.unsynced.append(fname)
+        if self.durability != "none":
+            self.unsynced_dirs.add(os.path.dirname(os.path.abspath(fname)))
+
+    def capture_done(self):
+        """Marks the end of a capture's files, syncs them or the batch when the policy calls for it.
+
+        Returns:
+            float: seconds spent syncing the capture's files as they were written and since
+        """
+        if self.durability == "none":
+            return 0.0
+
+        sync_sec, self.write_sync_sec = self.write_sync_sec, 0.0
+        self.ncaptures += 1
+        if self.first_unsynced_time is None:
+            self.first_unsynced_time = time.time()
+        if self.durability == "capture" or self.ncaptures >= DURABILITY_BATCH_CAPTURES or self.sync_due() <= 0:
+            sync_sec += self.sync()
+        return sync_sec
+
+    def sync_due(self):
+        """Returns the seconds until the unsynced captures are due to be synced, None if there are none."""
+        if self.first_unsynced_time is None:
+            return None
+        return self.first_unsynced_time + DURABILITY_BATCH_SEC - time.time()
+
+    def sync(self):
+        """Forces the files written since the last sync to disk, then the directories they were renamed into.
+
+        Returns:
+            float: seconds spent syncing
+        """
+        start = time.perf_counter()
+        for fname in self.unsynced:
+            try:
+                fsync_file(fname)
+            except FileNotFoundError:
+                pass  # replaced or deleted since
+        for path in self.unsynced_dirs:
+            fsync_directory(path)
+
+        self.unsynced = []
+        self.unsynced_dirs = set()
+        self.ncaptures = 0
+        self.first_unsynced_time = None
+        return time.perf_counter() - start
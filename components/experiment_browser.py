@@ -0,0 +1,217 @@
+"""
+This code handles the experiment browser dialog
+"""
+import logging
+from datetime import datetime
+
+from PyQt5.QtCore import QSize, Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QIcon, QPixmap
+from PyQt5.QtWidgets import (QAbstractItemView, QDialog, QHBoxLayout, QHeaderView, QLabel, QPushButton, QTableWidget,
+                             QTableWidgetItem, QVBoxLayout)
+
+from util import DEFAULT_FONT, INDEX_THUMBNAIL_SIZE, PLOT_NUMBER_PADDING
+from .experiment_index import ExperimentIndex
+
+log = logging.getLogger("experiment_browser")
+
+BROWSER_COLUMNS = ("", "Experiment", "Plots", "Last Plot", "Captured", "Size")
+
+
+class IndexRefresher(QThread):
+    """Background thread that rescans the experiments changed since they were indexed, with its own connection to the index.
+
+    Args:
+        QThread (QThread): Base class of Qt threads.
+    """
+
+    experimentIndexed = pyqtSignal(str)  # name of an experiment reindexed or forgotten
+
+    def __init__(self, root):
+        """Constructor for the IndexRefresher.
+
+        Args:
+            root (str): directory of the experiments
+        """
+        super().__init__()
+        self.root = root
+
+    def run(self):
+        """Refreshes the index, stopping between experiments if interrupted."""
+        index = ExperimentIndex(self.root)
+        try:
+            for name in index.refresh():
+                self.experimentIndexed.emit(name)
+                if self.isInterruptionRequested():
+                    break
+        except Exception as e:
+            log.warning("Could not refresh the experiment index: %s" % e)
+        finally:
+            index.close()
+
+    def stop(self):
+        """Stops the thread and waits for it to finish."""
+        self.requestInterruption()
+        self.wait()
+
+
+def format_size(nbytes):
+    """Returns a size in bytes as MB or GB."""
+    if nbytes >= 2**30:
+        return "%.1f GB" % (nbytes / 2**30)
+    return "%.1f MB" % (nbytes / 2**20)
+
+def format_date_range(first_capture, last_capture):
+    """Returns the days of the first and last capture, in the metadata's date format."""
+    if first_capture is None:
+        return ""
+    first, last = (datetime.fromtimestamp(t).strftime("%d/%m/%Y") for t in (first_capture, last_capture))
+    return first if first == last else "%s - %s" % (first, last)
+
+
+class SortItem(QTableWidgetItem):
+    """Table item shown as text but sorted by a value of its own, so sizes and dates sort by magnitude."""
+
+    def __init__(self, text, sort_value):
+        super().__init__(text)
+        self.sort_value = sort_value
+
+    def __lt__(self, other):
+        return self.sort_value < getattr(other, "sort_value", 0)
+
+
+class ExperimentBrowser(QDialog):
+    """Pop up dialog listing the experiments from the experiment index, to open one of them.
+    The list is shown right away from the index, the experiments changed outside of the GUI are rescanned in the background
+    and their rows updated as they are done.
+
+    Args:
+        QDialog (QDialog): Base class of dialog windows.
+    """
+
+    experimentSelected = pyqtSignal(str)
+
+    def __init__(self, index):
+        """Lists the indexed experiments and starts refreshing the index.
+
+        Args:
+            index (experiment_index.ExperimentIndex): the GUI's connection to the index
+        """
+        super().__init__()
+        self.index = index
+        self.rows = {}  # experiment name -> table item of its name
+        self.setWindowTitle("Open Experiment")
+        self.setUpLayout()
+
+        # sorted once filled, sorting as every row is added takes seconds with hundreds of experiments
+        self.table.setSortingEnabled(False)
+        for entry in index.experiments():
+            self.set_row(entry)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(4, Qt.DescendingOrder)
+        self.update_status()
+
+        self.refresher = IndexRefresher(index.root)
+        self.refresher.experimentIndexed.connect(self.on_experiment_indexed)
+        self.refresher.finished.connect(self.update_status)
+        self.refresher.start()
+
+    def setUpLayout(self):
+        """Set Up the table of experiments and the buttons."""
+        self.table = QTableWidget(0, len(BROWSER_COLUMNS))
+        self.table.setHorizontalHeaderLabels(BROWSER_COLUMNS)
+        self.table.setFont(DEFAULT_FONT)
+        self.table.setIconSize(QSize(INDEX_THUMBNAIL_SIZE, INDEX_THUMBNAIL_SIZE))
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setDefaultSectionSize(INDEX_THUMBNAIL_SIZE)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
+        self.table.setColumnWidth(0, INDEX_THUMBNAIL_SIZE)
+        self.table.itemDoubleClicked.connect(self.open_experiment)
+
+        self.status_label = QLabel()
+        self.open_button = QPushButton("Open")
+        self.open_button.setFont(DEFAULT_FONT)
+        self.open_button.clicked.connect(self.open_experiment)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setFont(DEFAULT_FONT)
+        self.cancel_button.clicked.connect(self.reject)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.status_label, 1)
+        button_layout.addWidget(self.open_button)
+        button_layout.addWidget(self.cancel_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+        self.resize(1000, 600)
+
+    def set_row(self, entry):
+        """Adds or updates the row of an experiment.
+
+        Args:
+            entry (dict): the experiment's index entry
+        """
+        name_item = self.rows.get(entry["name"])
+        if name_item is None:
+            self.table.insertRow(self.table.rowCount())
+            name_item = self.rows[entry["name"]] = SortItem(entry["name"], entry["name"])
+            self.table.setItem(self.table.rowCount() - 1, 1, name_item)
+
+        thumbnail_item = SortItem("", entry["last_capture"] or 0)
+        if entry["thumbnail"]:
+            pixmap = QPixmap()
+            pixmap.loadFromData(entry["thumbnail"])
+            thumbnail_item.setIcon(QIcon(pixmap))
+
+        last_plot = entry["last_plot_number"]
+        items = {
+            0: thumbnail_item,
+            2: SortItem(str(entry["plots"]), entry["plots"]),
+            3: SortItem("" if last_plot is None else str(last_plot).zfill(PLOT_NUMBER_PADDING), -1 if last_plot is None else last_plot),
+            4: SortItem(format_date_range(entry["first_capture"], entry["last_capture"]), entry["last_capture"] or 0),
+            5: SortItem(format_size(entry["disk_bytes"]), entry["disk_bytes"]),
+        }
+        for column, item in items.items():
+            if column > 1:
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            # a sorted table moves the row as its items change, the name item keeps track of it
+            self.table.setItem(name_item.row(), column, item)
+
+    def on_experiment_indexed(self, name):
+        """Updates the row of an experiment the refresher reindexed, or removes it if it was deleted.
+
+        Args:
+            name (str): name of the experiment
+        """
+        entry = self.index.get(name)
+        if entry is not None:
+            self.set_row(entry)
+        elif name in self.rows:
+            self.table.removeRow(self.rows.pop(name).row())
+        self.update_status()
+
+    def update_status(self):
+        """Shows the num of experiments, and whether the index is still being refreshed."""
+        status = "%i experiments" % len(self.rows)
+        if getattr(self, "refresher", None) is None or self.refresher.isRunning():
+            status += ", looking for changes..."
+        self.status_label.setText(status)
+
+    def open_experiment(self):
+        """Opens the selected experiment and closes the browser."""
+        selected = self.table.selectedItems()
+        if not selected:
+            return
+        self.experimentSelected.emit(self.table.item(selected[0].row(), 1).text())
+        self.accept()
+
+    def done(self, result):
+        """Stops the refresher however the dialog is closed."""
+        self.refresher.stop()
+        super().done(result)
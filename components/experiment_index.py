@@ -0,0 +1,263 @@
+"""
+This code handles the index of the experiments the experiment browser lists
+"""
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import cv2
+
+from util import EXPERIMENT_INDEX_FILENAME, INDEX_BUSY_TIMEOUT_SEC, INDEX_THUMBNAIL_SIZE, PCL_EXP_PATH
+from .image_writers import COLOR_EXTENSIONS, encode_thumbnail, find_experiments
+from .metadata import read_entries
+
+INDEX_SCHEMA_VERSION = 1  # bump when the table changes, an index of another version is rebuilt from the experiments
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    name TEXT PRIMARY KEY,
+    captures INTEGER NOT NULL,  -- metadata entries, a plot has one per camera
+    plots INTEGER NOT NULL,  -- distinct plot numbers captured
+    last_plot_number INTEGER,
+    first_capture REAL,  -- time.time() of the first and last capture
+    last_capture REAL,
+    disk_bytes INTEGER NOT NULL,
+    thumbnail BLOB,  -- jpeg of the last capture
+    signature TEXT NOT NULL,  -- the experiment is rescanned when it no longer matches experiment_signature
+    indexed_at REAL NOT NULL
+)
+"""
+
+
+def get_metadata_path(exp_path):
+    """Returns the path of an experiment's metadata file, named after the experiment."""
+    return os.path.join(exp_path, "Metadata", "%s.json" % os.path.basename(os.path.normpath(exp_path)))
+
+def experiment_signature(exp_path):
+    """Sums up when an experiment last changed, from the RGB and Depth directories and the metadata journal.
+    Saving or converting images changes the directories and capturing appends to the journal, so three stats tell if an
+    experiment needs to be rescanned.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        str: the signature
+    """
+    metadata_path = get_metadata_path(exp_path)
+    signature = []
+    for path in (os.path.join(exp_path, "RGB"), os.path.join(exp_path, "Depth"), os.path.splitext(metadata_path)[0] + ".jsonl"):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append("-")
+        else:
+            signature.append("%i:%i" % (stat.st_mtime_ns, stat.st_size))
+    return ",".join(signature)
+
+def entry_time(entry):
+    """Returns when a metadata entry was captured, in the time.time() base, None if it has no valid time."""
+    if "frame_timestamp_ms" in entry:
+        return entry["frame_timestamp_ms"] / 1000.0
+    try:
+        return datetime.strptime("%s %s" % (entry["date"], entry["time"]), "%d/%m/%Y %H:%M:%S").timestamp()
+    except (KeyError, ValueError):
+        return None
+
+def scan_disk_usage(path):
+    """Adds up the size of every file under a directory, and finds the newest color image.
+
+    Args:
+        path (str): directory to scan
+
+    Returns:
+        tuple: (bytes, path of the color image modified last or None)
+    """
+    nbytes = 0
+    newest, newest_mtime = None, -1
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        in_rgb = os.path.basename(directory) == "RGB"
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                nbytes += stat.st_size
+                if in_rgb and os.path.splitext(entry.name)[1].lower() in COLOR_EXTENSIONS and stat.st_mtime > newest_mtime:
+                    newest, newest_mtime = entry.path, stat.st_mtime
+    return nbytes, newest
+
+def scan_experiment(exp_path):
+    """Works out an experiment's index entry from its metadata and files.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        dict: the experiment's index entry
+    """
+    signature = experiment_signature(exp_path)  # before scanning, a capture saved meanwhile makes it stale
+    entries = read_entries(get_metadata_path(exp_path))
+    plot_numbers = set()
+    for entry in entries:
+        try:
+            plot_numbers.add(int(entry["number"]))
+        except (KeyError, ValueError):
+            pass
+    times = [t for t in map(entry_time, entries) if t is not None]
+
+    disk_bytes, newest_image = scan_disk_usage(exp_path)
+    thumbnail = None
+    if newest_image:
+        # decoding at a quarter size is faster, the thumbnail doesn't need more
+        color_arr = cv2.imread(newest_image, cv2.IMREAD_REDUCED_COLOR_4)
+        if color_arr is not None:
+            thumbnail = encode_thumbnail(color_arr, INDEX_THUMBNAIL_SIZE)
+
+    return {
+        "name": os.path.basename(os.path.normpath(exp_path)),
+        "captures": len(entries),
+        "plots": len(plot_numbers),
+        "last_plot_number": max(plot_numbers) if plot_numbers else None,
+        "first_capture": min(times) if times else None,
+        "last_capture": max(times) if times else None,
+        "disk_bytes": disk_bytes,
+        "thumbnail": thumbnail,
+        "signature": signature,
+        "indexed_at": time.time(),
+    }
+
+
+class ExperimentIndex:
+    """
+    SQLite index of the experiments in PCL_EXP_PATH, a row per experiment with its plot counts, last plot number, date range,
+    disk usage and a thumbnail of its last capture, so the experiments can be listed without scanning their directories.
+    The GUI keeps the index up to date as it captures, and refresh rescans only the experiments changed outside of it.
+    The index is a cache, it is rebuilt from the experiments if it is deleted.
+
+    A connection is only used by the thread that opened it, threads each open their own ExperimentIndex.
+    """
+
+    def __init__(self, root=PCL_EXP_PATH):
+        """Constructor for ExperimentIndex, opens the index and creates it if needed.
+
+        Args:
+            root (str): directory of the experiments, the index is stored in it
+        """
+        self.root = root
+        self.connection = sqlite3.connect(os.path.join(root, EXPERIMENT_INDEX_FILENAME), timeout=INDEX_BUSY_TIMEOUT_SEC)
+        self.connection.row_factory = sqlite3.Row
+        # readers don't block the writer, and commits aren't synced, losing the last updates only costs a rescan
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS experiments")
+                self.connection.execute("PRAGMA user_version = %i" % INDEX_SCHEMA_VERSION)
+            self.connection.execute(INDEX_SCHEMA)
+
+    def experiments(self):
+        """Lists the indexed experiments, the most recently captured first.
+
+        Returns:
+            list: index entries, dicts with the columns of the experiments table
+        """
+        rows = self.connection.execute(
+            "SELECT * FROM experiments ORDER BY last_capture IS NULL, last_capture DESC, name")
+        return [dict(row) for row in rows]
+
+    def get(self, name):
+        """Returns the index entry of an experiment, None if it isn't indexed."""
+        row = self.connection.execute("SELECT * FROM experiments WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def update_experiment(self, exp_path):
+        """Rescans an experiment and replaces its index entry.
+
+        Args:
+            exp_path (str): path to a plotcam experiment
+
+        Returns:
+            dict: the experiment's index entry
+        """
+        entry = scan_experiment(exp_path)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO experiments VALUES (:name, :captures, :plots, :last_plot_number, :first_capture, "
+                ":last_capture, :disk_bytes, :thumbnail, :signature, :indexed_at)", entry)
+        return entry
+
+    def ensure_experiment(self, exp_path):
+        """Indexes an experiment if it isn't yet, a new experiment or one made outside of the GUI.
+
+        Args:
+            exp_path (str): path to a plotcam experiment
+        """
+        if self.get(os.path.basename(os.path.normpath(exp_path))) is None:
+            self.update_experiment(exp_path)
+
+    def record_capture(self, exp_path, plot_number, captured_at, nbytes, thumbnail, new_plot):
+        """Adds a saved capture to an experiment's index entry, without rescanning the experiment.
+
+        Args:
+            exp_path (str): path to the experiment the capture was saved to, after its metadata was saved
+            plot_number (int): plot number of the capture
+            captured_at (float): when the frame was exposed, in the time.time() base
+            nbytes (int): bytes of the images saved
+            thumbnail (bytes): jpeg thumbnail of the color image
+            new_plot (bool): true for the first capture saved of the plot, the other cameras' don't add to the plots
+        """
+        values = {
+            "name": os.path.basename(os.path.normpath(exp_path)),
+            "plots": int(new_plot),
+            "plot_number": plot_number,
+            "captured_at": captured_at,
+            "nbytes": nbytes,
+            "thumbnail": thumbnail,
+            "signature": experiment_signature(exp_path),
+            "indexed_at": time.time(),
+        }
+        with self.connection:
+            updated = self.connection.execute(
+                """UPDATE experiments SET
+                       captures = captures + 1,
+                       plots = plots + :plots,
+                       last_plot_number = MAX(COALESCE(last_plot_number, :plot_number), :plot_number),
+                       first_capture = MIN(COALESCE(first_capture, :captured_at), :captured_at),
+                       last_capture = MAX(COALESCE(last_capture, :captured_at), :captured_at),
+                       disk_bytes = disk_bytes + :nbytes,
+                       thumbnail = :thumbnail,
+                       signature = :signature,
+                       indexed_at = :indexed_at
+                   WHERE name = :name""", values).rowcount
+        if not updated:
+            self.update_experiment(exp_path)
+
+    def refresh(self):
+        """Rescans the experiments changed since they were indexed, and forgets the ones deleted.
+        Yields after every experiment, so the caller can show it and stop in between.
+
+        Yields:
+            str: name of an experiment reindexed or forgotten
+        """
+        signatures = dict(self.connection.execute("SELECT name, signature FROM experiments"))
+        exp_paths = {os.path.basename(exp_path): exp_path for exp_path in find_experiments([self.root])}
+
+        for name in sorted(set(signatures) - set(exp_paths)):
+            with self.connection:
+                self.connection.execute("DELETE FROM experiments WHERE name = ?", (name,))
+            yield name
+
+        for name, exp_path in sorted(exp_paths.items()):
+            if signatures.get(name) != experiment_signature(exp_path):
+                self.update_experiment(exp_path)
+                yield name
+
+    def close(self):
+        """Closes the index."""
+        self.connection.close()
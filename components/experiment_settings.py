@@ -0,0 +1,51 @@
+"""
+This code handles the per experiment settings
+"""
+import json
+import os
+
+from util import EXPERIMENT_SETTINGS_FILENAME, LEGACY_COLOR_FORMAT, LEGACY_DEPTH_FORMAT, PNG_COMPRESSION
+from .durable_writes import DurableWriter
+
+
+def get_settings_path(exp_path):
+    """Returns the path of an experiment's settings file
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        str: path to the settings file
+    """
+    return os.path.join(exp_path, "Metadata", EXPERIMENT_SETTINGS_FILENAME)
+
+def load_experiment_settings(exp_path):
+    """Loads an experiment's settings.
+    Experiments without a settings file predate them, and get the legacy defaults.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+
+    Returns:
+        dict: the experiment settings
+    """
+    settings = {"color_format": LEGACY_COLOR_FORMAT, "png_compression": PNG_COMPRESSION,
+                "depth_format": LEGACY_DEPTH_FORMAT, "depth_processing": []}
+
+    settings_path = get_settings_path(exp_path)
+    if os.path.exists(settings_path):
+        with open(settings_path, "r") as f:
+            settings.update(json.load(f))
+
+    return settings
+
+def save_experiment_settings(exp_path, settings):
+    """Saves an experiment's settings, through a temporary file synced before it replaces the old settings.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+        settings (dict): the experiment settings
+    """
+    writer = DurableWriter("capture")
+    writer.write(get_settings_path(exp_path), lambda f: f.write(json.dumps(settings, indent=4).encode()))
+    writer.capture_done()
@@ -0,0 +1,148 @@
+"""
+This code handles the history of recent frames kept by the camera process
+"""
+import numpy as np
+
+from util import within_tolerance
+
+
+class FrameHistory:
+    """
+    The last nframes color and depth frames, with the timestamp, frame number, sharpness and level reading of each.
+    The frames are copied into buffers allocated up front, so the history's memory use is fixed by its size and resolution.
+    Capture requests pick the frame to save from it, without waiting for a new frame to be exposed.
+    """
+
+    def __init__(self, nframes, color_shape, depth_shape, color_dtype=np.uint8, depth_dtype=np.uint16):
+        """Constructor for FrameHistory.
+
+        Args:
+            nframes (int): number of frames kept, at least 1
+            color_shape (tuple): shape of the color frames
+            depth_shape (tuple): shape of the depth frames
+            color_dtype (dtype): type of the color frames
+            depth_dtype (dtype): type of the depth frames
+        """
+        if nframes < 1:
+            raise ValueError("A frame history needs at least 1 frame, got %i" % nframes)
+
+        self.nframes = nframes
+        self.color = np.empty((nframes,) + tuple(color_shape), dtype=color_dtype)
+        self.depth = np.empty((nframes,) + tuple(depth_shape), dtype=depth_dtype)
+        self.timestamps = np.full(nframes, np.nan)  # nan marks the slots not filled yet
+        self.frame_numbers = np.zeros(nframes, dtype=np.int64)
+        self.sharpness = np.zeros(nframes)
+        self.levels = np.zeros((nframes, 2))  # x, y accelerometer reading
+        self.newest = -1  # index of the newest frame
+
+    @staticmethod
+    def size_for(nframes, color_shape, depth_shape, color_dtype=np.uint8, depth_dtype=np.uint16):
+        """Returns the bytes the frames of a history take up.
+
+        Args:
+            nframes (int): number of frames kept
+            color_shape (tuple): shape of the color frames
+            depth_shape (tuple): shape of the depth frames
+            color_dtype (dtype): type of the color frames
+            depth_dtype (dtype): type of the depth frames
+
+        Returns:
+            int: size in bytes
+        """
+        return nframes * (int(np.prod(color_shape)) * np.dtype(color_dtype).itemsize +
+                          int(np.prod(depth_shape)) * np.dtype(depth_dtype).itemsize)
+
+    @property
+    def nbytes(self):
+        """Bytes taken up by the history."""
+        return (self.color.nbytes + self.depth.nbytes + self.timestamps.nbytes + self.frame_numbers.nbytes +
+                self.sharpness.nbytes + self.levels.nbytes)
+
+    @property
+    def newest_timestamp(self):
+        """Timestamp of the newest frame, nan if there are none."""
+        if self.newest < 0:
+            return np.nan
+        return float(self.timestamps[self.newest])
+
+    def push(self, color_arr, depth_arr, frame_number, timestamp, sharpness, level):
+        """Copies a frame into the history, over the oldest one.
+
+        Args:
+            color_arr (ndarray): color frame
+            depth_arr (ndarray): depth frame
+            frame_number (int): the camera's frame number
+            timestamp (float): sensor timestamp in ms
+            sharpness (float): sharpness score
+            level (tuple): x, y accelerometer reading when the frame arrived
+        """
+        ix = (self.newest + 1) % self.nframes
+        np.copyto(self.color[ix], color_arr)
+        np.copyto(self.depth[ix], depth_arr)
+        self.timestamps[ix] = timestamp
+        self.frame_numbers[ix] = frame_number
+        self.sharpness[ix] = sharpness
+        self.levels[ix] = level
+        self.newest = ix
+
+    def closest(self, timestamp):
+        """Finds the frame closest in time to a timestamp.
+
+        Args:
+            timestamp (float): time in ms
+
+        Returns:
+            int: index of the frame, None if the history is empty
+        """
+        if self.newest < 0:
+            return None
+        return int(np.nanargmin(np.abs(self.timestamps - timestamp)))
+
+    def sharpest(self, start, end, level_tolerance=None):
+        """Finds the sharpest frame stamped within a time window.
+
+        Args:
+            start (float): start of the window in ms
+            end (float): end of the window in ms
+            level_tolerance (float): only consider frames whose level reading is within this tolerance
+
+        Returns:
+            int: index of the frame, None if no frame qualifies
+        """
+        with np.errstate(invalid="ignore"):  # the empty slots are nan
+            candidates = (self.timestamps >= start) & (self.timestamps <= end)
+        if level_tolerance is not None:
+            candidates &= np.array([within_tolerance(x, y, level_tolerance) for x, y in self.levels])
+        if not candidates.any():
+            return None
+        return int(np.argmax(np.where(candidates, self.sharpness, -np.inf)))
+
+    def preceding(self, ix, nframes):
+        """Finds the frames stamped before a frame.
+
+        Args:
+            ix (int): index of the frame
+            nframes (int): max num of frames to find
+
+        Returns:
+            list: indices of up to nframes frames stamped right before the frame, oldest first
+        """
+        with np.errstate(invalid="ignore"):  # the empty slots are nan
+            earlier = np.flatnonzero(self.timestamps < self.timestamps[ix])
+        earlier = earlier[np.argsort(self.timestamps[earlier])]
+        return [int(i) for i in earlier[-nframes:]] if nframes > 0 else []
+
+    def frame_info(self, ix):
+        """Returns the frame number, sensor timestamp and sharpness of a frame.
+
+        Args:
+            ix (int): index of the frame
+
+        Returns:
+            dict: the frame's info
+        """
+        return {
+            "frame_number": int(self.frame_numbers[ix]),
+            "frame_timestamp": float(self.timestamps[ix]),
+            "sharpness": float(self.sharpness[ix]),
+        }
@@ -0,0 +1,51 @@
+"""
+This code handles the per frame quality metrics computed in the camera process
+"""
+import cv2
+import numpy as np
+
+from util import CANOPY_PERCENTILE, GROUND_PERCENTILE, SHARPNESS_DOWNSAMPLE
+
+
+def sharpness(color_arr, downsample=SHARPNESS_DOWNSAMPLE):
+    """Scores how sharp a frame is, the variance of the Laplacian of its greyscale.
+    Motion blur and a swinging camera smooth out the edges of the plants, which lowers the score.
+    The score is computed on every downsample-th pixel of the frame, so it is cheap enough for every frame,
+    and only comparable between frames of the same resolution.
+
+    Args:
+        color_arr (ndarray): (height, width, 3) bgr frame
+        downsample (int): stride the frame is subsampled with before scoring it
+
+    Returns:
+        float: the sharpness score, higher is sharper
+    """
+    # subsampling rather than resizing, blur lowers the score either way and the strided view costs nothing
+    grey = cv2.cvtColor(color_arr[::downsample, ::downsample], cv2.COLOR_BGR2GRAY)
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(grey, cv2.CV_16S))
+    return float(stddev[0, 0] ** 2)
+
+def depth_stats(depth_arr, depth_scale, canopy_percentile=CANOPY_PERCENTILE, ground_percentile=GROUND_PERCENTILE):
+    """Summarizes a depth frame looking down on the plants, for the live overlay.
+    The canopy and ground are a low and a high percentile of the depth, so a few stray pixels don't throw off the plant height.
+
+    Args:
+        depth_arr (ndarray): z16 depth frame, 0 is invalid, usually decimated
+        depth_scale (float): m per depth unit
+        canopy_percentile (float): percentile of the depth taken as the top of the canopy
+        ground_percentile (float): percentile of the depth taken as the ground
+
+    Returns:
+        dict: median_distance and plant_height in m, nan without valid pixels, and valid_ratio, the fraction of valid pixels
+    """
+    valid = depth_arr[depth_arr > 0]
+    if valid.size == 0:
+        return {"median_distance": np.nan, "plant_height": np.nan, "valid_ratio": 0.0}
+
+    # a single partition of the valid pixels for all three percentiles
+    canopy, median, ground = np.percentile(valid, (canopy_percentile, 50, ground_percentile)) * depth_scale
+    return {
+        "median_distance": float(median),
+        "plant_height": float(ground - canopy),
+        "valid_ratio": valid.size / depth_arr.size,
+    }
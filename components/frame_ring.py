@@ -0,0 +1,202 @@
+"""
+This code handles the shared memory frame ring buffer
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_ALIGNMENT = 64  # frames start on a cache line boundary
+
+# per frame values the producer publishes along with the frame, stored as float64 in the header, fields a ring doesn't use stay 0
+#   timestamp: sensor timestamp of the frame in ms, in the same time base as time.time()
+#   sharpness: frame_metrics.sharpness score of the color frame
+#   median_distance, plant_height, valid_ratio: frame_metrics.depth_stats of the depth frame
+INFO_FIELDS = ("timestamp", "sharpness", "median_distance", "plant_height", "valid_ratio")
+
+
+class FrameRing:
+    """
+    Ring buffer of frames in shared memory, written by a single producer process and read by any number of consumers.
+    Neither side ever waits on the other: the producer always writes the slot after the newest frame,
+    and consumers always read the newest complete frame.
+
+    The shared memory starts with a header of int64 counters, [latest sequence number, slot 0 sequence, slot 1 sequence, ...],
+    the int64 shape and float64 INFO_FIELDS of every slot, followed by the frames. Frames are numbered from 1. A slot's counter is 2*seq - 1 (odd) while the producer writes frame seq
+    into it and 2*seq once it is complete (seqlock), so a consumer can tell whether the slot was overwritten while it was reading.
+
+    Slots are sized for the ring's frame shape, frames of any shape with the same number of dimensions that fit into it can be published,
+    so the producer can change resolution without the ring being reallocated.
+    """
+
+    def __init__(self, nslots, frame_shape, dtype=np.uint8, name=None):
+        """Creates a new ring buffer, or attaches to an existing one if a name is given.
+
+        Args:
+            nslots (int): number of frames in the ring, at least 2
+            frame_shape (tuple): largest shape of a single frame
+            dtype (numpy.dtype): type of the frame elements
+            name (str): name of the shared memory block of an existing ring
+        """
+        if nslots < 2:
+            raise ValueError("A frame ring needs at least 2 slots, got %i" % nslots)
+
+        self.nslots = nslots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+
+        ndim = len(self.frame_shape)
+        counters_nbytes = (nslots + 1) * 8
+        shapes_nbytes = nslots * ndim * 8
+        info_nbytes = nslots * len(INFO_FIELDS) * 8
+        header_nbytes = -(-(counters_nbytes + shapes_nbytes + info_nbytes) // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+        self.frame_size = int(np.prod(self.frame_shape))  # elements a slot holds
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=header_nbytes + nslots * self.frame_size * self.dtype.itemsize)
+
+        header = np.ndarray((nslots + 1,), dtype=np.int64, buffer=self.shm.buf)
+        self._latest = header[:1]
+        self._slot_seqs = header[1:]
+        self._shapes = np.ndarray((nslots, ndim), dtype=np.int64, buffer=self.shm.buf, offset=counters_nbytes)
+        self._info = np.ndarray((nslots, len(INFO_FIELDS)), dtype=np.float64, buffer=self.shm.buf,
+                                offset=counters_nbytes + shapes_nbytes)
+        self._slots = np.ndarray((nslots, self.frame_size), dtype=self.dtype, buffer=self.shm.buf, offset=header_nbytes)
+        if create:
+            header[:] = 0
+            self._shapes[:] = self.frame_shape
+            self._info[:] = 0
+
+        self._write_seq = 0
+
+    @property
+    def name(self):
+        """str: name of the shared memory block, pass it to another process to attach to the ring"""
+        return self.shm.name
+
+    @property
+    def latest_seq(self):
+        """int: sequence number of the newest complete frame, 0 if no frame has been published"""
+        return int(self._latest[0])
+
+    def slot_view(self, slot, shape):
+        """Returns a slot as a frame of the given shape, the frame takes up the start of the slot.
+
+        Args:
+            slot (int): index of the slot
+            shape (tuple): shape of the frame
+
+        Returns:
+            ndarray: view of the slot
+        """
+        return self._slots[slot, :int(np.prod(shape))].reshape(shape)
+
+    def begin_write(self, shape=None):
+        """Producer side. Claims the slot after the newest frame.
+
+        Args:
+            shape (tuple): shape of the next frame, defaults to the ring's frame shape
+
+        Returns:
+            ndarray: the slot to write the next frame into, only valid until end_write is called
+        """
+        shape = self.frame_shape if shape is None else tuple(shape)
+        if len(shape) != len(self.frame_shape) or int(np.prod(shape)) > self.frame_size:
+            raise ValueError("A frame of shape %s doesn't fit in a ring of %s frames" % (shape, self.frame_shape))
+
+        self._write_seq = self.latest_seq + 1
+        slot = self._write_seq % self.nslots
+        self._slot_seqs[slot] = 2 * self._write_seq - 1
+        self._shapes[slot] = shape
+        return self.slot_view(slot, shape)
+
+    def end_write(self, **info):
+        """Producer side. Marks the claimed slot complete and publishes it as the newest frame.
+
+        Args:
+            info: values of the INFO_FIELDS of the frame, fields left out are 0
+
+        Returns:
+            int: sequence number of the published frame
+        """
+        slot = self._write_seq % self.nslots
+        self._info[slot] = [info.get(field, 0.0) for field in INFO_FIELDS]
+        self._slot_seqs[slot] = 2 * self._write_seq
+        self._latest[0] = self._write_seq
+        return self._write_seq
+
+    def publish(self, frame, **info):
+        """Producer side. Copies a frame into the ring and publishes it.
+
+        Args:
+            frame (ndarray): frame that fits in the ring's frame shape
+            info: values of the INFO_FIELDS of the frame
+
+        Returns:
+            int: sequence number of the published frame
+        """
+        np.copyto(self.begin_write(frame.shape), frame)
+        return self.end_write(**info)
+
+    def latest(self):
+        """Consumer side. Returns the newest complete frame without copying it.
+        Check is_intact once done with the frame, the producer may have overwritten it in the meantime.
+
+        Returns:
+            tuple: (sequence number, frame view), (0, None) if no frame has been published
+        """
+        seq = self.latest_seq
+        if seq == 0:
+            return 0, None
+        shape = self.shape(seq)
+        if int(np.prod(shape)) > self.frame_size:
+            shape = self.frame_shape # read while the producer lapped the ring, is_intact fails for it
+        return seq, self.slot_view(seq % self.nslots, shape)
+
+    def is_intact(self, seq):
+        """Consumer side. Tests whether frame seq is still in its slot.
+
+        Args:
+            seq (int): sequence number returned by latest
+
+        Returns:
+            bool: true if the slot has not been touched since frame seq was published
+        """
+        return int(self._slot_seqs[seq % self.nslots]) == 2 * seq
+
+    def shape(self, seq):
+        """Consumer side. Returns the shape of frame seq.
+        Like the frame itself, it is only valid if the frame is still intact afterwards.
+
+        Args:
+            seq (int): sequence number returned by latest
+
+        Returns:
+            tuple: the frame's shape
+        """
+        return tuple(int(n) for n in self._shapes[seq % self.nslots])
+
+    def info(self, seq, field):
+        """Consumer side. Returns a value the producer published along with frame seq.
+        Like the frame itself, it is only valid if the frame is still intact afterwards.
+
+        Args:
+            seq (int): sequence number returned by latest
+            field (str): one of INFO_FIELDS
+
+        Returns:
+            float: the value
+        """
+        return float(self._info[seq % self.nslots, INFO_FIELDS.index(field)])
+
+    def close(self):
+        """Detaches from the shared memory, the frame views must not be used afterwards."""
+        self._slots = None
+        self._latest = None
+        self._slot_seqs = None
+        self._shapes = None
+        self._info = None
+        self.shm.close()
+
+    def unlink(self):
+        """Frees the shared memory, call once from the process that created the ring."""
+        self.shm.unlink()
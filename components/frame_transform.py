@@ -0,0 +1,61 @@
+"""
+This code handles orienting frames before they are saved
+"""
+import numpy as np
+
+
+class FrameOrienter:
+    """
+    Rotates frames and reorders their colour channels in a single pass, straight into a preallocated output buffer.
+    The rotation and channel reversal are numpy views of the input, so the only work done per frame is one np.copyto,
+    and the output buffer is reused for every frame of the same shape.
+    """
+
+    def __init__(self, rotation=0, channel_order="bgr"):
+        """Constructor for FrameOrienter.
+
+        Args:
+            rotation (int): counterclockwise rotation in degrees, a multiple of 90
+            channel_order (str): channel order of the output, "bgr" like the camera or "rgb"
+        """
+        if rotation % 90:
+            raise ValueError("Frames can only be rotated by multiples of 90 degrees, got %i" % rotation)
+        if channel_order not in ("bgr", "rgb"):
+            raise ValueError("Unknown channel order %s" % channel_order)
+
+        self.rotation = rotation
+        self.channel_order = channel_order
+        self.out = None
+
+    def oriented_view(self, frame):
+        """Returns the oriented frame as a view of the input, without copying it.
+
+        Args:
+            frame (ndarray): (height, width) or (height, width, 3) bgr frame
+
+        Returns:
+            ndarray: the oriented view
+        """
+        view = np.rot90(frame, self.rotation // 90)
+        if self.channel_order == "rgb" and frame.ndim == 3:
+            view = view[..., ::-1]
+        return view
+
+    def apply(self, frame, out=None):
+        """Orients a frame.
+
+        Args:
+            frame (ndarray): (height, width) or (height, width, 3) bgr frame
+            out (ndarray): buffer to write the oriented frame to, defaults to the orienter's own buffer
+
+        Returns:
+            ndarray: the oriented frame, it is overwritten by the next call if the orienter's own buffer is used
+        """
+        view = self.oriented_view(frame)
+        if out is None:
+            if self.out is None or self.out.shape != view.shape or self.out.dtype != view.dtype:
+                self.out = np.empty(view.shape, dtype=view.dtype)
+            out = self.out
+
+        np.copyto(out, view)
+        return out
@@ -0,0 +1,258 @@
+"""
+This code handles the camera stream display
+"""
+import time
+
+from PyQt5.QtCore import QRect, QRectF, QSize, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter
+from PyQt5.QtWidgets import QWidget
+
+from util import DEPTH_OVERLAY_SIZE
+
+OVERLAY_MARGIN_PX = 8  # gap between the overlays and the edges of the frame
+
+
+class FrameView(QWidget):
+    """Displays the newest frame of a frame ring, painting straight from the shared memory slot.
+    The frame is wrapped in a QImage without copying it, and rotated and scaled to fit the widget by the painter,
+    keeping its aspect ratio, so there is no intermediate QPixmap.
+    The depth overlay shows a thumbnail of the newest decimated depth frame and its stats in the top left corner of the frame,
+    it is only rebuilt when the camera process published a new one, a few times a second.
+    The stats overlay shows the performance telemetry in the bottom left corner of the frame, as set by the GUI once a period.
+
+    Args:
+        QWidget (QWidget): Base class of all user interface objects.
+    """
+
+    framePainted = pyqtSignal(int)  # sequence number of the frame painted
+
+    def __init__(self, rotation=0, telemetry=None):
+        """Constructor for FrameView.
+
+        Args:
+            rotation (int): counterclockwise rotation of the frames in degrees, a multiple of 90
+            telemetry (telemetry.Telemetry): telemetry of the GUI, the painting of the frames is timed in it
+        """
+        super().__init__()
+        self.rotation = rotation
+        self.telemetry = telemetry
+        self.frame_ring = None
+        self.painted_seq = 0
+        self.painted_shape = None
+        self.frame_rect = QRectF()  # where the last frame was drawn, the overlays are placed on it
+
+        # depth overlay
+        self.depth_ring = None
+        self.show_depth_overlay = True
+        self.overlay_seq = 0  # sequence number of the depth frame the overlay shows
+        self.overlay_indices = None  # color table indices of the thumbnail, the image wraps them
+        self.overlay_image = None
+        self.overlay_text = ""
+        # index 0 is the invalid pixels, the rest run from blue for the farthest pixel to red for the nearest
+        self.depth_colors = [QColor(0, 0, 0).rgb()] + [QColor.fromHsv(round(240 * (255 - i) / 254), 255, 255).rgb()
+                                                       for i in range(1, 256)]
+
+        # stats overlay
+        self.stats_text = ""  # nothing is shown while empty
+        self.stats_font = QFont("monospace", 8)
+        self.stats_font.setStyleHint(QFont.TypeWriter)
+
+        # stats
+        self.frames_dropped = 0  # frames the camera published that were never displayed
+        self.frames_duplicated = 0  # refreshes without a new frame to display
+        self.frames_torn = 0  # frames overwritten by the camera while being painted
+
+    def set_frame_ring(self, frame_ring):
+        """Sets the frame ring to display, None to display nothing.
+
+        Args:
+            frame_ring (frame_ring.FrameRing): ring of BGR frames
+        """
+        self.frame_ring = frame_ring
+        self.painted_seq = 0
+        self.painted_shape = None
+        self.updateGeometry()
+        self.update()
+
+    def set_depth_ring(self, depth_ring):
+        """Sets the ring of decimated depth frames the overlay shows, None to show no overlay.
+
+        Args:
+            depth_ring (frame_ring.FrameRing): ring of z16 depth frames, with their depth stats
+        """
+        self.depth_ring = depth_ring
+        self.overlay_seq = 0
+        self.overlay_indices = None
+        self.overlay_image = None
+        self.overlay_text = ""
+        self.update()
+
+    def set_depth_overlay(self, visible):
+        """Shows or hides the depth overlay.
+
+        Args:
+            visible (bool): true to show it
+        """
+        self.show_depth_overlay = visible
+        self.update()
+
+    def set_stats_text(self, text):
+        """Sets the text of the stats overlay.
+
+        Args:
+            text (str): lines to show, empty to hide the overlay
+        """
+        self.stats_text = text
+        self.update()
+
+    def sizeHint(self):
+        """The size of the rotated frames, like a label showing them."""
+        if self.frame_ring is None:
+            return super().sizeHint()
+
+        height, width = (self.painted_shape or self.frame_ring.frame_shape)[:2]
+        if self.rotation % 180:
+            return QSize(height, width)
+        return QSize(width, height)
+
+    def refresh(self):
+        """Schedules a repaint if a new frame arrived since the last one painted.
+
+        Returns:
+            bool: true if a repaint was scheduled
+        """
+        if self.frame_ring is None:
+            return False
+
+        if self.frame_ring.latest_seq == self.painted_seq:
+            if self.painted_seq:
+                self.frames_duplicated += 1
+            return False
+
+        self.update()
+        return True
+
+    def paintEvent(self, event):
+        if self.frame_ring is None:
+            return
+
+        seq, frame = self.frame_ring.latest()
+        if frame is None:
+            return
+
+        start = time.perf_counter()
+        height, width, channel = frame.shape
+        image = QImage(frame.data, width, height, channel * width, QImage.Format_BGR888)
+
+        # draw the frame centered and rotated, as large as fits in the widget without distorting it,
+        # the bars left on the sides or above and below are black
+        rotated_width, rotated_height = (height, width) if self.rotation % 180 else (width, height)
+        scale = min(self.width() / rotated_width, self.height() / rotated_height)
+        self.frame_rect = QRectF((self.width() - rotated_width * scale) / 2, (self.height() - rotated_height * scale) / 2,
+                                 rotated_width * scale, rotated_height * scale)
+        painter = QPainter(self)
+        if round(self.frame_rect.width()) < self.width() or round(self.frame_rect.height()) < self.height():
+            painter.fillRect(self.rect(), Qt.black)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.translate(self.width() / 2, self.height() / 2)
+        painter.rotate(-self.rotation)  # qt rotates clockwise
+        painter.drawImage(QRectF(-width * scale / 2, -height * scale / 2, width * scale, height * scale), image)
+        if self.telemetry is not None:
+            self.telemetry.observe("display_convert", (time.perf_counter() - start) * 1000.0)
+
+        painter.resetTransform()
+        if self.show_depth_overlay and self.depth_ring is not None:
+            self.paint_depth_overlay(painter)
+        if self.stats_text:
+            self.paint_stats_overlay(painter)
+        painter.end()
+
+        if not self.frame_ring.is_intact(seq):
+            # the camera lapped the ring while the frame was painted, paint the newest one instead
+            self.frames_torn += 1
+            if self.telemetry is not None:
+                self.telemetry.count("frames_torn")
+            self.update()
+            return
+
+        if frame.shape != self.painted_shape:
+            # the stream changed resolution
+            self.painted_shape = frame.shape
+            self.updateGeometry()
+
+        if seq != self.painted_seq:
+            dropped = max(0, seq - self.painted_seq - 1)
+            self.frames_dropped += dropped
+            if self.telemetry is not None and dropped:
+                self.telemetry.count("frames_dropped", dropped)
+            self.painted_seq = seq
+            self.framePainted.emit(seq)
+
+    def update_depth_overlay(self):
+        """Rebuilds the overlay's thumbnail and readout if a new depth frame was published since."""
+        import numpy as np  # imported once the stream is up, so it doesn't hold up the window showing
+
+        seq, depth = self.depth_ring.latest()
+        if seq == self.overlay_seq or depth is None:
+            return
+
+        depth = depth.astype(np.int32)
+        distance, height, valid_ratio = (self.depth_ring.info(seq, field) for field in ("median_distance", "plant_height", "valid_ratio"))
+        if not self.depth_ring.is_intact(seq):
+            return  # overwritten while copied, the next paint picks up the newer one
+        self.overlay_seq = seq
+
+        # color the valid pixels by how near they are, relative to the nearest and farthest of the frame
+        indices = np.zeros(depth.shape, dtype=np.uint8)
+        valid = depth > 0
+        if valid.any():
+            near, far = depth[valid].min(), depth[valid].max()
+            indices[valid] = 255 - (depth[valid] - near) * 254 // max(far - near, 1)
+
+        # rotated like the frames
+        self.overlay_indices = np.ascontiguousarray(np.rot90(indices, self.rotation // 90))
+        height_px, width_px = self.overlay_indices.shape
+        self.overlay_image = QImage(self.overlay_indices.data, width_px, height_px, width_px, QImage.Format_Indexed8)
+        self.overlay_image.setColorTable(self.depth_colors)
+
+        def metres(value):
+            return "-" if np.isnan(value) else "%.2f m" % value
+        self.overlay_text = "Distance %s\nHeight %s\nCoverage %.0f%%" % (metres(distance), metres(height), 100 * valid_ratio)
+
+    def paint_depth_overlay(self, painter):
+        """Paints the depth thumbnail and the readout below it in the top left corner.
+
+        Args:
+            painter (QPainter): painter of the view, untransformed
+        """
+        self.update_depth_overlay()
+        if self.overlay_image is None:
+            return
+
+        width = self.frame_rect.width() * DEPTH_OVERLAY_SIZE
+        thumbnail = QRectF(self.frame_rect.left() + OVERLAY_MARGIN_PX, self.frame_rect.top() + OVERLAY_MARGIN_PX, width,
+                           width * self.overlay_image.height() / self.overlay_image.width())
+        painter.drawImage(thumbnail, self.overlay_image)
+
+        # the readout goes on a dark band so it stays legible over the plants
+        text_size = painter.fontMetrics().boundingRect(QRect(), Qt.AlignLeft, self.overlay_text).size()
+        band = QRectF(thumbnail.left(), thumbnail.bottom(), max(width, text_size.width() + 2 * OVERLAY_MARGIN_PX),
+                      text_size.height() + OVERLAY_MARGIN_PX)
+        painter.fillRect(band, QColor(0, 0, 0, 160))
+        painter.setPen(Qt.white)
+        painter.drawText(band.adjusted(OVERLAY_MARGIN_PX, OVERLAY_MARGIN_PX / 2, 0, 0), Qt.AlignLeft, self.overlay_text)
+
+    def paint_stats_overlay(self, painter):
+        """Paints the stats text on a dark band in the bottom left corner.
+
+        Args:
+            painter (QPainter): painter of the view, untransformed
+        """
+        painter.setFont(self.stats_font)
+        text_size = painter.fontMetrics().boundingRect(QRect(), Qt.AlignLeft, self.stats_text).size()
+        band = QRectF(self.frame_rect.left() + OVERLAY_MARGIN_PX,
+                      self.frame_rect.bottom() - OVERLAY_MARGIN_PX - text_size.height() - OVERLAY_MARGIN_PX,
+                      text_size.width() + OVERLAY_MARGIN_PX, text_size.height() + OVERLAY_MARGIN_PX)
+        painter.fillRect(band, QColor(0, 0, 0, 160))
+        painter.setPen(Qt.white)
+        painter.drawText(band.adjusted(OVERLAY_MARGIN_PX / 2, OVERLAY_MARGIN_PX / 2, 0, 0), Qt.AlignLeft, self.stats_text)
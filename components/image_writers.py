@@ -0,0 +1,191 @@
+"""
+This code handles writing captured frames to disk
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+from util import JPEG_QUALITY, LEGACY_COLOR_FORMAT, PNG_COMPRESSION, resolution_width
+from .durable_writes import DurableWriter
+
+# rotated depth frame shapes by number of pixels, the legacy txt format is flat so the shape has to be inferred
+TXT_DEPTH_SHAPES = {height * width: (height, width) for height, width in resolution_width.items()}
+
+
+# color format -> (file extension, opencv encoder parameters)
+COLOR_FORMATS = {
+    "bmp": (".bmp", []),  # uncompressed 24-bit bitmap
+    "png": (".png", []),  # lossless, save_color sets the compression level, it is set per experiment
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),  # lossless above quality 100, smallest and slowest to encode
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]),  # lossy
+}
+
+def write_depth_txt(f, depth_arr):
+    """Legacy writer, one formatted value per line."""
+    np.savetxt(f, depth_arr, fmt="%.3f \n", newline='')
+
+def write_depth_npy(f, depth_arr):
+    """Raw uint16 numpy array."""
+    np.save(f, depth_arr.astype(np.uint16, copy=False))
+
+def write_depth_npz(f, depth_arr):
+    """Compressed uint16 numpy archive, the array is stored under the "depth" key."""
+    np.savez_compressed(f, depth=depth_arr.astype(np.uint16, copy=False))
+
+def write_depth_png(f, depth_arr):
+    """Lossless 16-bit greyscale PNG."""
+    encoded, buffer = cv2.imencode(".png", depth_arr.astype(np.uint16, copy=False))
+    if not encoded:
+        raise IOError("Could not encode the depth as png")
+    f.write(buffer)
+
+# depth format -> (file extension, writer of the depth to a binary file object)
+DEPTH_FORMATS = {
+    "txt": (".txt", write_depth_txt),
+    "npy": (".npy", write_depth_npy),
+    "npz": (".npz", write_depth_npz),
+    "png": (".png", write_depth_png),
+}
+
+COLOR_EXTENSIONS = tuple(extension for extension, _ in COLOR_FORMATS.values())  # extensions of the color images
+DEPTH_EXTENSIONS = tuple(extension for extension, _ in DEPTH_FORMATS.values())  # extensions of the depth files
+
+
+def save_color(color_arr, color_dir, image_name, color_format=LEGACY_COLOR_FORMAT, png_compression=PNG_COMPRESSION,
+               writer=None):
+    """Saves a color frame in the given format.
+    The frame is encoded in memory before it is written, so the encoding time and size can be told apart from the disk's.
+
+    Args:
+        color_arr (ndarray): BGR color frame
+        color_dir (str): directory to save the color frame to
+        image_name (str): root name of the file, the format's extension will be tacked on
+        color_format (str): one of COLOR_FORMATS
+        png_compression (int): zlib level of the png format, 0-9
+        writer (durable_writes.DurableWriter): writes the file, by default one leaving it to the OS to sync
+
+    Returns:
+        tuple: (path of the written file, bytes written, seconds spent encoding)
+    """
+    extension, params = COLOR_FORMATS[color_format]
+    if color_format == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+
+    start = time.perf_counter()
+    encoded, buffer = cv2.imencode(extension, color_arr, params)
+    encode_sec = time.perf_counter() - start
+    if not encoded:
+        raise IOError("Could not encode %s as %s" % (image_name, color_format))
+
+    fname = os.path.join(color_dir, image_name + extension)
+    (writer or DurableWriter("none")).write(fname, lambda f: f.write(buffer))
+    return fname, buffer.size, encode_sec
+
+def encode_thumbnail(color_arr, size, rotation=0, jpeg_quality=JPEG_QUALITY):
+    """Shrinks a color frame to a jpeg thumbnail in memory.
+    The frame is shrunk before it is rotated, so rotating the camera's frames costs next to nothing.
+
+    Args:
+        color_arr (ndarray): BGR color frame
+        size (int): long side of the thumbnail in px, smaller frames aren't enlarged
+        rotation (int): counterclockwise rotation in degrees, a multiple of 90
+        jpeg_quality (int): quality of the jpeg, 0-100
+
+    Returns:
+        bytes: the jpeg
+    """
+    scale = size / max(color_arr.shape[:2])
+    if scale < 1:
+        color_arr = cv2.resize(color_arr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if rotation % 360:
+        color_arr = np.rot90(color_arr, rotation // 90)
+
+    encoded, buffer = cv2.imencode(".jpg", color_arr, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not encoded:
+        raise IOError("Could not encode a thumbnail")
+    return buffer.tobytes()
+
+def save_depth(depth_arr, depth_dir, image_name, depth_format, writer=None):
+    """Saves a depth frame in the given format.
+
+    Args:
+        depth_arr (ndarray): z16 depth frame
+        depth_dir (str): directory to save the depth frame to
+        image_name (str): root name of the file, the format's extension will be tacked on
+        depth_format (str): one of DEPTH_FORMATS
+        writer (durable_writes.DurableWriter): writes the file, by default one leaving it to the OS to sync
+
+    Returns:
+        str: path of the written file
+    """
+    extension, write_depth = DEPTH_FORMATS[depth_format]
+    fname = os.path.join(depth_dir, image_name + extension)
+    (writer or DurableWriter("none")).write(fname, lambda f: write_depth(f, depth_arr))
+    return fname
+
+def load_depth(fname):
+    """Loads a depth frame written in any of the depth formats.
+
+    Args:
+        fname (str): path to the depth file
+
+    Returns:
+        ndarray: uint16 depth frame
+    """
+    extension = os.path.splitext(fname)[1].lower()
+    if extension == ".npy":
+        return np.load(fname)
+    if extension == ".npz":
+        with np.load(fname) as archive:
+            return archive["depth"]
+    if extension == ".png":
+        return cv2.imread(fname, cv2.IMREAD_UNCHANGED)
+    if extension == ".txt":
+        depth_arr = np.fromfile(fname, sep=" ")
+        if depth_arr.size not in TXT_DEPTH_SHAPES:
+            raise ValueError("Can't infer the frame shape of %s from its %i values" % (fname, depth_arr.size))
+        return depth_arr.reshape(TXT_DEPTH_SHAPES[depth_arr.size]).astype(np.uint16)
+
+    raise ValueError("Unknown depth format %s" % extension)
+
+def convert_depth_file(fname, depth_format, remove_original=False):
+    """Converts a depth file to another depth format, the new file is written beside the original.
+
+    Args:
+        fname (str): path to the depth file
+        depth_format (str): one of DEPTH_FORMATS
+        remove_original (bool): delete the original once converted
+
+    Returns:
+        str: path of the converted file
+    """
+    depth_dir, basename = os.path.split(fname)
+    image_name = os.path.splitext(basename)[0]
+    new_fname = save_depth(load_depth(fname), depth_dir, image_name, depth_format)
+
+    if remove_original and os.path.abspath(new_fname) != os.path.abspath(fname):
+        os.remove(fname)
+    return new_fname
+
+def find_experiments(paths):
+    """Finds the experiment directories among paths, a path that isn't an experiment is searched for experiments one level down.
+
+    Args:
+        paths (list): paths to experiments or directories of experiments
+
+    Returns:
+        list: paths to the experiments, sorted
+    """
+    def is_experiment(path):
+        return os.path.isdir(os.path.join(path, "RGB")) and os.path.isdir(os.path.join(path, "Depth"))
+
+    experiments = set()
+    for path in paths:
+        if is_experiment(path):
+            experiments.add(os.path.normpath(path))
+        elif os.path.isdir(path):
+            experiments.update(os.path.normpath(os.path.join(path, name)) for name in os.listdir(path)
+                               if is_experiment(os.path.join(path, name)))
+    return sorted(experiments)
@@ -0,0 +1,182 @@
+"""
+This code handles the accelerometer level detection
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from util import (ACCELEROMETER_CHANGE_TRIGGER, ACCELEROMETER_DATA_INTERVAL_MS, LEVEL_HISTORY_SIZE, LEVEL_SMOOTHING,
+                  LEVEL_TOLERANCE, TARGET_MOVE_THRESHOLD, within_tolerance)
+
+log = logging.getLogger("pcl_levelmonitor")
+
+
+class LevelMonitor(QObject):
+    """Listens to the Phidget22 accelerometer and tells the GUI whether the camera is level.
+    The accelerometer is looked for in the background, and pushes its readings from the Phidget22 event thread once attached,
+    where they are smoothed with an exponential moving average.
+    Signals are only emitted when the level state flips or the smoothed reading moves past a threshold,
+    so the GUI thread does no work while the camera is held still.
+
+    Args:
+        QObject (QObject): Base class of all Qt objects.
+    """
+
+    attachedChanged = pyqtSignal(bool)  # true if the accelerometer attached, false if it was detached
+    levelChanged = pyqtSignal(bool)  # true if the camera became level
+    targetMoved = pyqtSignal(float, float)  # smoothed x, y reading
+
+    def __init__(self, data_interval_ms=ACCELEROMETER_DATA_INTERVAL_MS, change_trigger=ACCELEROMETER_CHANGE_TRIGGER,
+                 smoothing=LEVEL_SMOOTHING, move_threshold=TARGET_MOVE_THRESHOLD, tolerance=LEVEL_TOLERANCE, shared_reading=None):
+        """Constructor for LevelMonitor.
+
+        Args:
+            data_interval_ms (int): ms between readings while the accelerometer moves
+            change_trigger (float): change in g the accelerometer must see to report a reading
+            smoothing (float): weight of a new reading in the moving average, 1 disables smoothing
+            move_threshold (float): distance in g the smoothed reading must move for targetMoved to be emitted
+            tolerance (float): the absolute value both axes must be within for the camera to be level
+            shared_reading (multiprocessing.Array): x, y array to keep the smoothed reading in, for other processes to read
+        """
+        super().__init__()
+        self.data_interval_ms = data_interval_ms
+        self.change_trigger = change_trigger
+        self.smoothing = smoothing
+        self.move_threshold = move_threshold
+        self.tolerance = tolerance
+        self.shared_reading = shared_reading
+
+        self.accelerometer = None
+        self.is_attached = False
+        self.x = 0.0
+        self.y = 0.0
+        self.is_level = within_tolerance(self.x, self.y, self.tolerance)
+        self.target_x = self.x  # last reading targetMoved was emitted for
+        self.target_y = self.y
+        self.has_reading = False
+
+        self.samples = deque(maxlen=LEVEL_HISTORY_SIZE)  # (time in ms, x, y) of the latest smoothed readings
+        self.samples_lock = threading.Lock()
+
+    def start(self):
+        """Starts looking for the accelerometer without waiting for it, attachedChanged is emitted once it attaches.
+
+        Returns:
+            bool: true if the accelerometer is being looked for, false if the Phidget22 library couldn't be loaded
+        """
+        try:
+            # imported here, loading the Phidget22 library takes a while
+            from Phidget22.Devices.Accelerometer import Accelerometer
+
+            self.accelerometer = Accelerometer()
+            self.accelerometer.setOnAttachHandler(self.on_attach)
+            self.accelerometer.setOnDetachHandler(self.on_detach)
+            self.accelerometer.setOnAccelerationChangeHandler(self.on_acceleration_change)
+            self.accelerometer.open()
+        except Exception as e: # the Phidget22 library raises OSError when its usb driver is missing
+            log.warning("There is no accelerometer connected: %s" % e)
+            self.stop()
+            return False
+
+        log.info("Looking for the accelerometer")
+        return True
+
+    def stop(self):
+        """Closes the accelerometer."""
+        if self.accelerometer is None:
+            return
+
+        try:
+            self.accelerometer.setOnAttachHandler(None)
+            self.accelerometer.setOnDetachHandler(None)
+            self.accelerometer.setOnAccelerationChangeHandler(None)
+            self.accelerometer.close()
+        except Exception as e:
+            log.warning("Could not close the accelerometer: %s" % e)
+        self.accelerometer = None
+        self.is_attached = False
+
+    def on_attach(self, accelerometer):
+        """Configures the accelerometer once it attached, runs on the Phidget22 event thread.
+
+        Args:
+            accelerometer (Accelerometer): the accelerometer that attached
+        """
+        from Phidget22.PhidgetException import PhidgetException
+
+        # the device may not support the requested rate or sensitivity, keep its defaults then
+        try:
+            data_interval_ms = max(self.data_interval_ms, accelerometer.getMinDataInterval())
+            accelerometer.setDataInterval(data_interval_ms)
+            accelerometer.setAccelerationChangeTrigger(self.change_trigger)
+            log.debug("Accelerometer reporting every %i ms, on changes over %g g" % (data_interval_ms, self.change_trigger))
+        except PhidgetException as e:
+            log.warning("Could not configure the accelerometer: %s" % e.details)
+
+        self.is_attached = True
+        self.attachedChanged.emit(True)
+
+    def on_detach(self, accelerometer):
+        """Lets the GUI know the accelerometer was unplugged, runs on the Phidget22 event thread.
+
+        Args:
+            accelerometer (Accelerometer): the accelerometer that detached
+        """
+        self.is_attached = False
+        self.attachedChanged.emit(False)
+
+    def on_acceleration_change(self, accelerometer, acceleration, timestamp):
+        """Smooths a new reading, runs on the Phidget22 event thread.
+
+        Args:
+            accelerometer (Accelerometer): the accelerometer reporting
+            acceleration (list): x, y, z acceleration in g
+            timestamp (float): ms since the accelerometer was opened
+        """
+        self.add_reading(acceleration[0], acceleration[1])
+
+    def add_reading(self, x, y):
+        """Folds a reading into the moving average, and lets the GUI know if the level state flipped or the target moved.
+
+        Args:
+            x (float): x acceleration in g
+            y (float): y acceleration in g
+        """
+        if self.has_reading:
+            self.x += self.smoothing * (x - self.x)
+            self.y += self.smoothing * (y - self.y)
+        else:
+            # nothing to average with yet
+            self.x, self.y = x, y
+            self.has_reading = True
+
+        with self.samples_lock:
+            self.samples.append((time.time() * 1000.0, self.x, self.y))
+        if self.shared_reading is not None:
+            self.shared_reading[:] = (self.x, self.y)
+
+        if max(abs(self.x - self.target_x), abs(self.y - self.target_y)) > self.move_threshold:
+            self.target_x, self.target_y = self.x, self.y
+            self.targetMoved.emit(self.x, self.y)
+
+        is_level = within_tolerance(self.x, self.y, self.tolerance)
+        if is_level != self.is_level:
+            self.is_level = is_level
+            self.levelChanged.emit(is_level)
+
+    def closest_sample(self, timestamp):
+        """Finds the smoothed reading sampled closest in time to a timestamp.
+
+        Args:
+            timestamp (float): time in ms, in the same time base as time.time()
+
+        Returns:
+            tuple: (time in ms, x, y) of the reading, None if there are no readings
+        """
+        with self.samples_lock:
+            if not self.samples:
+                return None
+            return min(self.samples, key=lambda sample: abs(sample[0] - timestamp))
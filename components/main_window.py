@@ -9,59 +9,78 @@ import logging
 import os
 import time
 import multiprocessing
-from multiprocessing import Process, Value, shared_memory
 from datetime import datetime
-from ntpath import basename
-import numpy as np
-import webbrowser
 
-from Phidget22.Devices.Accelerometer import *
-from Phidget22.Phidget import *
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QPointF, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QIcon, QPixmap
-from PyQt5.QtWidgets import QGridLayout, QMainWindow, QSizePolicy, QWidget, QFileDialog, QAction, QActionGroup
+from PyQt5.QtWidgets import QGridLayout, QMainWindow, QWidget, QAction, QActionGroup, QDockWidget, QLabel
 from PyQt5.uic import loadUi
-from PyQt5.QtMultimedia import QSound
 
-from util import (ACCELEROMETER_PERIOD_MS, FRAME_NCHANNELS, ICON_IMAGE_PATH, ALERT_AUDIO_PATH,
-                  LEVEL_TOLERANCE, PCL_EXP_PATH, PLATFORM, PLOT_NUMBER_PADDING, SM_BUF_SIZE, 
+from util import (AUTO_CAPTURE_SHARPNESS_RATIO, FRAME_ROTATION, FRAME_NCHANNELS, ICON_IMAGE_PATH, ALERT_AUDIO_PATH,
+                  METADATA_UPDATE_PERIOD_SEC, PCL_EXP_PATH, PLATFORM, PLOT_NUMBER_PADDING, SM_BUF_SIZE, 
                   PROGRAM_TITLE, TARGET_ICON_PATH, HELP_DOCUMENTATION_URL, disable_logging,
-                  frame_to_pixmap, within_tolerance, pcl_config)
-
-from .depth_camera_feed import generate_frames
+                  ACCELEROMETER_ATTACH_TIMEOUT_MS, STREAM_CONFIGURE_TIMEOUT_SEC, pcl_config, resolution_width, startup_profile,
+                  DISK_DEGRADE_PLOTS, DISK_RESERVE_MB, DISK_WARN_PLOTS, SAVE_BACKLOG_DEGRADE, SAVE_BACKLOG_RESTORE, STATUS_MESSAGE_MS,
+                  TELEMETRY_PERIOD_SEC)
+
+# the camera process, frame ring, experiment index and dialog modules are imported when first used,
+# they pull in numpy and opencv which would otherwise hold up the window showing
+from .capture_watcher import CaptureWatcher
+from .disk_monitor import DEGRADED_FORMATS, DiskMonitor, SaveStats
+from .experiment_settings import load_experiment_settings
+from .frame_view import FrameView
+from .level_monitor import LevelMonitor
 from .metadata import Metadata
-from .new_experiment_dialog import NewExperimentPage
+from .review_strip import ReviewStrip
 from .target import Target
+from .telemetry import Telemetry, TelemetryCollector
 from .about_dialog import AboutPage
 
 
 log = logging.getLogger("pcl_mainwindow")
 
 class PlotCamLiteWindow_Monitor(QMainWindow):
+    camerasFound = pyqtSignal(object, list)  # camera listing, serial numbers of the cameras found
+
     def __init__(self):
         super().__init__()
 
         # init variables
-        self.depth_cam_proc = None
-        self.accelerometer = None
+        self.camera_streams = []  # a stream per camera, the first is displayed by default
+        self.camera_discovery = None  # listing of the cameras in progress
+        self.frame_ring = None  # ring of the camera displayed
+        self.displayed_camera = 0
+        self.level_monitor = None
         self.metadata = None
+        self.experiment_index = None  # opened when first used
+        self.recovered_experiments = set()  # experiments checked for a capture interrupted by a crash, this session
+        self.alert = None
+        self.devices_started = False
+        self.first_frame_painted = False
 
         self.experiment_path = None
-        self.is_streaming = multiprocessing.Value('i', False)
+        self.experiment_settings = None
+        self.level_reading = multiprocessing.Array('d', 2)  # x, y accelerometer reading the camera process tags frames with
 
         self.current_plot_number = 0
-        self.x = 0.0
-        self.y = 0.0
+        self.next_request_id = 0
+        self.pending_captures = {}  # request id -> capture request, for requests waiting on a save worker
+        self.color_encoding = {}  # color format -> (num of images saved, total ms encoding them, total bytes)
+        self.disk_free = None  # bytes free on the experiment's disk, from the last check less the captures saved since
+        self.disk_warned = False  # the warning that few plots fit on the disk was shown
+        self.degraded = None  # reason auto-degrade switched the captures to DEGRADED_FORMATS, None for the experiment's formats
+        self.waitingForLevel = False
 
+        self.camerasFound.connect(self.on_cameras_found)
         self.init_ui()
         self.title = "PlotCam Lite - %s and PyQt5" % PLATFORM
 
     def init_ui(self):
         """
         Initalizes the UI.
-        Connects methods to the buttons and begins the background processes.
+        Connects methods to the buttons, the camera and accelerometer are started once the window is shown.
         """
         if not pcl_config["monitor"]:
             self.setFixedSize(850,630)
@@ -78,11 +97,20 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         # Add actions to menu bar
         self.add_actions()
 
-        # Start the camera stream
-        self.start_stream()
+        # Set up the performance telemetry, before the camera view times its painting in it
+        self.setup_telemetry()
 
-        # Start the accelerometer
-        self.start_accelerometer()
+        # Set up the camera view
+        self.setup_camera_view()
+
+        # Set up the review strip of the last captures
+        self.setup_review_strip()
+
+        # Set up the level target and monitor
+        self.setup_level_monitor()
+
+        # Set up the free space status of the experiment's disk
+        self.setup_disk_monitor()
 
         # Connect buttons to methods
         self.take_picture_button.clicked.connect(self.take_picture)
@@ -94,7 +122,49 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         # disable the take pic btn until an experiment is set
         self.take_picture_button.setEnabled(False)
 
-        self.alert = QSound(ALERT_AUDIO_PATH)
+        # periodically force the metadata journal to disk
+        self.metadata_timer = QtCore.QTimer()
+        self.metadata_timer.timeout.connect(self.sync_metadata)
+        self.metadata_timer.setInterval(METADATA_UPDATE_PERIOD_SEC * 1000)
+        self.metadata_timer.start()
+
+    def showEvent(self, event):
+        """
+        Starts the devices the first time the window is shown, once it has been painted.
+        """
+        super().showEvent(event)
+        if not self.devices_started:
+            self.devices_started = True
+            startup_profile.mark("show main window")
+            QtCore.QTimer.singleShot(0, self.start_devices)
+
+    def start_devices(self):
+        """
+        Starts the camera stream and the accelerometer, both are looked for in the background while the GUI stays responsive.
+        The camera process waits for a camera to be connected, and the Phidget22 library attaches the accelerometer when it finds it.
+        """
+        # the window was closed before the event loop got to it
+        if not self.isVisible():
+            return
+
+        # Start the camera stream, unless the stream was already configured from the menu
+        if not self.camera_streams and self.camera_discovery is None:
+            self.start_stream()
+            startup_profile.mark("spawn camera process")
+
+        # Start the accelerometer
+        self.start_accelerometer()
+        startup_profile.mark("open accelerometer")
+
+        # imported here, loading the multimedia library takes a while
+        try:
+            from PyQt5.QtMultimedia import QSound
+        except ImportError as e:
+            log.warning("No shutter sound, the multimedia library could not be loaded: %s" % e)
+        else:
+            self.alert = QSound(ALERT_AUDIO_PATH)
+        startup_profile.mark("load shutter sound")
+        startup_profile.report()
 
     def add_actions(self):
         """
@@ -119,11 +189,6 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         self.action640x480.setCheckable(True)
         self.action1280x720.setCheckable(True)
 
-        if pcl_config["stream_height"] == 640:
-            self.action640x480.setChecked(True)
-        else:
-            self.action1280x720.setChecked(True)
-
         self.fpsGroup = QActionGroup(self)
         self.fpsGroup.addAction(self.action15)
         self.fpsGroup.addAction(self.action30)
@@ -132,15 +197,55 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         self.action15.setCheckable(True)
         self.action30.setCheckable(True)
 
-        if pcl_config["stream_fps"] == 15:
-            self.action15.setChecked(True)
-        else:
-            self.action30.setChecked(True)
+        self.update_stream_actions()
+
+        # the cameras are listed once their streams start
+        self.menuCamera = self.menuEdit.addMenu("Camera")
+        self.cameraGroup = QActionGroup(self)
+        self.cameraGroup.setExclusive(True)
+
+        self.actionAutoCapture = QAction("Auto Capture", self)
+        self.actionAutoCapture.setCheckable(True)
+        self.actionAutoCapture.setChecked(pcl_config["auto_capture"])
+        self.actionAutoCapture.toggled.connect(self.set_auto_capture)
+        self.menuEdit.addAction(self.actionAutoCapture)
+
+        self.actionDepthOverlay = QAction("Depth Overlay", self)
+        self.actionDepthOverlay.setCheckable(True)
+        self.actionDepthOverlay.setChecked(pcl_config["depth_overlay"])
+        self.actionDepthOverlay.toggled.connect(self.set_depth_overlay)
+        self.menuEdit.addAction(self.actionDepthOverlay)
+
+        self.actionAutoDegrade = QAction("Auto Degrade Formats", self)
+        self.actionAutoDegrade.setCheckable(True)
+        self.actionAutoDegrade.setChecked(pcl_config["auto_degrade"])
+        self.actionAutoDegrade.toggled.connect(self.set_auto_degrade)
+        self.menuEdit.addAction(self.actionAutoDegrade)
+
+        self.actionStatsOverlay = QAction("Stats Overlay", self)
+        self.actionStatsOverlay.setCheckable(True)
+        self.actionStatsOverlay.setChecked(pcl_config["stats_overlay"])
+        self.actionStatsOverlay.toggled.connect(self.set_stats_overlay)
+        self.menuEdit.addAction(self.actionStatsOverlay)
 
         # Help Menu
         self.actionAbout.triggered.connect(self.about_dialog)
         self.actionDocumentation.triggered.connect(lambda: self.open_URL(HELP_DOCUMENTATION_URL))
 
+    def update_stream_actions(self):
+        """
+        Checks the resolution and fps menu actions of the current stream configuration.
+        """
+        if pcl_config["stream_height"] == 640:
+            self.action640x480.setChecked(True)
+        else:
+            self.action1280x720.setChecked(True)
+
+        if pcl_config["stream_fps"] == 15:
+            self.action15.setChecked(True)
+        else:
+            self.action30.setChecked(True)
+
     def open_URL(self, url):
         """
         Opens specified URL
@@ -148,6 +253,7 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         Args:
             url ([string]): [The URL to open, can be formatted using QUrl]
         """
+        import webbrowser
         webbrowser.open(url)
 
     def set_res(self, width, height):
@@ -169,6 +275,50 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         """
         self.configure_stream(pcl_config["stream_width"], pcl_config["stream_height"], fps)
 
+    def set_auto_capture(self, enabled):
+        """
+        Turns auto-capture on or off, a picture waiting on the camera is handled by the new mode.
+
+        Args:
+            enabled (bool): true to wait for the camera to be steady and pick the sharpest frame
+        """
+        log.info("Auto-capture %s" % ("on" if enabled else "off"))
+        pcl_config["auto_capture"] = enabled
+        self.dwell_timer.stop()
+        if self.waitingForLevel:
+            self.take_picture()
+
+    def set_depth_overlay(self, visible):
+        """
+        Shows or hides the distance, plant height and depth coverage over the stream.
+
+        Args:
+            visible (bool): true to show the depth overlay
+        """
+        pcl_config["depth_overlay"] = visible
+        self.camera_view.set_depth_overlay(visible)
+
+    def set_auto_degrade(self, enabled):
+        """
+        Turns auto-degrade on or off, switching the formats of the next captures right away if called for.
+
+        Args:
+            enabled (bool): true to save captures in cheaper formats while the disk is nearly full or the saves fall behind
+        """
+        log.info("Auto-degrade %s" % ("on" if enabled else "off"))
+        pcl_config["auto_degrade"] = enabled
+        self.update_disk_status()
+
+    def set_stats_overlay(self, visible):
+        """
+        Shows or hides the performance telemetry over the stream.
+
+        Args:
+            visible (bool): true to show the stats overlay
+        """
+        pcl_config["stats_overlay"] = visible
+        self.camera_view.set_stats_text(self.telemetry_collector.overlay_text() if visible else "")
+
     def set_view(self, view_type):
         """
         Set View Type of the window
@@ -180,48 +330,112 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
 
     def start_stream(self):
         """
-        Start the camera stream.
-        Creates a seperate process for the stream, and interacts with the frames through shared memory.
+        Start the camera streams.
+        Every RealSense camera connected gets its own camera process, streaming into its own ring buffer in shared memory.
+        The cameras are listed in the background, their streams start once they are found.
+        """
+        self.camera_start_time = time.perf_counter()
+
+        # the simulated and replayed cameras, and the cameras given on the command line, need no listing
+        if pcl_config["camera"] != "realsense":
+            self.start_camera_streams([None])
+        elif pcl_config["camera_serials"]:
+            self.start_camera_streams(pcl_config["camera_serials"])
+        else:
+            self.discover_cameras()
+
+    def discover_cameras(self):
+        """
+        Lists the RealSense cameras connected in a separate process, pyrealsense2 can't be loaded in the GUI process.
+        camerasFound is emitted with their serial numbers once they are listed.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from .depth_camera_feed import get_camera_serial
+
+        executor = ProcessPoolExecutor(max_workers=1)
+        self.camera_discovery = executor.submit(get_camera_serial)
+        self.camera_discovery.add_done_callback(self.on_discovery_done)
+        executor.shutdown(wait=False)
+
+    def on_discovery_done(self, discovery):
+        """
+        Hands the serial numbers of the cameras found to the GUI thread, runs on the executor's thread.
+
+        Args:
+            discovery (concurrent.futures.Future): the listing of the cameras
+        """
+        try:
+            cameras = discovery.result() or []
+        except Exception as e:
+            log.warning("Could not list the cameras: %s" % e)
+            cameras = []
+        self.camerasFound.emit(discovery, [serial for _, serial in cameras])
+
+    @pyqtSlot(object, list)
+    def on_cameras_found(self, discovery, serials):
+        """
+        Starts a stream per camera found, or a stream waiting for the first camera plugged in if there are none.
+
+        Args:
+            discovery (concurrent.futures.Future): the listing the cameras were found by
+            serials (list): serial numbers of the cameras
+        """
+        # the stream was ended while the cameras were listed
+        if discovery is not self.camera_discovery:
+            return
+
+        self.camera_discovery = None
+        if serials:
+            log.info("Found %i cameras: %s" % (len(serials), ", ".join(serials)))
+        self.start_camera_streams(serials or [None])
+
+    def start_camera_streams(self, serials):
+        """
+        Creates a seperate process for each camera, and displays the frames of the first from its ring buffer.
+        The camera processes share the save status queue, so a single watcher finishes the captures of all of them.
         Uses a QTimer to maintain a stable frame rate.
+
+        Args:
+            serials (list): serial numbers of the cameras, None for the default camera
         """
+        from .camera_sources import open_camera_source
+        from .camera_stream import CameraStream
+        from .frame_history import FrameHistory
+
         # grab config variables
         STREAM_HEIGHT = pcl_config["stream_height"]
         STREAM_WIDTH = pcl_config["stream_width"]
         STREAM_FPS = pcl_config["stream_fps"]
 
-        # set up the label
-        camera_size_policy = QSizePolicy(STREAM_WIDTH, STREAM_HEIGHT)
-        self.camera_label.setSizePolicy(camera_size_policy)
-
-        # create shared memory to hold a single frame for inter process communication,
-        # wrap it in a numpy array
-        nbyte_per_frame = STREAM_WIDTH * STREAM_HEIGHT * FRAME_NCHANNELS # bytes in a frame
-        log.debug("Allocating %i x %i bytes of shared memory"% (SM_BUF_SIZE, nbyte_per_frame))
-        self.frame_shm = shared_memory.SharedMemory(create=True, size=nbyte_per_frame*SM_BUF_SIZE)
-        shm_shape = (SM_BUF_SIZE, STREAM_HEIGHT, STREAM_WIDTH, FRAME_NCHANNELS)
-        self.frame_buffer = np.ndarray(shm_shape, dtype=np.uint8, buffer=self.frame_shm.buf)
-
-        # spawn the child depth cam process
-        self.frame_in_use = Value("i", False)
-        self.pending_frame = Value("i", False)
-        read_pipe, write_pipe = multiprocessing.Pipe()
-        self.camera_communication_pipe = write_pipe
-        self.depth_cam_proc = Process(
-            target=generate_frames,
-            args=(
-                self.frame_shm.name,
-                shm_shape,
-                STREAM_HEIGHT,
-                STREAM_WIDTH, 
-                STREAM_FPS,
-                self.frame_in_use,
-                self.pending_frame,
-                read_pipe,
-                self.is_streaming
-            ),
-        )
-        self.depth_cam_proc.start()
-        log.info("Created depth camera process, pId = %i" %self.depth_cam_proc.pid)
+        # each camera gets a ring of SM_BUF_SIZE frames in shared memory for inter process communication,
+        # the frames are kept in the camera's landscape orientation and rotated by the camera view.
+        # it is sized for the largest resolution so the stream can be reconfigured without reallocating it
+        max_height = max(resolution_width)
+        nbyte_per_frame = resolution_width[max_height] * max_height * FRAME_NCHANNELS # bytes in a frame
+        log.debug("Allocating %i x %i x %i bytes of shared memory" % (len(serials), SM_BUF_SIZE, nbyte_per_frame))
+        shm_shape = (SM_BUF_SIZE, resolution_width[max_height], max_height, FRAME_NCHANNELS)
+
+        # the camera processes keep a history of the last color+depth frames to pick captures from
+        history_size = pcl_config["frame_history"]
+        history_nbytes = FrameHistory.size_for(history_size, (STREAM_WIDTH, STREAM_HEIGHT, FRAME_NCHANNELS), (STREAM_WIDTH, STREAM_HEIGHT))
+        log.info("Keeping a history of %i frames per camera, %.1f MB" % (history_size, history_nbytes / 2**20))
+
+        # spawn a child depth cam process per camera
+        self.save_status_queue = multiprocessing.Queue()
+        for serial in serials:
+            camera_source = open_camera_source(pcl_config["camera"], STREAM_HEIGHT, STREAM_WIDTH, STREAM_FPS,
+                                               pcl_config["replay_path"], serial=serial)
+            stream = CameraStream(camera_source, shm_shape, self.save_status_queue, self.level_reading, history_size, serial=serial,
+                                  durability=pcl_config["durability"])
+            stream.start()
+            self.camera_streams.append(stream)
+        self.update_camera_actions()
+        self.show_camera(0)
+
+        # watch for saved captures in the background
+        self.capture_watcher = CaptureWatcher(self.save_status_queue)
+        self.capture_watcher.captureCompleted.connect(self.on_capture_completed)
+        self.capture_watcher.start()
 
         # create a QTimer to manage frame updates
         self.fps_timer = QtCore.QTimer()
@@ -238,96 +452,549 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         # for camera depending on accelerometer
         self.waitingForLevel = False
 
+    def streaming_cameras(self):
+        """
+        Returns the camera streams that are streaming, the others are still waiting for their camera.
+        """
+        return [stream for stream in self.camera_streams if stream.is_streaming.value]
+
+    def show_camera(self, index):
+        """
+        Displays the frames and depth overlay of one of the cameras, the auto-capture dwell follows the sharpness of its frames.
+
+        Args:
+            index (int): index of the camera's stream
+        """
+        self.displayed_camera = index
+        self.frame_ring = self.camera_streams[index].frame_ring
+        self.camera_view.set_frame_ring(self.frame_ring)
+        self.camera_view.set_depth_ring(self.camera_streams[index].depth_ring)
+        self.cameraGroup.actions()[index].setChecked(True)
+
+    def update_camera_actions(self):
+        """
+        Lists the cameras streaming in the camera menu, to choose the one displayed.
+        """
+        for action in self.cameraGroup.actions():
+            self.cameraGroup.removeAction(action)
+        self.menuCamera.clear()
+
+        for index, stream in enumerate(self.camera_streams):
+            action = QAction(stream.name, self)
+            action.setCheckable(True)
+            action.triggered.connect(lambda checked, index=index: self.show_camera(index))
+            self.cameraGroup.addAction(action)
+            self.menuCamera.addAction(action)
+        self.menuCamera.setEnabled(len(self.camera_streams) > 1)
+
     def configure_stream(self, width, height, fps):
-        # End exisiting stream
-        pcl_config["stream_height"] = height
-        pcl_config["stream_width"] = width
-        pcl_config["stream_fps"] = fps
+        """
+        Changes the stream's resolution and fps.
+        The running camera processes restart only their camera, keeping the shared memory and save workers,
+        the camera processes are only restarted if they aren't all streaming.
+
+        Args:
+            width (int): Width of the stream
+            height (int): Height of the stream
+            fps (int): Frames per Second of the stream
+        """
+        start_time = time.perf_counter()
+        if not self.reconfigure_cameras(width, height, fps):
+            # End exisiting stream
+            pcl_config["stream_height"] = height
+            pcl_config["stream_width"] = width
+            pcl_config["stream_fps"] = fps
+
+            # Tear down camera process
+            self.end_stream()
+
+            # Start stream with new values
+            self.start_stream()
+
+        self.update_stream_actions()
+        log.info("The stream configuration is as follows:\n Resolution: " + str(pcl_config["stream_height"]) + "x" + str(pcl_config["stream_width"]) +
+                 "\nFPS: " + str(pcl_config["stream_fps"]))
+        log.info("Reconfigured the stream in %.0f ms" % ((time.perf_counter() - start_time) * 1000))
+
+    def reconfigure_cameras(self, width, height, fps):
+        """
+        Asks the camera processes to restart their camera with new settings, and retunes the display timer to them.
+        The cameras restart in parallel, blocks until they all stream again.
+
+        Args:
+            width (int): Width of the stream
+            height (int): Height of the stream
+            fps (int): Frames per Second of the stream
+
+        Returns:
+            bool: false if the camera processes have to be restarted instead, they aren't all streaming or one didn't answer
+        """
+        if not self.camera_streams or len(self.streaming_cameras()) < len(self.camera_streams):
+            return False
+
+        # the camera streams in landscape, the stream's width and height are of the rotated frames
+        for stream in self.camera_streams:
+            stream.configure(height, width, fps)
+
+        replies = []
+        for stream in self.camera_streams:
+            reply = stream.wait_configured(STREAM_CONFIGURE_TIMEOUT_SEC)
+            if reply is None:
+                log.warning("Camera %s didn't reconfigure in %i s, restarting the cameras" % (stream.name, STREAM_CONFIGURE_TIMEOUT_SEC))
+                return False
+            if not reply[0]:
+                log.warning("Camera %s can't stream %ix%i at %i fps, keeping its current configuration" % (stream.name, height, width, fps))
+            replies.append(reply)
+
+        # the displayed camera sets the stream configuration
+        _, camera_width, camera_height, camera_fps = replies[self.displayed_camera]
+        pcl_config["stream_height"] = camera_width
+        pcl_config["stream_width"] = camera_height
+        pcl_config["stream_fps"] = camera_fps
+
+        # retune the display to the new frame rate, and restart the stats
+        self.fps_timer.setInterval(round(1000.0 / camera_fps))
+        self.frameUpdateCount = 0
+        self.stream_start_time = time.time()
+        return True
+
+    def setup_camera_view(self):
+        """
+        Sets up the camera view of the GUI, it takes the place and sizing of the camera label.
+        """
+        self.camera_view = FrameView(rotation=FRAME_ROTATION, telemetry=self.telemetry)
+        self.camera_view.setSizePolicy(self.camera_label.sizePolicy())
+        self.camera_view.setMaximumSize(self.camera_label.maximumSize())
+        self.camera_view.set_depth_overlay(pcl_config["depth_overlay"])
+        self.camera_view.framePainted.connect(self.on_frame_painted)
+        self.camera_label.parentWidget().layout().replaceWidget(self.camera_label, self.camera_view)
+        self.camera_label.hide()
+
+    def setup_review_strip(self):
+        """
+        Sets up the review strip of the last captures, docked under the camera view and toggled from the Edit menu.
+        """
+        self.review_strip = ReviewStrip()
+        self.review_dock = QDockWidget("Review", self)
+        self.review_dock.setWidget(self.review_strip)
+        self.review_dock.setFeatures(QDockWidget.DockWidgetClosable)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.review_dock)
+        self.review_dock.setVisible(pcl_config["review_strip"])
+
+        self.actionReviewStrip = self.review_dock.toggleViewAction()
+        self.actionReviewStrip.setText("Review Strip")
+        self.menuEdit.addAction(self.actionReviewStrip)
+
+    def setup_telemetry(self):
+        """
+        Sets up the telemetry of the GUI, and a timer collecting it with the camera processes' every period
+        for the stats overlay and the dump file.
+        """
+        self.telemetry = Telemetry("gui")
+        self.telemetry_collector = TelemetryCollector()
+        if pcl_config["telemetry_path"]:
+            try:
+                self.telemetry_collector.open_dump(pcl_config["telemetry_path"])
+                log.info("Dumping the telemetry to %s" % pcl_config["telemetry_path"])
+            except OSError as e:
+                log.warning("Could not open the telemetry dump %s: %s" % (pcl_config["telemetry_path"], e))
+
+        self.telemetry_timer = QtCore.QTimer()
+        self.telemetry_timer.timeout.connect(self.collect_telemetry)
+        self.telemetry_timer.setInterval(TELEMETRY_PERIOD_SEC * 1000)
+        self.telemetry_timer.start()
+
+    def collect_telemetry(self):
+        """
+        Collects the telemetry of the period from the GUI and the camera processes, and updates the stats overlay.
+        """
+        self.telemetry.gauge("pending_captures", len(self.pending_captures))
+        snapshots = [self.telemetry.snapshot()]
+        for stream in self.camera_streams:
+            snapshots += stream.telemetry()
+
+        try:
+            for snapshot in snapshots:
+                self.telemetry_collector.add(snapshot)
+        except OSError as e:
+            self.show_warning("Stopped dumping the telemetry: %s" % e)
+            self.telemetry_collector.close()
+
+        if pcl_config["stats_overlay"]:
+            self.camera_view.set_stats_text(self.telemetry_collector.overlay_text())
+
+    def observe_capture(self, capture, frame_info):
+        """
+        Adds the timings of a saved capture to the telemetry, the save worker sends them with the frame info.
+
+        Args:
+            capture (dict): the capture request
+            frame_info (dict): frame info of the saved capture
+        """
+        self.telemetry.count("captures_saved")
+        self.telemetry.observe("depth_processing", frame_info["depth_processing_ms"])
+        self.telemetry.observe("encode_%s" % capture["color_format"], frame_info["color_encode_ms"])
+        self.telemetry.observe("write_depth_%s" % capture["depth_format"], frame_info["depth_write_ms"])
+        self.telemetry.observe("save_capture", frame_info["save_ms"])
+        if frame_info["sync_ms"]:
+            self.telemetry.observe("sync_capture", frame_info["sync_ms"])
+        # from the click, or the end of the dwell, to the images on disk
+        self.telemetry.observe("capture_latency", time.time() * 1000.0 - frame_info["trigger_timestamp"])
+
+    def setup_disk_monitor(self):
+        """
+        Sets up the status bar label of the experiment's disk, and the monitor that checks its free space in the background.
+        """
+        self.disk_label = QLabel()
+        self.statusbar.addPermanentWidget(self.disk_label)
+        self.save_stats = SaveStats()
+        self.disk_monitor = DiskMonitor()
+        self.disk_monitor.diskChecked.connect(self.on_disk_checked)
+        self.disk_monitor.start()
+
+    @pyqtSlot(str, float, float)
+    def on_disk_checked(self, path, free, total):
+        """
+        Updates the disk status with the free space the disk monitor found.
+
+        Args:
+            path (str): path whose disk was checked
+            free (float): bytes free on the disk
+            total (float): size of the disk in bytes
+        """
+        if path != self.experiment_path:
+            return  # checked before another experiment was opened
+        self.disk_free = free
+        self.update_disk_status()
+
+    def capture_formats(self):
+        """
+        Returns the (color format, depth format) the next captures are saved in, the experiment's unless auto-degrade switched them.
+        """
+        if self.degraded is not None:
+            return DEGRADED_FORMATS[self.degraded][:2]
+        return self.experiment_settings["color_format"], self.experiment_settings["depth_format"]
+
+    def plots_left(self, color_format, depth_format):
+        """
+        Estimates how many more plots fit on the experiment's disk, keeping DISK_RESERVE_MB free.
 
-        # Tear down camera process
-        self.end_stream()
+        Args:
+            color_format (str): format the color images are saved in
+            depth_format (str): format the depth is saved in
 
-        # Start stream with new values
-        self.start_stream()
+        Returns:
+            int: num of plots, None until the disk was checked
+        """
+        if self.disk_free is None:
+            return None
+        npixels = pcl_config["stream_width"] * pcl_config["stream_height"]
+        plot_bytes = self.save_stats.bytes_per_capture(color_format, depth_format, npixels) * max(1, len(self.streaming_cameras()))
+        return max(0, int((self.disk_free - DISK_RESERVE_MB * 2**20) // plot_bytes))
+
+    def update_disk_status(self):
+        """
+        Shows the free space of the experiment's disk, how many plots still fit in the formats captures are saved in and how fast
+        they are saved, and warns once few plots are left.
+        """
+        self.update_degradation()
+        if self.experiment_settings is None or self.disk_free is None:
+            return
+
+        plots_left = self.plots_left(*self.capture_formats())
+        status = "%.1f GB free, ~%i plots" % (self.disk_free / 2**30, plots_left)
+        throughput = self.save_stats.throughput()
+        if throughput:
+            status += ", saving %.0f MB/s" % (throughput / 2**20)
+        if self.degraded is not None:
+            status += " as %s/%s" % self.capture_formats()
+        self.disk_label.setText(status)
+
+        low = plots_left < DISK_WARN_PLOTS
+        self.disk_label.setStyleSheet("color: red" if low else "")
+        if low and not self.disk_warned:
+            self.show_warning("The disk is nearly full, about %i plots left" % plots_left)
+        self.disk_warned = low
+
+    def update_degradation(self):
+        """
+        With auto-degrade, switches the captures to the smallest formats once few plots fit on the disk in the experiment's,
+        or to the fastest while captures back up on the save workers, and back to the experiment's once that clears.
+        """
+        reason = None
+        if pcl_config["auto_degrade"] and self.experiment_settings is not None:
+            plots_left = self.plots_left(self.experiment_settings["color_format"], self.experiment_settings["depth_format"])
+            backlog = len(self.pending_captures)
+            if plots_left is not None and plots_left < DISK_DEGRADE_PLOTS:
+                reason = "disk"
+            elif backlog >= SAVE_BACKLOG_DEGRADE or (self.degraded == "backlog" and backlog > SAVE_BACKLOG_RESTORE):
+                reason = "backlog"
+        if reason == self.degraded:
+            return
+
+        self.degraded = reason
+        if reason is None:
+            self.show_warning("Saving captures as %s and %s again" % self.capture_formats())
+        else:
+            self.show_warning("Saving captures as %s and %s, %s" % DEGRADED_FORMATS[reason])
+
+    def show_warning(self, message):
+        """
+        Logs a warning and shows it in the status bar for a while.
+
+        Args:
+            message (str): the warning
+        """
+        log.warning(message)
+        self.statusbar.showMessage(message, STATUS_MESSAGE_MS)
 
-        log.info("The stream configuration is as follows:\n Resolution: " + str(height) + "x" + str(width) + "\nFPS: " + str(fps))
     def update_stream(self):
         """
-        Updates the GUI to display the current video frame.
+        Updates the GUI to display the newest frame in the ring, the camera view only repaints if there is one since the last update.
+        """
+        self.camera_view.refresh()
+
+    @pyqtSlot(int)
+    def on_frame_painted(self, seq):
+        """
+        Counts the frames displayed.
+
+        Args:
+            seq (int): sequence number of the frame
         """
-        self.frame_in_use.value = True
-        pix = frame_to_pixmap(self.frame_buffer[0])
-        self.camera_label.setPixmap(pix)
-        self.frame_in_use.value = False
         self.frameUpdateCount += 1
+        if not self.first_frame_painted:
+            self.first_frame_painted = True
+            startup_profile.mark_since("camera process first frame", self.camera_start_time)
+
+        # track how sharp the frames are while auto-capture waits for the camera to settle
+        if self.dwell_timer.isActive():
+            self.dwell_sharpness.append(self.frame_ring.info(seq, "sharpness"))
 
     def take_picture(self):
         """
-        Notifies camera process to save the next frame.
-        Disables the take picture button & posts the image name and experiment path onto the shared pipe.
-        (SUS) Waits till image is saved to enable the button again.
+        Requests the camera process to save the next frame, once the camera is level.
+        With auto-capture on, the camera must also stay level for the dwell time and the picture is taken on the sharpest frame.
         """
         
-        if not self.is_streaming.value:
+        if not self.streaming_cameras():
             log.info("Cant save pic - no stream !!")
             return
 
-        # disable take pic btn until its done 
-        self.take_picture_button.setEnabled(False)
+        # a capture that doesn't fit fails in the save workers, long after the plot was moved on from
+        if self.plots_left(*self.capture_formats()) == 0:
+            self.show_warning("The disk is full, free up space or open an experiment on another disk")
+            self.disk_monitor.check_now()
+            return
 
-        if not within_tolerance(self.x, self.y, LEVEL_TOLERANCE):
+        if pcl_config["auto_capture"]:
+            # disable take pic btn until the camera has settled
+            log.info("Waiting till camera is steady to take the picture")
+            self.take_picture_button.setEnabled(False)
+            self.waitingForLevel = True
+            if self.level_monitor.is_level:
+                self.start_dwell()
+            return
+
+        if not self.level_monitor.is_level:
+            # disable take pic btn until the camera is level
             log.info("Waiting till camera is level to take the picture")
+            self.take_picture_button.setEnabled(False)
             self.waitingForLevel = True
             return
 
-        # write save image info to pipe
-        plot_num_str = str(self.current_plot_number).zfill(PLOT_NUMBER_PADDING)
-        img_name = "%s_%s" % (self.experiment_name, plot_num_str)
-        log.debug("Queueing image <%s> to be saved..." %img_name)
-        self.pending_frame.value = True
-        self.camera_communication_pipe.send((self.experiment_path, img_name)) 
+        self.request_capture("closest")
 
-        # wait for image to be saved
-        while (self.pending_frame.value):
-            pass
-        
-        self.update_metadata()
-        self.save_metadata()
-            # resume normal operations
-        log.debug("Image <%s> successfully saved" %img_name)
-        self.update_plot_number(self.current_plot_number + 1)
-        self.take_picture_button.setEnabled(True)
+    def start_dwell(self):
+        """
+        Starts the auto-capture dwell, the picture is taken if the camera stays level until it is over.
+        """
+        self.dwell_sharpness = []
+        self.dwell_timer.start()
 
-        self.alert.play()
-        
+    def on_dwell_elapsed(self):
+        """
+        Takes the auto-capture picture once the camera stayed level for the dwell time,
+        unless the newest frames are still blurrier than the sharpest of the dwell, the camera is still moving then.
+        """
+        if not self.waitingForLevel:
+            return
+
+        if self.dwell_sharpness and self.dwell_sharpness[-1] < AUTO_CAPTURE_SHARPNESS_RATIO * max(self.dwell_sharpness):
+            log.debug("Frames are still blurry, extending the dwell")
+            self.start_dwell()
+            return
+
+        self.request_capture("sharpest", pcl_config["auto_capture_dwell_ms"])
+
+    def request_capture(self, selection, window_ms=0):
+        """
+        Requests every camera process streaming to save a frame from its frame history.
+        Reserves the next free plot number for the request & posts the request id, trigger time, frame selection, experiment path and image name
+        onto each camera's pipe. The cameras get the same trigger time, so they all save the frame they exposed closest to it.
+        Does not wait for the save, on_capture_completed finishes the capture once a worker reports back,
+        so further captures can be queued right away.
+
+        Args:
+            selection (str): "closest" to save the frame closest to now, "sharpest" to save the sharpest level frame of the last window_ms
+            window_ms (int): ms before now the "sharpest" frame is picked from, up to the length of the frame history
+        """
+        # reserve the plot number after the ones already queued
+        plot_number = max([self.current_plot_number] + [capture["plot_number"] + 1 for capture in self.pending_captures.values()])
+
+        # write save image request to the pipe of each camera
+        trigger_time = time.time()
+        plot_num_str = str(plot_number).zfill(PLOT_NUMBER_PADDING)
+        streams = self.streaming_cameras()
+        plot = {"pending": len(streams), "saved": 0}  # shared by the captures of the plot's cameras
+        color_format, depth_format = self.capture_formats()
+        for stream in streams:
+            request_id = self.next_request_id
+            self.next_request_id += 1
+
+            # with several cameras, the images of a plot are told apart by the camera's serial
+            img_name = "%s_%s" % (self.experiment_name, plot_num_str)
+            if len(self.camera_streams) > 1:
+                img_name = "%s_%s" % (img_name, stream.name)
+
+            self.pending_captures[request_id] = {
+                "plot_number": plot_number,
+                "x": self.level_monitor.x,
+                "y": self.level_monitor.y,
+                "experiment_name": self.experiment_name,
+                "experiment_path": self.experiment_path,
+                "metadata": self.metadata,
+                "serial": stream.serial,
+                "color_format": color_format,
+                "depth_format": depth_format,
+                "plot": plot,
+            }
+            log.debug("Queueing image <%s> to be saved, request #%i..." % (img_name, request_id))
+            stream.request_capture((request_id, trigger_time, selection, window_ms, self.experiment_path, img_name,
+                                    color_format, self.experiment_settings["png_compression"],
+                                    depth_format, self.experiment_settings["depth_processing"]))
+        self.update_disk_status()
+
+        # resume normal operations
+        self.take_picture_button.setEnabled(True)
         self.waitingForLevel = False
 
-    def start_accelerometer(self):
+    @pyqtSlot(int, str, bool, dict)
+    def on_capture_completed(self, request_id, img_name, saved, frame_info):
         """
-        Creates Phidget22 accelerometer and polls it at a fixed rate using a QTimer.
+        Finishes a capture request once a save worker reports back.
+        Records the image in the metadata and moves the plot number past it,
+        the shutter sound plays once the images of every camera of the plot are done.
+
+        Args:
+            request_id (int): id of the capture request
+            img_name (str): name the images were saved under
+            saved (bool): true if the images were saved
+            frame_info (dict): frame number, sensor timestamp and sharpness of the saved frame, the trigger timestamp of the request,
+                and the sizes of the images, the encoding time of the color image and shrunk copies of it if it was saved
+        """
+        capture = self.pending_captures.pop(request_id, None)
+        if capture is None:
+            log.warning("Got a status for unknown capture request #%i" % request_id)
+            return
+
+        plot = capture["plot"]
+        plot["pending"] -= 1
+        if saved:
+            log.debug("Image <%s> successfully saved" % img_name)
+            self.track_color_encoding(capture["color_format"], frame_info)
+            self.observe_capture(capture, frame_info)
+            nbytes = frame_info["color_bytes"] + frame_info["depth_bytes"]
+            self.save_stats.add(capture["color_format"], capture["depth_format"], nbytes, frame_info["save_ms"])
+            if self.disk_free is not None:
+                self.disk_free -= nbytes
+            self.update_metadata(capture, frame_info)
+            start = time.perf_counter()
+            capture["metadata"].save()
+            self.telemetry.observe("metadata_flush", (time.perf_counter() - start) * 1000.0)
+            self.index_capture(capture, frame_info, new_plot=plot["saved"] == 0)
+            self.review_strip.add_capture(capture["experiment_path"], str(capture["plot_number"]).zfill(PLOT_NUMBER_PADDING),
+                                          capture["serial"], frame_info["preview"])
+            if capture["plot_number"] >= self.current_plot_number:
+                self.update_plot_number(capture["plot_number"] + 1)
+            plot["saved"] += 1
+        else:
+            self.telemetry.count("captures_failed")
+            self.show_warning("Image <%s> failed to save: %s" % (img_name, frame_info.get("save_error")))
+            self.disk_monitor.check_now()
+        self.update_disk_status()
+
+        if plot["pending"] == 0 and plot["saved"] and self.alert:
+            self.alert.play()
+
+    def track_color_encoding(self, color_format, frame_info):
+        """
+        Adds a saved color image to the encoding stats of its format, logged when the stream ends.
+
+        Args:
+            color_format (str): format the image was saved in
+            frame_info (dict): frame info the save worker reported, with the image's size and encoding time
+        """
+        count, encode_ms, nbytes = self.color_encoding.get(color_format, (0, 0.0, 0))
+        self.color_encoding[color_format] = (count + 1, encode_ms + frame_info["color_encode_ms"], nbytes + frame_info["color_bytes"])
+
+    def log_color_encoding(self):
+        """
+        Logs the average encoding time and size of the color images saved in each format, to weigh cpu against disk space.
+        """
+        for color_format, (count, encode_ms, nbytes) in sorted(self.color_encoding.items()):
+            log.info("Saved %i %s color images, %.1f ms to encode (%.1f images/s per save worker) and %.2f MB each"
+                     % (count, color_format, encode_ms / count, 1000.0 * count / max(encode_ms, 1e-3), nbytes / count / 2**20))
+
+    def setup_level_monitor(self):
+        """
+        Sets up the target and creates the level monitor, the Phidget22 accelerometer pushes its readings to it as they change.
         """
         # set up the target image
         self.setup_target()
 
-        # create the accelerometer, and wait 1 sec for connection
-        # TODO does the open wait for attachment throw an error
-        try:
-            self.accelerometer = Accelerometer()
-            self.accelerometer.openWaitForAttachment(1000)
-            log.info("Created accelerometer")
-        except:
-            log.warning("There is no accelerometer connected")
-            self.accelerometer = None
-            return
+        # auto-capture waits for the camera to stay level this long
+        self.dwell_sharpness = []  # sharpness of the frames displayed during the dwell
+        self.dwell_timer = QtCore.QTimer()
+        self.dwell_timer.setSingleShot(True)
+        self.dwell_timer.setInterval(pcl_config["auto_capture_dwell_ms"])
+        self.dwell_timer.timeout.connect(self.on_dwell_elapsed)
+
+        self.level_monitor = LevelMonitor(pcl_config["accelerometer_interval_ms"], pcl_config["accelerometer_change_trigger"],
+                                          shared_reading=self.level_reading)
+        self.level_monitor.levelChanged.connect(self.on_level_changed)
+        self.level_monitor.targetMoved.connect(self.on_target_moved)
+        self.level_monitor.attachedChanged.connect(self.on_accelerometer_attached)
+
+    def start_accelerometer(self):
+        """
+        Starts looking for the accelerometer, warns if it hasn't attached after a while.
+        """
+        self.accelerometer_start_time = time.perf_counter()
+        if self.level_monitor.start():
+            QtCore.QTimer.singleShot(ACCELEROMETER_ATTACH_TIMEOUT_MS, self.check_accelerometer)
 
+    def check_accelerometer(self):
+        """
+        Warns that there is no accelerometer, it is still picked up if it is plugged in later.
+        """
+        if self.level_monitor.accelerometer and not self.level_monitor.is_attached:
+            log.warning("There is no accelerometer connected, waiting for one")
 
-        # create QTimer to periodically monitor the acceleration
-        self.accelerometer_timer = QtCore.QTimer()
-        self.accelerometer_timer.setTimerType(QtCore.Qt.PreciseTimer)
-        self.accelerometer_timer.timeout.connect(self.update_target)
-        self.accelerometer_timer.setInterval(ACCELEROMETER_PERIOD_MS)
-        self.accelerometer_timer.start()
-        log.debug("Timer limiting accelerometer update frequency to %f Hz" % (1000.0/ACCELEROMETER_PERIOD_MS))
+    @pyqtSlot(bool)
+    def on_accelerometer_attached(self, attached):
+        """
+        Shows the level state once the accelerometer attached.
+
+        Args:
+            attached (bool): true if the accelerometer attached, false if it was detached
+        """
+        if attached:
+            log.info("Accelerometer attached")
+            startup_profile.mark_since("accelerometer attached", self.accelerometer_start_time)
+            self.on_level_changed(self.level_monitor.is_level)
+        else:
+            log.warning("The accelerometer was detached")
 
     def setup_target(self):
         """
@@ -343,23 +1010,32 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         self.target.setParent(self.wrapper)
         self.target.show()
 
-    def update_target(self):
+    @pyqtSlot(float, float)
+    def on_target_moved(self, x, y):
         """
         Update the coordinate on the GUI's target.
+
+        Args:
+            x (float): smoothed x acceleration
+            y (float): smoothed y acceleration
         """
-        # TODO try-catch error
-        acceleration = self.accelerometer.getAcceleration()
+        self.target.coordinate = QPointF(x, y)
 
-        self.x = acceleration[0]
-        self.y = acceleration[1]
+    @pyqtSlot(bool)
+    def on_level_changed(self, is_level):
+        """
+        Updates the level label, and takes the picture that was waiting for the camera to be level.
 
-        self.target.coordinate = QPointF(self.x, self.y)
-        if within_tolerance(self.x, self.y, LEVEL_TOLERANCE):
+        Args:
+            is_level (bool): true if the camera is level
+        """
+        if is_level:
             if self.waitingForLevel:
                 self.take_picture()
             self.camera_level_label.setText("Camera is Level")
             self.camera_level_label.setStyleSheet("color: green;")
         else:
+            self.dwell_timer.stop()
             self.camera_level_label.setText("Camera is not Level")
             self.camera_level_label.setStyleSheet("color: red;")
     
@@ -375,6 +1051,8 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         """
         Open the "New Experiment" Dialog and connect methods to update file name and plot number labels.
         """
+        from .new_experiment_dialog import NewExperimentPage
+
         new_exp_page = NewExperimentPage()
         new_exp_page.expirementCreated.connect(self.update_experiment)
         new_exp_page.changePlotNumber.connect(self.update_plot_number)
@@ -383,10 +1061,39 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
 
     def browse_files(self):
         """
-        Opens up experiment folder directory so that an existing experiment can be chosen
+        Opens the experiment browser so that an existing experiment can be chosen
         """
-        loaded_filename = QFileDialog.getExistingDirectory(self, 'Select Experiment Folder', PCL_EXP_PATH)
-        self.update_experiment(basename(loaded_filename))
+        from .experiment_browser import ExperimentBrowser
+
+        browser = ExperimentBrowser(self.get_experiment_index())
+        browser.experimentSelected.connect(self.update_experiment)
+        browser.exec_()
+
+    def get_experiment_index(self):
+        """
+        Returns the experiment index, opening it the first time.
+        """
+        if self.experiment_index is None:
+            from .experiment_index import ExperimentIndex
+            self.experiment_index = ExperimentIndex(PCL_EXP_PATH)
+        return self.experiment_index
+
+    def index_capture(self, capture, frame_info, new_plot):
+        """
+        Adds a saved capture to the experiment index, the index is only a cache so failing to update it is just logged.
+
+        Args:
+            capture (dict): the completed capture request, its metadata saved
+            frame_info (dict): frame info the save worker reported, with the sizes of the images and a thumbnail
+            new_plot (bool): true for the first capture saved of the plot
+        """
+        try:
+            self.get_experiment_index().record_capture(capture["experiment_path"], capture["plot_number"],
+                                                       frame_info["frame_timestamp"] / 1000.0,
+                                                       frame_info["color_bytes"] + frame_info["depth_bytes"],
+                                                       frame_info["thumbnail"], new_plot)
+        except Exception as e:
+            log.warning("Could not update the experiment index: %s" % e)
 
     @pyqtSlot(str)
     def update_experiment(self, new_exp_name):
@@ -407,20 +1114,65 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         self.experiment_name = new_exp_name
         self.file_name_label.setText(self.experiment_name)
         self.experiment_path = new_exp_path
-
-        # save old metadata before opening new experiment
-        self.save_metadata()
+        self.experiment_settings = load_experiment_settings(self.experiment_path)
+        self.disk_free = None
+        self.disk_warned = False
+        self.disk_label.clear()
+        self.disk_monitor.watch(self.experiment_path)
+
+        # save and compact old metadata before opening new experiment
+        self.close_metadata()
         metadata_path = os.path.join(self.experiment_path, "Metadata", "%s.json" % self.experiment_name)
-        self.metadata = Metadata(metadata_path)
+        self.metadata = Metadata(metadata_path, pcl_config["durability"])
+        recovered = self.recover_experiment()
         last_index = self.metadata.get_last_index()
+        self.review_strip.set_experiment(self.experiment_path, self.metadata.entries())
 
         if last_index != -1:
             self.update_plot_number(last_index + 1)
 
+        # experiments created or copied outside of the browser are indexed when first opened
+        try:
+            if recovered:
+                self.get_experiment_index().update_experiment(self.experiment_path)
+            else:
+                self.get_experiment_index().ensure_experiment(self.experiment_path)
+        except Exception as e:
+            log.warning("Could not index experiment %s: %s" % (self.experiment_name, e))
+
         self.take_picture_button.setEnabled(True)
 
         log.info("Opened experiment %s" %self.experiment_name)
 
+    def recover_experiment(self):
+        """
+        Cleans up after a crash or power loss mid-capture in the experiment just opened, the first time it is opened this session.
+        Once it was opened its save workers may be writing to it, their temporary files aren't left over from a crash.
+
+        Returns:
+            bool: true if the experiment was changed
+        """
+        if self.experiment_path in self.recovered_experiments:
+            return False
+        self.recovered_experiments.add(self.experiment_path)
+
+        from .recovery import recover_experiment
+        try:
+            report = recover_experiment(self.experiment_path, self.metadata)
+        except Exception as e:
+            log.warning("Could not check experiment %s for an interrupted capture: %s" % (self.experiment_name, e))
+            return False
+
+        if report.removed_tmp:
+            log.warning("Removed %i partly written files: %s" % (len(report.removed_tmp), ", ".join(report.removed_tmp)))
+        if report.corrupt:
+            log.warning("Set aside the corrupt images of %s" % ", ".join(report.corrupt))
+        if report.unrecorded:
+            log.warning("Added the metadata of %s, saved without it" % ", ".join(report.unrecorded))
+        if report.missing:
+            log.warning("%i metadata entries have no color image: %s" % (len(report.missing), ", ".join(report.missing[:10])))
+        return bool(report.removed_tmp or report.corrupt or report.unrecorded)
+
     def validate_experiment(self, exp_path):
         """
         Validates experiment at the given path.
@@ -464,15 +1216,35 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         self.plot_number_label.setText("Plot #: " + str(new_plot_number).zfill(PLOT_NUMBER_PADDING))
         self.current_plot_number = new_plot_number
 
-    def update_metadata(self):
+    def update_metadata(self, capture, frame_info):
         """ 
-        Updates metadata with new entry.
+        Updates the capture's metadata with a new entry.
+        The entry is stamped with the time the frame was exposed, and the position is the accelerometer reading closest to it.
+
+        Args:
+            capture (dict): the completed capture request
+            frame_info (dict): frame number, sensor timestamp and sharpness of the saved frame, and the trigger timestamp of the request
         """        
-        num = str(self.current_plot_number).zfill(PLOT_NUMBER_PADDING)
-        t = datetime.now().strftime('%H:%M:%S')
-        date = datetime.now().strftime('%d/%m/%Y')
-        name = self.experiment_name
-        self.metadata.add_entry(num, t, date, self.x, self.y, name)
+        num = str(capture["plot_number"]).zfill(PLOT_NUMBER_PADDING)
+        frame_timestamp = frame_info["frame_timestamp"]
+        exposed_at = datetime.fromtimestamp(frame_timestamp / 1000.0)
+        t = exposed_at.strftime('%H:%M:%S')
+        date = exposed_at.strftime('%d/%m/%Y')
+
+        # fall back on the reading at the trigger without a reading history
+        level_sample = self.level_monitor.closest_sample(frame_timestamp)
+        if level_sample is None:
+            x, y, level_timestamp = capture["x"], capture["y"], None
+        else:
+            level_timestamp, x, y = level_sample
+
+        capture["metadata"].add_entry(num, t, date, x, y, capture["experiment_name"],
+                                      frame_number=frame_info["frame_number"],
+                                      frame_timestamp=frame_timestamp,
+                                      trigger_timestamp=frame_info["trigger_timestamp"],
+                                      level_timestamp=level_timestamp,
+                                      sharpness=frame_info["sharpness"],
+                                      serial=capture["serial"])
 
     def save_metadata(self):
         """
@@ -484,23 +1256,79 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         log.info("Saving metadata")
         self.metadata.save()
 
+    def sync_metadata(self):
+        """
+        Saves the metadata file and forces it to disk.
+        """
+        if self.metadata is None:
+            return
+
+        start = time.perf_counter()
+        self.metadata.save()
+        self.metadata.sync()
+        self.telemetry.observe("metadata_sync", (time.perf_counter() - start) * 1000.0)
+
+    def close_metadata(self):
+        """
+        Saves, syncs and compacts the metadata file.
+        """
+        if self.metadata is None:
+            return
+
+        log.info("Closing metadata")
+        self.metadata.close()
+
     def end_stream(self):
-        if self.depth_cam_proc:
+        """
+        Stops the camera processes, finishes the captures they saved and frees their ring buffers.
+        """
+        # forget the cameras still being listed
+        self.camera_discovery = None
+
+        if self.camera_streams:
             log.debug(
                 "Stream's Average FPS: %.2f"
                 % (self.frameUpdateCount / (time.time() - self.stream_start_time))
             )
+            log.debug(
+                "Stream's frames dropped: %i, duplicated: %i, torn: %i"
+                % (self.camera_view.frames_dropped, self.camera_view.frames_duplicated, self.camera_view.frames_torn)
+            )
 
-            # end depth cam process and wait for it to complete
-            # TODO end the fps Qtimer
-            self.is_streaming.value = False
-            self.frame_in_use.value = False
-            self.depth_cam_proc.join()
+            # stop displaying frames, the rings are about to be freed
+            self.fps_timer.stop()
+            self.camera_view.set_frame_ring(None)
+            self.camera_view.set_depth_ring(None)
+            self.frame_ring = None
+
+            # end depth cam processes together and wait for them to complete
+            for stream in self.camera_streams:
+                stream.stop()
+            for stream in self.camera_streams:
+                stream.join()
+
+            # the save workers are done, finish the captures the watcher signalled but the event loop hasn't delivered yet,
+            # then the ones reported after the watcher stopped
+            self.capture_watcher.stop()
+            QtCore.QCoreApplication.sendPostedEvents(self, QtCore.QEvent.MetaCall)
+            for status in self.capture_watcher.drain():
+                self.on_capture_completed(*status)
+            if self.pending_captures:
+                plots = sorted({str(capture["plot_number"]) for capture in self.pending_captures.values()})
+                self.show_warning("The captures of plots %s were lost with the stream, take them again" % ", ".join(plots))
+                self.pending_captures.clear()
+            self.log_color_encoding()
+
+            # the camera processes' last periods, before their queues are freed
+            self.collect_telemetry()
+            log.info("Telemetry of the session:\n%s" % "\n".join(self.telemetry_collector.summary()))
 
             # free shared memory
-            self.frame_shm.close()
-            self.frame_shm.unlink()
-            log.info("Terminated camera process") 
+            for stream in self.camera_streams:
+                stream.close()
+            self.camera_streams = []
+            self.update_camera_actions()
+            log.info("Terminated camera processes")
 
     def closeEvent(self, event):
         """ 
@@ -508,10 +1336,19 @@ class PlotCamLiteWindow_Monitor(QMainWindow):
         Teardown all running threads and processes.
         """
         # tear down accelerometer
-        if self.accelerometer:
-            pass
+        if self.level_monitor:
+            self.level_monitor.stop()
 
         # tear down camera process
         self.end_stream() 
 
+        # flush the metadata of the captures finished by end_stream
+        self.close_metadata()
+        if self.experiment_index is not None:
+            self.experiment_index.close()
+        self.review_strip.stop()
+        self.disk_monitor.stop()
+        self.telemetry_timer.stop()
+        self.telemetry_collector.close()
+
         log.info("PlotCamLite says goodbye :[")
\ No newline at end of file
@@ -5,51 +5,164 @@ This code handles the metadata functions
 """
 import json
 import os
-from datetime import datetime
+import time
+
+from util import DEFAULT_DURABILITY, METADATA_COMPACT_EVERY, METADATA_FSYNC_BATCH, METADATA_UPDATE_PERIOD_SEC
+
+JOURNAL_TAIL_CHUNK = 4096  # bytes read at a time when looking for the last journal entry
+
+
+def read_entries(metadata_fpath):
+    """Reads the entries of an experiment's metadata without opening it for writing,
+    from the journal if there is one, or the legacy metadata file.
+
+    Args:
+        metadata_fpath (str): File path of metadata file
+
+    Returns:
+        list: metadata entries in the order they were added, empty if there is no metadata
+    """
+    journal_path = os.path.splitext(metadata_fpath)[0] + ".jsonl"
+    if os.path.exists(journal_path):
+        with open(journal_path, "r") as f:
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass  # a torn last line, left by a crash mid-write
+            return entries
+
+    if os.path.exists(metadata_fpath) and os.path.getsize(metadata_fpath) > 0:
+        with open(metadata_fpath, "r") as f:
+            return json.load(f)
+    return []
+
 
 class Metadata:
     """
     An instance of this class creates/reads a file in the given directory to store a metadata file. This class also contains
     functions to manipulate the data.
+
+    Entries are appended to a JSON Lines journal beside the metadata file, one entry per line, so saving an entry costs the same
+    no matter how many plots the experiment has. The journal is fsynced according to the durability policy, on every save,
+    in batches or never, and periodically compacted into the legacy metadata file, a JSON array of all the entries.
     """
 
-    def __init__(self, metadata_fpath):
+    def __init__(self, metadata_fpath, durability=DEFAULT_DURABILITY):
         """Constructor for Metadata class.
 
         Args:
             metadata_fpath (str): File path of metadata file
+            durability (str): when the journal is synced to disk, one of durable_writes.DURABILITY_POLICIES
         """
 
         self.filepath = metadata_fpath
+        self.durability = durability
+        self.journal_path = os.path.splitext(metadata_fpath)[0] + ".jsonl"
+        self.journal = None
         self.new_data = False
+
+        self.pending = []  # entries not yet written to the journal
+        self.last_entry = None
+        self.nunsynced = 0  # entries written to the journal since the last fsync
+        self.last_sync_time = time.time()
+        self.nuncompacted = 0  # entries written to the journal since the last compaction
         self.load_data()
 
     def load_data(self):
         """
         Prepare metadata information from the filepath.
-        If file exists, the existing information is stored, else creates a new file.
+        If there is no journal yet, the existing metadata file is migrated into a new journal.
+        Only the last journal entry is read.
+        """
+
+        if not os.path.exists(self.journal_path):
+            self.migrate()
+        self.last_entry = self.read_last_entry()
+
+    def migrate(self):
+        """
+        Creates the journal from the legacy metadata file, or an empty journal if there is none.
         """
-        
-        if not os.path.exists(self.filepath) or os.path.getsize(self.filepath,) == 0:
-            with open(self.filepath, "w") as fp:
-                self.metadata = []
-        else:
+        entries = []
+        if os.path.exists(self.filepath) and os.path.getsize(self.filepath) > 0:
             with open(self.filepath, "r") as f:
-                self.metadata = json.load(f)
-    
-    # def load_existing_experiment_metadata(self, existing_filepath):
+                entries = json.load(f)
+
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def read_last_entry(self):
+        """Reads the last entry of the journal from the end of the file.
+        An incomplete last line, left by a crash mid-write, is cut off the journal.
+
+        Returns:
+            dict: the last entry, None if the journal is empty
+        """
+        with open(self.journal_path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            tail = b""
+            start = end
+            while start > 0 and tail.count(b"\n") < 2:
+                start = max(0, start - JOURNAL_TAIL_CHUNK)
+                f.seek(start)
+                tail = f.read(end - start)
+
+            # drop a torn last line
+            if tail and not tail.endswith(b"\n"):
+                cut = tail.rfind(b"\n") + 1
+                f.truncate(start + cut)
+                tail = tail[:cut]
+
+        lines = tail.splitlines()
+        if not lines:
+            return None
+        return json.loads(lines[-1])
+
+    def entries(self):
+        """Reads every entry, saved or not, the new ones are appended to the journal first.
+
+        Returns:
+            list: metadata entries in the order they were added
+        """
+        self.write_pending()
+        return self.read_journal()
+
+    def read_journal(self):
+        """Reads the entries of the journal, without the ones not saved yet.
 
+        Returns:
+            list: metadata entries in the order they were saved
+        """
+        with open(self.journal_path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
 
-    def add_entry(self, number, time, date, xpos, ypos, name):
+    def add_entry(self, number, time, date, xpos, ypos, name,
+                  frame_number=None, frame_timestamp=None, trigger_timestamp=None, level_timestamp=None, sharpness=None, serial=None,
+                  recovered=False):
         """Appends plot data to metadata.
+        Timestamps are in ms, in the same time base as time.time(), the capture fields are left out when not given.
 
         Args:
             number (str): The plot number, padded by 0s on the left so that its always 3 digits
             time (str): The time the image was taken at
-            date (str): The date the image was taken 
+            date (str): The date the image was taken
             xpos (int): The x coordinate
             ypos (int): The y coordinate
             name (int): Experiment name
+            frame_number (int): The camera's frame number of the saved frame
+            frame_timestamp (float): The sensor timestamp of the saved frame
+            trigger_timestamp (float): When the capture was triggered
+            level_timestamp (float): When the accelerometer reading xpos and ypos come from was sampled
+            sharpness (float): The sharpness score of the saved frame
+            serial (str): The serial number of the camera the image was taken with
+            recovered (bool): The entry was rebuilt from images saved without one, by a crash
         """
         image_data = {
             "number": number,
@@ -59,7 +172,23 @@ class Metadata:
             "ypos": ypos,
             "name": name,
         }
-        self.metadata.append(image_data)
+        if frame_number is not None:
+            image_data["frame_number"] = frame_number
+        if frame_timestamp is not None:
+            image_data["frame_timestamp_ms"] = frame_timestamp
+            if trigger_timestamp is not None:
+                image_data["trigger_timestamp_ms"] = trigger_timestamp
+                image_data["trigger_to_frame_ms"] = frame_timestamp - trigger_timestamp
+            if level_timestamp is not None:
+                image_data["level_to_frame_ms"] = frame_timestamp - level_timestamp
+        if sharpness is not None:
+            image_data["sharpness"] = sharpness
+        if serial is not None:
+            image_data["camera_serial"] = serial
+        if recovered:
+            image_data["recovered"] = True
+        self.pending.append(image_data)
+        self.last_entry = image_data
         self.new_data = True
 
     def get_last_index(self):
@@ -68,20 +197,76 @@ class Metadata:
         Returns:
             int: The plot number of the last element
         """
-        if len(self.metadata) == 0:  # file is empty
+        if self.last_entry is None:  # file is empty
             return -1
 
-        return int(self.metadata[-1]["number"])
+        return int(self.last_entry["number"])
 
     def save(self):
         """
         Save metadata to file.
-        """    
+        Appends the new entries to the journal, fsyncs it right away under the capture durability policy,
+        or once enough entries or time have built up under the batched one, and compacts it once enough entries were added.
+        """
+        self.write_pending()
+
+        if self.durability == "capture" or self.nunsynced >= METADATA_FSYNC_BATCH or \
+                time.time() - self.last_sync_time >= METADATA_UPDATE_PERIOD_SEC:
+            self.sync()
+
+        if self.nuncompacted >= METADATA_COMPACT_EVERY:
+            self.compact()
+
+    def write_pending(self):
+        """
+        Appends the new entries to the journal, without syncing or compacting it.
+        """
         if not self.new_data:
             return
-        
-        with open(self.filepath, 'w') as f:
+
+        if self.journal is None:
+            self.journal = open(self.journal_path, "a")
+
+        self.journal.write("".join(json.dumps(entry) + "\n" for entry in self.pending))
+        self.journal.flush()
+        self.nunsynced += len(self.pending)
+        self.nuncompacted += len(self.pending)
+        self.pending = []
+        self.new_data = False
+
+    def sync(self):
+        """
+        Forces the journal to disk, unless the durability policy leaves it to the OS.
+        """
+        if self.journal is not None and self.nunsynced and self.durability != "none":
+            os.fsync(self.journal.fileno())
+        self.nunsynced = 0
+        self.last_sync_time = time.time()
+
+    def compact(self):
+        """
+        Rewrites the legacy metadata file from the journal, replacing it in a single step so it is never left half written.
+        """
+        entries = self.entries()
+        self.nuncompacted = 0
+        tmp_path = self.filepath + ".tmp"
+        with open(tmp_path, 'w') as f:
             # Saves metadata entry and formatting using indent=4
-            json.dump(self.metadata, f, indent=4)
-        
-        self.new_data = False
\ No newline at end of file
+            json.dump(entries, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.filepath)
+
+    def close(self):
+        """
+        Saves, syncs and compacts the metadata, and closes the journal.
+        The metadata can still be used afterwards, the journal is reopened on the next save.
+        """
+        self.save()
+        self.sync()
+        if self.nuncompacted or not os.path.exists(self.filepath):
+            self.compact()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
@@ -6,12 +6,17 @@ This code handles the new experiment dialog
 
 import logging
 import os
+from datetime import datetime
 
 from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import (QDialog, QGridLayout, QGroupBox, QLabel,
+from PyQt5.QtWidgets import (QComboBox, QDialog, QGridLayout, QGroupBox, QLabel,
                              QMessageBox, QPushButton, QVBoxLayout)
 
-from util import PCL_EXP_PATH, PLOT_NUM_DEFAULT_TEXT, DEFAULT_FONT
+from util import (PCL_EXP_PATH, PLOT_NUM_DEFAULT_TEXT, DEFAULT_FONT, DEFAULT_COLOR_FORMAT, DEFAULT_DEPTH_FORMAT,
+                  DEFAULT_DEPTH_PROCESSING, PNG_COMPRESSION)
+from .depth_processing import DEPTH_PROCESSING_PRESETS
+from .experiment_settings import save_experiment_settings
+from .image_writers import COLOR_FORMATS, DEPTH_FORMATS
 from .virtual_keyboard import ClickableLineEdit, VirtualKeyboard
 
 log = logging.getLogger("new_experiment_dialog")
@@ -44,6 +49,10 @@ class NewExperimentPage(QDialog):
         self.lineedit_layout = QGridLayout()
         self.lineedit_layout.setColumnStretch(0, 4)
         self.lineedit_layout.setColumnStretch(1, 4)
+        self.lineedit_layout.setColumnStretch(2, 1)
+        self.lineedit_layout.setColumnStretch(3, 1)
+        self.lineedit_layout.setColumnStretch(4, 1)
+        self.lineedit_layout.setColumnStretch(5, 1)
 
         self.keyboard_layout = QGridLayout()
 
@@ -53,6 +62,43 @@ class NewExperimentPage(QDialog):
         self.newFileLineEdit.setPlaceholderText("Enter File Name Here")
         self.plotNumberLineEdit.setPlaceholderText("Enter Start Plot Number Here")
 
+        self.colorFormatComboBox = QComboBox()
+        self.colorFormatComboBox.addItems(COLOR_FORMATS.keys())
+        self.colorFormatComboBox.setCurrentText(DEFAULT_COLOR_FORMAT)
+        self.colorFormatComboBox.setFont(DEFAULT_FONT)
+        self.colorFormatComboBox.setToolTip(
+            "File format of the color images: bmp is uncompressed, png and webp are lossless, "
+            "webp is smaller but slow to write, jpeg is lossy and the smallest"
+        )
+
+        self.pngCompressionComboBox = QComboBox()
+        self.pngCompressionComboBox.addItems([str(level) for level in range(10)])
+        self.pngCompressionComboBox.setCurrentText(str(PNG_COMPRESSION))
+        self.pngCompressionComboBox.setFont(DEFAULT_FONT)
+        self.pngCompressionComboBox.setToolTip(
+            "Compression level of png color images, 0 is the fastest to write and the largest, "
+            "higher levels take several times longer for a few % smaller images"
+        )
+        self.colorFormatComboBox.currentTextChanged.connect(self.update_png_compression)
+        self.update_png_compression(self.colorFormatComboBox.currentText())
+
+        self.depthFormatComboBox = QComboBox()
+        self.depthFormatComboBox.addItems(DEPTH_FORMATS.keys())
+        self.depthFormatComboBox.setCurrentText(DEFAULT_DEPTH_FORMAT)
+        self.depthFormatComboBox.setFont(DEFAULT_FONT)
+        self.depthFormatComboBox.setToolTip(
+            "File format of the depth data, txt is the legacy format and is slow to write"
+        )
+
+        self.depthProcessingComboBox = QComboBox()
+        self.depthProcessingComboBox.addItems(DEPTH_PROCESSING_PRESETS.keys())
+        self.depthProcessingComboBox.setCurrentText(DEFAULT_DEPTH_PROCESSING)
+        self.depthProcessingComboBox.setFont(DEFAULT_FONT)
+        self.depthProcessingComboBox.setToolTip(
+            "Processing of the saved depth data: raw as streamed, aligned to the color image, "
+            "filtered (smoothed, holes filled) and aligned, or decimated to half resolution before that"
+        )
+
         self.keyboard = VirtualKeyboard()
 
         self.newFileLineEdit.clicked.connect(self.keyboard.setLineEdit)
@@ -67,13 +113,29 @@ class NewExperimentPage(QDialog):
 
         newFileLineEdit_label = QLabel("Experiment Name")
         plotNumberLineEdit_label = QLabel("Plot Number")
+        colorFormatComboBox_label = QLabel("Color Format")
+        pngCompressionComboBox_label = QLabel("PNG Compression")
+        depthFormatComboBox_label = QLabel("Depth Format")
+        depthProcessingComboBox_label = QLabel("Depth Processing")
         newFileLineEdit_label.setFont(DEFAULT_FONT)
         plotNumberLineEdit_label.setFont(DEFAULT_FONT)
+        colorFormatComboBox_label.setFont(DEFAULT_FONT)
+        pngCompressionComboBox_label.setFont(DEFAULT_FONT)
+        depthFormatComboBox_label.setFont(DEFAULT_FONT)
+        depthProcessingComboBox_label.setFont(DEFAULT_FONT)
 
         self.lineedit_layout.addWidget(self.newFileLineEdit, 0, 0)
         self.lineedit_layout.addWidget(self.plotNumberLineEdit, 0, 1)
+        self.lineedit_layout.addWidget(self.colorFormatComboBox, 0, 2)
+        self.lineedit_layout.addWidget(self.pngCompressionComboBox, 0, 3)
+        self.lineedit_layout.addWidget(self.depthFormatComboBox, 0, 4)
+        self.lineedit_layout.addWidget(self.depthProcessingComboBox, 0, 5)
         self.lineedit_layout.addWidget(newFileLineEdit_label, 1, 0)
         self.lineedit_layout.addWidget(plotNumberLineEdit_label, 1, 1)
+        self.lineedit_layout.addWidget(colorFormatComboBox_label, 1, 2)
+        self.lineedit_layout.addWidget(pngCompressionComboBox_label, 1, 3)
+        self.lineedit_layout.addWidget(depthFormatComboBox_label, 1, 4)
+        self.lineedit_layout.addWidget(depthProcessingComboBox_label, 1, 5)
 
         self.keyboard_layout.addWidget(self.keyboard, 0, 0)
 
@@ -91,10 +153,18 @@ class NewExperimentPage(QDialog):
         self.lineedit_group_box.setLayout(self.lineedit_layout)
         self.keyboard_group_box.setLayout(self.keyboard_layout)
 
+    def update_png_compression(self, color_format):
+        """Enables the png compression level only while png is the color format.
+
+        Args:
+            color_format (str): the color format selected
+        """
+        self.pngCompressionComboBox.setEnabled(color_format == "png")
+
     def create_experiment(self):
         """
         Sets up a new experiment based off the user's input.
-        Creates all of the RGB, Depth, and Metadata directories using filename and sets the plot number.
+        Creates all of the RGB, Depth, and Metadata directories using filename, saves the experiment settings and sets the plot number.
         """
         # validate experiment name ?
         experiment_name = self.newFileLineEdit.text()
@@ -133,6 +203,13 @@ class NewExperimentPage(QDialog):
             os.mkdir(os.path.join(new_exp_path, "RGB"))
             os.mkdir(os.path.join(new_exp_path, "Depth"))
             os.mkdir(os.path.join(new_exp_path, "Metadata"))
+            save_experiment_settings(new_exp_path, {
+                "color_format": self.colorFormatComboBox.currentText(),
+                "png_compression": int(self.pngCompressionComboBox.currentText()),
+                "depth_format": self.depthFormatComboBox.currentText(),
+                "depth_processing": DEPTH_PROCESSING_PRESETS[self.depthProcessingComboBox.currentText()],
+                "created": datetime.now().isoformat(),
+            })
 
             # success message
             success_msg = QMessageBox()
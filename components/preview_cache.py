@@ -0,0 +1,135 @@
+"""
+This code handles the on-disk cache of the capture previews
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from util import PREVIEW_CACHE_MAX_MB, PREVIEW_CACHE_PATH
+from .experiment_settings import load_experiment_settings
+
+
+def experiment_cache_key(exp_path):
+    """Returns the directory of an experiment's previews in the cache, its name and a hash of its path and creation time,
+    so an experiment deleted and created again under the same name doesn't show the previews of the old one.
+
+    Args:
+        exp_path (str): path to the experiment
+
+    Returns:
+        str: "<experiment>-<hash>"
+    """
+    created = load_experiment_settings(exp_path).get("created", "")  # experiments from before it was recorded have none
+    instance = "%s|%s" % (os.path.abspath(exp_path), created)
+    return "%s-%s" % (os.path.basename(os.path.normpath(exp_path)), hashlib.sha1(instance.encode()).hexdigest()[:10])
+
+def preview_key(experiment_key, experiment_name, plot_number, serial=None):
+    """Returns the cache key of a capture's preview, from the fields of its metadata entry.
+
+    Args:
+        experiment_key (str): the experiment's experiment_cache_key
+        experiment_name (str): name of the experiment
+        plot_number (str): plot number, padded like in the metadata
+        serial (str): serial number of the camera, None for captures without one
+
+    Returns:
+        str: the key, "<experiment key>/<experiment>_<plot>[_<serial>]"
+    """
+    image_name = "%s_%s" % (experiment_name, plot_number)
+    if serial:
+        image_name = "%s_%s" % (image_name, serial)
+    return "%s/%s" % (experiment_key, image_name)
+
+
+class PreviewCache:
+    """
+    Directory of jpeg previews of the captures, a subdirectory per experiment named by its experiment_cache_key.
+    Once the previews take up more than max_bytes the least recently used are deleted. Reading a preview touches its file,
+    so the order they were used in carries over to the next run.
+    Used by the GUI thread and the preview loader, a lock guards the bookkeeping.
+    """
+
+    def __init__(self, path=PREVIEW_CACHE_PATH, max_bytes=PREVIEW_CACHE_MAX_MB * 2**20):
+        """Constructor for PreviewCache, lists the previews already cached.
+
+        Args:
+            path (str): directory of the cache, created if needed
+            max_bytes (int): size the previews are kept within
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> bytes, least recently used first
+        self.nbytes = 0
+
+        os.makedirs(path, exist_ok=True)
+        previews = []
+        for experiment in os.scandir(path):
+            if experiment.is_dir():
+                for preview in os.scandir(experiment.path):
+                    if preview.name.endswith(".jpg"):
+                        stat = preview.stat()
+                        previews.append((stat.st_mtime, "%s/%s" % (experiment.name, preview.name[:-4]), stat.st_size))
+        for _, key, size in sorted(previews):
+            self.entries[key] = size
+            self.nbytes += size
+
+    def get_path(self, key):
+        """Returns the path of a preview's file."""
+        return os.path.join(self.path, *key.split("/")) + ".jpg"
+
+    def get(self, key):
+        """Reads a preview and marks it as the most recently used.
+
+        Args:
+            key (str): the capture's preview_key
+
+        Returns:
+            bytes: the jpeg, None if it isn't cached
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # deleted behind the cache's back
+            with self.lock:
+                self.nbytes -= self.entries.pop(key, 0)
+            return None
+        return data
+
+    def put(self, key, data):
+        """Caches a preview, evicting the least recently used ones beyond the cache's size.
+
+        Args:
+            key (str): the capture's preview_key
+            data (bytes): the jpeg
+        """
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.nbytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            evicted = []
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                evicted_key, size = self.entries.popitem(last=False)
+                self.nbytes -= size
+                evicted.append(evicted_key)
+
+        for evicted_key in evicted:
+            try:
+                os.remove(self.get_path(evicted_key))
+            except OSError:
+                pass
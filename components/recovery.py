@@ -0,0 +1,181 @@
+"""
+This code handles recovering an experiment from a crash or power loss in the middle of saving captures
+"""
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import cv2
+
+from util import DURABILITY_BATCH_CAPTURES, NWORKERS, RECOVERY_VERIFY_LAST
+from .durable_writes import TMP_SUFFIX
+from .image_writers import COLOR_EXTENSIONS, DEPTH_EXTENSIONS, load_depth
+
+CORRUPT_SUFFIX = ".corrupt"  # appended to images that don't load, so they are set aside instead of deleted
+MTIME_RESOLUTION_SEC = 2  # coarsest modification time kept by a file system, FAT rounds them to 2 s
+
+# lists of what recover_experiment did, image names except for the temporary files
+RecoveryReport = namedtuple("RecoveryReport", ["removed_tmp", "corrupt", "unrecorded", "missing"])
+
+
+def list_images(directory, extensions):
+    """Maps the image names in a directory to their files, images written to several formats keep the first found.
+
+    Args:
+        directory (str): the experiment's RGB or Depth directory
+        extensions (tuple): extensions of the images to list
+
+    Returns:
+        dict: image name -> path of its file
+    """
+    images = {}
+    for fname in sorted(os.listdir(directory)):
+        image_name, extension = os.path.splitext(fname)
+        if extension.lower() in extensions:
+            images.setdefault(image_name, os.path.join(directory, fname))
+    return images
+
+def parse_image_name(experiment_name, image_name):
+    """Splits an image name into the plot number and the camera serial it was saved with.
+
+    Args:
+        experiment_name (str): name of the experiment
+        image_name (str): "<experiment>_<plot>[_<serial>]"
+
+    Returns:
+        tuple: (plot number as saved, serial or None), None if the image isn't named after a plot of the experiment
+    """
+    prefix = experiment_name + "_"
+    if not image_name.startswith(prefix):
+        return None
+    number, _, serial = image_name[len(prefix):].partition("_")
+    if not number.isdigit():
+        return None
+    return number, serial or None
+
+def image_loads(fname, is_color):
+    """Returns true if an image isn't empty and decodes."""
+    try:
+        if os.path.getsize(fname) == 0:
+            return False
+        if is_color:
+            # decoding at an eighth of the size still reads the whole file
+            return cv2.imread(fname, cv2.IMREAD_REDUCED_COLOR_8) is not None
+        return load_depth(fname) is not None
+    except Exception:
+        return False
+
+def set_aside(fname):
+    """Renames a corrupt image out of the way, keeping it for inspection."""
+    os.replace(fname, fname + CORRUPT_SUFFIX)
+
+def verify_window(durability, ncameras):
+    """Returns how many of the newest captures can have been reported saved without being on disk yet.
+
+    Args:
+        durability (str): durability policy the experiment is saved under, one of durable_writes.DURABILITY_POLICIES
+        ncameras (int): num of cameras the experiment was captured with
+
+    Returns:
+        int: num of the newest captures to verify, None to verify every capture
+    """
+    if durability == "none":
+        return None  # the OS writes them back in any order
+    if durability == "batched":
+        # each save worker of each camera can hold a batch renamed into place but not synced
+        return DURABILITY_BATCH_CAPTURES * NWORKERS * ncameras + RECOVERY_VERIFY_LAST
+    return RECOVERY_VERIFY_LAST
+
+def recover_experiment(exp_path, metadata):
+    """
+    Puts an experiment back in a consistent state after a crash or power loss mid-capture.
+    Every file is written to a temporary file renamed over it once complete, so a crash can leave temporary files behind,
+    images synced before they were whole by a power loss, or images saved without their metadata entry.
+        - the temporary files are deleted
+        - the images of the newest captures that can have been left unsynced under the metadata's durability policy
+          (see verify_window), and of the captures missing from the metadata, are decoded,
+          the empty or undecodable ones are renamed with CORRUPT_SUFFIX
+        - captures with both images but no metadata entry get an entry marked "recovered", dated from the color image
+        - captures missing from the metadata with only one of their images left have it renamed with CORRUPT_SUFFIX
+    Only the captures saved after the metadata journal was last written are taken as missing from the metadata, older images
+    without an entry were copied in or predate the metadata, and are left alone.
+    Metadata entries whose images are missing are only reported, the metadata is never rewritten.
+
+    Args:
+        exp_path (str): path to a plotcam experiment
+        metadata (metadata.Metadata): the experiment's metadata, just opened
+
+    Returns:
+        RecoveryReport: what was recovered
+    """
+    removed_tmp = []
+    for directory in ("RGB", "Depth", "Metadata"):
+        directory = os.path.join(exp_path, directory)
+        if not os.path.isdir(directory):
+            continue
+        for fname in os.listdir(directory):
+            if fname.endswith(TMP_SUFFIX):
+                os.remove(os.path.join(directory, fname))
+                removed_tmp.append(fname)
+
+    experiment_name = os.path.basename(os.path.normpath(exp_path))
+    color = list_images(os.path.join(exp_path, "RGB"), COLOR_EXTENSIONS)
+    depth = list_images(os.path.join(exp_path, "Depth"), DEPTH_EXTENSIONS)
+
+    entries = metadata.entries()
+    recorded = set()
+    for entry in entries:
+        image_name = "%s_%s" % (entry.get("name", experiment_name), entry.get("number"))
+        recorded.add(image_name)
+        # with one camera streaming, the images aren't suffixed with its serial
+        if entry.get("camera_serial"):
+            recorded.add("%s_%s" % (image_name, entry["camera_serial"]))
+
+    captures = {}  # image name -> (plot number, serial)
+    for image_name in set(color) | set(depth):
+        parsed = parse_image_name(experiment_name, image_name)
+        if parsed is not None:
+            captures[image_name] = parsed
+    by_number = sorted(captures, key=lambda image_name: (int(captures[image_name][0]), image_name))
+
+    journal_mtime = os.path.getmtime(metadata.journal_path)
+    unrecorded_since = set()  # captures saved after the journal was last written, without an entry
+    for image_name in set(captures) - recorded:
+        mtimes = [os.path.getmtime(images[image_name]) for images in (color, depth) if image_name in images]
+        if max(mtimes) >= journal_mtime - MTIME_RESOLUTION_SEC:
+            unrecorded_since.add(image_name)
+    ncameras = len({serial for _, serial in captures.values()}) or 1
+    nverify = verify_window(metadata.durability, ncameras)
+    to_verify = set(by_number if nverify is None else by_number[-nverify:]) | unrecorded_since
+
+    corrupt = []
+    for image_name in sorted(to_verify):
+        for images, is_color in ((color, True), (depth, False)):
+            if image_name in images and not image_loads(images[image_name], is_color):
+                set_aside(images.pop(image_name))
+                corrupt.append(image_name)
+
+    unrecorded = []
+    for image_name in by_number:
+        if image_name not in unrecorded_since:
+            continue
+        if image_name in color and image_name in depth:
+            number, serial = captures[image_name]
+            saved_at = datetime.fromtimestamp(os.path.getmtime(color[image_name]))
+            metadata.add_entry(number, saved_at.strftime('%H:%M:%S'), saved_at.strftime('%d/%m/%Y'), None, None, experiment_name,
+                               serial=serial, recovered=True)
+            unrecorded.append(image_name)
+        else:
+            # half a capture, the other image was never written or didn't load
+            for images in (color, depth):
+                if image_name in images:
+                    set_aside(images.pop(image_name))
+                    corrupt.append(image_name)
+    if unrecorded:
+        metadata.save()
+
+    # the plots with a color image, from any camera
+    plots = {"%s_%s" % (experiment_name, captures[image_name][0]) for image_name in color if image_name in captures}
+    missing = sorted({"%s_%s" % (entry.get("name", experiment_name), entry.get("number")) for entry in entries} - plots)
+
+    return RecoveryReport(removed_tmp, sorted(set(corrupt)), unrecorded, missing)
@@ -0,0 +1,321 @@
+"""
+This code handles the review strip of the last captures shown under the stream
+"""
+import glob
+import logging
+import os
+import queue
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPixmap, QPixmapCache
+from PyQt5.QtWidgets import QAbstractItemView, QListView
+
+from util import FRAME_ROTATION, PREVIEW_PIXMAP_CACHE_MB, PREVIEW_SIZE, REVIEW_STRIP_ICON_SIZE, resolution_width
+from .preview_cache import PreviewCache, experiment_cache_key, preview_key
+
+log = logging.getLogger("pcl_reviewstrip")
+
+
+class PreviewLoader(QThread):
+    """Background thread that loads the previews the review strip is missing, from the preview cache or, for captures taken
+    before previews were cached, by shrinking their color image. The most recently requested previews are loaded first,
+    so the ones scrolled to don't wait behind the ones scrolled past.
+
+    Args:
+        QThread (QThread): Base class of Qt threads.
+    """
+
+    previewLoaded = pyqtSignal(str, QImage)  # preview key, preview scaled for the strip, null if the capture has no image
+
+    def __init__(self, preview_cache):
+        """Constructor for the PreviewLoader.
+
+        Args:
+            preview_cache (preview_cache.PreviewCache): cache the previews are read from and added to
+        """
+        super().__init__()
+        self.preview_cache = preview_cache
+        self.requests = queue.LifoQueue()
+
+    def request(self, key, exp_path, image_names):
+        """Queues a preview to load.
+
+        Args:
+            key (str): the capture's preview key
+            exp_path (str): path to the capture's experiment
+            image_names (list): names the capture's color image may be saved under, in order of preference
+        """
+        self.requests.put((key, exp_path, image_names))
+
+    def clear(self):
+        """Drops the requests not loaded yet."""
+        while True:
+            try:
+                self.requests.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        """Loads the requested previews until stopped."""
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+
+            key, exp_path, image_names = request
+            try:
+                data = self.preview_cache.get(key) or self.make_preview(key, exp_path, image_names)
+            except Exception as e:
+                log.warning("Could not load the preview of %s: %s" % (key, e))
+                data = None
+
+            image = QImage()
+            if data:
+                image.loadFromData(data)
+                image = image.scaledToHeight(REVIEW_STRIP_ICON_SIZE, Qt.SmoothTransformation)
+            self.previewLoaded.emit(key, image)
+
+    def make_preview(self, key, exp_path, image_names):
+        """Shrinks a capture's color image into a preview and caches it.
+
+        Args:
+            key (str): the capture's preview key
+            exp_path (str): path to the capture's experiment
+            image_names (list): names the capture's color image may be saved under, in order of preference
+
+        Returns:
+            bytes: the jpeg preview, None if the capture has no color image
+        """
+        # imported here, the strip is created before opencv is needed
+        import cv2
+        from .image_writers import COLOR_EXTENSIONS, encode_thumbnail
+
+        for image_name in image_names:
+            for fname in glob.glob(os.path.join(exp_path, "RGB", glob.escape(image_name) + ".*")):
+                if os.path.splitext(fname)[1].lower() not in COLOR_EXTENSIONS:
+                    continue
+                # decoding at a quarter size is faster, the preview doesn't need more
+                color_arr = cv2.imread(fname, cv2.IMREAD_REDUCED_COLOR_4)
+                if color_arr is None:
+                    continue
+                data = encode_thumbnail(color_arr, PREVIEW_SIZE)
+                self.preview_cache.put(key, data)
+                return data
+        return None
+
+    def stop(self):
+        """Stops the thread and waits for it to finish."""
+        self.requests.put(None)
+        self.wait()
+
+
+class ReviewStripModel(QAbstractListModel):
+    """
+    The captures of the open experiment, newest first, with their previews.
+    Only the rows on screen are asked for their preview, those not in the QPixmapCache are loaded in the background,
+    so the strip scrolls as fast with thousands of captures as with a few.
+    """
+
+    def __init__(self, preview_loader):
+        """Constructor for ReviewStripModel.
+
+        Args:
+            preview_loader (PreviewLoader): loader of the previews not in the QPixmapCache
+        """
+        super().__init__()
+        self.preview_loader = preview_loader
+        self.preview_loader.previewLoaded.connect(self.on_preview_loaded)
+        self.exp_path = None
+        self.experiment_key = None  # the experiment's directory in the preview cache
+        self.captures = []  # (key, label, image names) of every capture, oldest first
+        self.positions = {}  # key -> position in captures
+        self.requested = set()  # keys being loaded
+        self.missing = set()  # keys of captures without a color image
+
+        # the camera's frames are landscape, the placeholder has the shape of a preview of them saved rotated
+        width, height = max(resolution_width), resolution_width[max(resolution_width)]
+        if FRAME_ROTATION % 180:
+            width, height = height, width
+        self.placeholder = QPixmap(round(REVIEW_STRIP_ICON_SIZE * width / height), REVIEW_STRIP_ICON_SIZE)
+        self.placeholder.fill(QColor(60, 60, 60))
+
+    def set_experiment(self, exp_path, entries):
+        """Lists the captures of an experiment.
+
+        Args:
+            exp_path (str): path to the experiment
+            entries (list): the experiment's metadata entries
+        """
+        self.beginResetModel()
+        self.exp_path = exp_path
+        self.experiment_key = experiment_cache_key(exp_path)
+        self.captures = []
+        self.positions = {}
+        self.requested.clear()
+        self.missing.clear()
+        self.preview_loader.clear()
+        for entry in entries:
+            self.add(entry["name"], entry["number"], entry.get("camera_serial"))
+        self.endResetModel()
+
+    def add(self, experiment_name, plot_number, serial):
+        """Adds a capture to the list, a capture of a plot taken again replaces the previous one.
+
+        Args:
+            experiment_name (str): name of the capture's experiment
+            plot_number (str): plot number, padded like in the metadata
+            serial (str): serial number of the camera, None for captures without one
+        """
+        key = preview_key(self.experiment_key, experiment_name, plot_number, serial)
+        image_name = key.split("/")[1]
+        # with one camera streaming, the images aren't suffixed with its serial
+        image_names = [image_name, "%s_%s" % (experiment_name, plot_number)] if serial else [image_name]
+        label = "%s %s" % (plot_number, serial[-4:]) if serial else plot_number
+
+        if key in self.positions:
+            self.captures[self.positions[key]] = (key, label, image_names)
+            return
+        self.positions[key] = len(self.captures)
+        self.captures.append((key, label, image_names))
+
+    def add_capture(self, experiment_name, plot_number, serial, pixmap):
+        """Adds a capture just saved to the front of the list, with its preview.
+
+        Args:
+            experiment_name (str): name of the capture's experiment
+            plot_number (str): plot number, padded like in the metadata
+            serial (str): serial number of the camera, None for the default camera
+            pixmap (QPixmap): the capture's preview, scaled for the strip
+        """
+        key = preview_key(self.experiment_key, experiment_name, plot_number, serial)
+        QPixmapCache.insert(key, pixmap)
+        self.missing.discard(key)
+
+        if key in self.positions:
+            row = self.row_of(key)
+            self.dataChanged.emit(self.index(row), self.index(row))
+            return
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.add(experiment_name, plot_number, serial)
+        self.endInsertRows()
+
+    def row_of(self, key):
+        """Returns the row of a capture, the newest is the first."""
+        return len(self.captures) - 1 - self.positions[key]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.captures)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        key, label, image_names = self.captures[len(self.captures) - 1 - index.row()]
+        if role == Qt.DisplayRole:
+            return label
+        if role == Qt.ToolTipRole:
+            return image_names[0]
+        if role == Qt.DecorationRole:
+            pixmap = QPixmapCache.find(key)
+            if pixmap is not None and not pixmap.isNull():
+                return pixmap
+            if key not in self.requested and key not in self.missing:
+                self.requested.add(key)
+                self.preview_loader.request(key, self.exp_path, image_names)
+            return self.placeholder
+        return None
+
+    def on_preview_loaded(self, key, image):
+        """Shows a preview the loader is done with.
+
+        Args:
+            key (str): the capture's preview key
+            image (QImage): the preview scaled for the strip, null if the capture has no color image
+        """
+        self.requested.discard(key)
+        if key not in self.positions:
+            return  # a capture of the experiment open before
+        if image.isNull():
+            self.missing.add(key)
+        else:
+            QPixmapCache.insert(key, QPixmap.fromImage(image))
+        row = self.row_of(key)
+        self.dataChanged.emit(self.index(row), self.index(row), [Qt.DecorationRole])
+
+
+class ReviewStrip(QListView):
+    """
+    A row of the previews of the open experiment's captures, the newest on the left.
+    The previews of new captures are made by the save workers from the frame in memory, the strip never reads the experiment
+    for them. They are kept in an on-disk preview cache, and scaled for the strip in the QPixmapCache.
+    """
+
+    def __init__(self):
+        """Sets up the strip, the preview cache is opened with the first experiment."""
+        super().__init__()
+        QPixmapCache.setCacheLimit(PREVIEW_PIXMAP_CACHE_MB * 1024)
+        self.preview_cache = None
+        self.preview_loader = None
+        self.strip_model = None
+
+        self.setViewMode(QListView.IconMode)
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setIconSize(QSize(REVIEW_STRIP_ICON_SIZE, REVIEW_STRIP_ICON_SIZE))
+        self.setSpacing(2)
+        self.setFixedHeight(REVIEW_STRIP_ICON_SIZE + self.fontMetrics().height() + self.horizontalScrollBar().sizeHint().height() + 12)
+
+    def open_cache(self):
+        """Opens the preview cache and starts the loader, the first time a preview is needed.
+        Opening the cache lists the previews in it, it is held off so the window doesn't wait on it."""
+        if self.preview_cache is None:
+            self.preview_cache = PreviewCache()
+            self.preview_loader = PreviewLoader(self.preview_cache)
+            self.preview_loader.start()
+            self.strip_model = ReviewStripModel(self.preview_loader)
+            self.setModel(self.strip_model)
+
+    def set_experiment(self, exp_path, entries):
+        """Shows the captures of an experiment.
+
+        Args:
+            exp_path (str): path to the experiment
+            entries (list): the experiment's metadata entries
+        """
+        self.open_cache()
+        self.strip_model.set_experiment(exp_path, entries)
+        self.horizontalScrollBar().setValue(0)
+
+    def add_capture(self, exp_path, plot_number, serial, preview):
+        """Caches the preview of a capture just saved, and shows it if it belongs to the open experiment.
+
+        Args:
+            exp_path (str): path to the capture's experiment
+            plot_number (str): plot number, padded like in the metadata
+            serial (str): serial number of the camera, None for the default camera
+            preview (bytes): the jpeg preview the save worker made
+        """
+        self.open_cache()
+        experiment_name = os.path.basename(os.path.normpath(exp_path))
+        is_open = exp_path == self.strip_model.exp_path
+        experiment_key = self.strip_model.experiment_key if is_open else experiment_cache_key(exp_path)
+        try:
+            self.preview_cache.put(preview_key(experiment_key, experiment_name, plot_number, serial), preview)
+        except OSError as e:
+            log.warning("Could not cache the preview of plot %s: %s" % (plot_number, e))
+
+        if is_open:
+            pixmap = QPixmap()
+            pixmap.loadFromData(preview)
+            self.strip_model.add_capture(experiment_name, plot_number, serial,
+                                         pixmap.scaledToHeight(REVIEW_STRIP_ICON_SIZE, Qt.SmoothTransformation))
+            self.horizontalScrollBar().setValue(0)
+
+    def stop(self):
+        """Stops the preview loader."""
+        if self.preview_loader is not None:
+            self.preview_loader.stop()
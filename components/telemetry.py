@@ -0,0 +1,306 @@
+"""
+This code handles the performance telemetry of the GUI and camera processes
+"""
+import csv
+import io
+import json
+import os
+import time
+from bisect import bisect_left
+
+from util import TELEMETRY_DUMP_BACKUPS, TELEMETRY_DUMP_MAX_MB
+
+# upper bounds of the latency histogram buckets in ms, sqrt(2) apart from 10 us to 40 s, percentiles are within 20 %
+HISTOGRAM_BOUNDS_MS = tuple(0.01 * 2 ** (i / 2) for i in range(44))
+DUMP_COLUMNS = ("time", "process", "period_sec", "metric", "kind", "count", "value", "p50", "p95", "max")
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, adding a value is a bisect and a few additions, merging two is adding their counts."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self, counts=None, count=0, total=0.0, max_value=0.0):
+        self.counts = list(counts) if counts else [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = count
+        self.total = total
+        self.max = max_value
+
+    def add(self, ms):
+        """Adds a latency in ms."""
+        self.counts[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        """Adds the latencies of another histogram."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket a percentile falls in, the max for the last bucket."""
+        rank = self.count * percent / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(HISTOGRAM_BOUNDS_MS[i], self.max) if i < len(HISTOGRAM_BOUNDS_MS) else self.max
+        return self.max
+
+    def to_tuple(self):
+        """Returns the histogram as a tuple that pickles small, for Histogram(*t) on the other side."""
+        return self.counts, self.count, self.total, self.max
+
+
+class Telemetry:
+    """
+    Counters, gauges and latency histograms of a process, collected over a period and then handed off as a snapshot.
+    Recording is a dict lookup and a few additions, nothing is logged or written per frame.
+        counters: num of events, shown as a rate over the period
+        gauges: sampled levels such as a queue's depth, the last and the highest sample of the period
+        histograms: latencies in ms
+    """
+
+    def __init__(self, process):
+        """Constructor for Telemetry.
+
+        Args:
+            process (str): name of the process the telemetry is collected in
+        """
+        self.process = process
+        self.reset()
+
+    def reset(self):
+        """Starts a new period."""
+        self.counters = {}
+        self.gauges = {}  # name -> (last, max)
+        self.histograms = {}
+        self.period_start = time.time()
+
+    def count(self, name, n=1):
+        """Counts events."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        """Samples a level."""
+        _, highest = self.gauges.get(name, (value, value))
+        self.gauges[name] = (value, max(highest, value))
+
+    def observe(self, name, ms):
+        """Adds a latency in ms."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(ms)
+
+    def snapshot(self):
+        """Hands off the period's telemetry and starts a new period.
+
+        Returns:
+            dict: the period's telemetry, picklable so it can be sent from the camera process
+        """
+        now = time.time()
+        snapshot = {
+            "process": self.process,
+            "time": now,
+            "period_sec": now - self.period_start,
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "histograms": {name: histogram.to_tuple() for name, histogram in self.histograms.items()},
+        }
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        """Adds a snapshot's telemetry to this one's, to total the periods of a session."""
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+        for name, (last, highest) in snapshot["gauges"].items():
+            _, total_highest = self.gauges.get(name, (last, highest))
+            self.gauges[name] = (last, max(highest, total_highest))
+        for name, histogram in snapshot["histograms"].items():
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].merge(Histogram(*histogram))
+
+
+def summarize_snapshot(snapshot):
+    """Flattens a snapshot into a row per metric.
+
+    Args:
+        snapshot (dict): a Telemetry snapshot
+
+    Returns:
+        list: dicts with the DUMP_COLUMNS, counters have their rate per second as the value,
+            gauges their last sample and histograms their mean in ms
+    """
+    period_sec = max(snapshot["period_sec"], 1e-6)
+    common = {"time": round(snapshot["time"], 3), "process": snapshot["process"], "period_sec": round(period_sec, 3)}
+    rows = []
+    for name, value in sorted(snapshot["counters"].items()):
+        rows.append(dict(common, metric=name, kind="counter", count=value, value=round(value / period_sec, 2),
+                         p50=None, p95=None, max=None))
+    for name, (last, highest) in sorted(snapshot["gauges"].items()):
+        rows.append(dict(common, metric=name, kind="gauge", count=None, value=last, p50=None, p95=None, max=highest))
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        histogram = Histogram(*histogram)
+        rows.append(dict(common, metric=name, kind="histogram", count=histogram.count, value=round(histogram.mean(), 3),
+                         p50=round(histogram.percentile(50), 3), p95=round(histogram.percentile(95), 3),
+                         max=round(histogram.max, 3)))
+    return rows
+
+def format_rows(process, rows):
+    """Formats the rows of a process as the lines of the stats overlay.
+
+    Args:
+        process (str): name of the process
+        rows (list): rows of summarize_snapshot
+
+    Returns:
+        list: a line for the process, with its counters, and a line per gauge and histogram
+    """
+    counters = ", ".join("%s %.1f/s" % (row["metric"], row["value"]) for row in rows if row["kind"] == "counter")
+    lines = ["%s: %s" % (process, counters)]
+    for row in rows:
+        if row["kind"] == "gauge":
+            lines.append("  %-20s %6g  max %g" % (row["metric"], row["value"], row["max"]))
+        elif row["kind"] == "histogram":
+            lines.append("  %-20s %6.1f ms  p95 %6.1f  max %6.1f" % (row["metric"], row["value"], row["p95"], row["max"]))
+    return lines
+
+
+class TelemetryDump:
+    """
+    File the telemetry snapshots are appended to for analysis after a day in the field, as CSV with a row per metric
+    if the path ends in .csv, otherwise as JSON Lines with a snapshot per line.
+    Once the file reaches TELEMETRY_DUMP_MAX_MB it is rotated to <path>.1, keeping TELEMETRY_DUMP_BACKUPS old files.
+    """
+
+    def __init__(self, path, max_bytes=TELEMETRY_DUMP_MAX_MB * 2**20, backups=TELEMETRY_DUMP_BACKUPS):
+        """Constructor for TelemetryDump, appends to the file if it exists.
+
+        Args:
+            path (str): path of the dump file
+            max_bytes (int): size the file is rotated at
+            backups (int): num of rotated files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.is_csv = path.lower().endswith(".csv")
+        self.file = None
+        self.open()
+
+    def open(self):
+        """Opens the dump file for appending, writing the CSV header to a new one."""
+        self.file = open(self.path, "a", newline="")
+        if self.is_csv and self.file.tell() == 0:
+            csv.writer(self.file).writerow(DUMP_COLUMNS)
+
+    def write(self, snapshot):
+        """Appends a snapshot, rotating the file first if it would grow past max_bytes.
+
+        Args:
+            snapshot (dict): a Telemetry snapshot
+        """
+        rows = summarize_snapshot(snapshot)
+        buffer = io.StringIO()
+        if self.is_csv:
+            csv.DictWriter(buffer, DUMP_COLUMNS).writerows(rows)
+        else:
+            buffer.write(json.dumps({"time": snapshot["time"], "process": snapshot["process"], "metrics": rows}) + "\n")
+        data = buffer.getvalue()
+
+        if self.file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+
+    def rotate(self):
+        """Shifts the dump file to <path>.1, and the older ones along, dropping the oldest."""
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists("%s.%i" % (self.path, i)):
+                os.replace("%s.%i" % (self.path, i), "%s.%i" % (self.path, i + 1))
+        if self.backups:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.open()
+
+    def close(self):
+        self.file.close()
+
+
+class TelemetryCollector:
+    """
+    Collects the snapshots of every process in the GUI, keeps the last period of each for the stats overlay,
+    totals them over the session and appends them to the dump file if there is one.
+    The overlay keeps showing a latency until a later period has new ones, captures don't come every period.
+    """
+
+    def __init__(self):
+        """Constructor for TelemetryCollector, the snapshots aren't dumped until a dump file is opened."""
+        self.latest = {}  # process -> metric -> its row of the last period it was recorded in
+        self.totals = {}  # process -> Telemetry of the session
+        self.dump = None
+
+    def open_dump(self, dump_path):
+        """Starts dumping the snapshots to a file.
+
+        Args:
+            dump_path (str): path of the dump file, appended to if it exists
+
+        Raises:
+            OSError: the file can't be opened
+        """
+        self.dump = TelemetryDump(dump_path)
+
+    def add(self, snapshot):
+        """Collects a snapshot.
+
+        Args:
+            snapshot (dict): a Telemetry snapshot
+        """
+        process = snapshot["process"]
+        latest = self.latest.setdefault(process, {})
+        for name in [name for name, row in latest.items() if row["kind"] != "histogram"]:
+            del latest[name]  # rates and levels of an old period are stale
+        for row in summarize_snapshot(snapshot):
+            latest[row["metric"]] = row
+        if process not in self.totals:
+            self.totals[process] = Telemetry(process)
+            self.totals[process].period_start = snapshot["time"] - snapshot["period_sec"]
+        self.totals[process].merge(snapshot)
+        if self.dump is not None:
+            self.dump.write(snapshot)
+
+    def overlay_text(self):
+        """Returns the text of the stats overlay, the last period of every process."""
+        return "\n".join(line for process in sorted(self.latest)
+                         for line in format_rows(process, sorted(self.latest[process].values(), key=lambda row: (row["kind"], row["metric"]))))
+
+    def summary(self):
+        """Returns the lines summing up the session, a line per process and per metric."""
+        lines = []
+        for process in sorted(self.totals):
+            totals = self.totals[process]
+            snapshot = {"process": process, "time": time.time(), "period_sec": time.time() - totals.period_start,
+                        "counters": totals.counters, "gauges": totals.gauges,
+                        "histograms": {name: histogram.to_tuple() for name, histogram in totals.histograms.items()}}
+            lines += format_rows(process, summarize_snapshot(snapshot))
+        return lines
+
+    def close(self):
+        """Closes the dump file, the snapshots are still collected."""
+        if self.dump is not None:
+            self.dump.close()
+            self.dump = None
@@ -0,0 +1,72 @@
+"""
+Converts legacy Depth/*.txt files to one of the binary depth formats.
+
+Usage:
+    python convert-depth.py experiments/my_experiment -f npy
+"""
+import glob
+import os
+import sys
+from argparse import ArgumentParser
+
+from components.image_writers import DEPTH_FORMATS, convert_depth_file
+from components.experiment_settings import get_settings_path, load_experiment_settings, save_experiment_settings
+from util import DEFAULT_DEPTH_FORMAT
+
+
+def main():
+    """
+    Convert Depth main.
+    Converts every txt depth file of the given experiments, and records the new depth format in the experiment settings
+    so that further captures are written in the same format.
+    """
+    parser = ArgumentParser(
+        prog="python convert-depth.py",
+        description="Converts PlotCamLite txt depth files to a binary depth format.")
+
+    parser.add_argument(
+        'experiments',
+        nargs='+',
+        help="paths to the experiment directories to convert",
+    )
+
+    parser.add_argument(
+        '-f', '--format',
+        dest="depth_format",
+        type=str,
+        default=DEFAULT_DEPTH_FORMAT,
+        choices=[fmt for fmt in DEPTH_FORMATS if fmt != "txt"],
+        help="depth format to convert to, defaults to %s" % DEFAULT_DEPTH_FORMAT,
+    )
+
+    parser.add_argument(
+        '--keep',
+        dest="keep",
+        action='store_true',
+        help="keep the original txt files",
+    )
+
+    args = parser.parse_args()
+
+    failed = 0
+    for exp_path in args.experiments:
+        txt_fnames = sorted(glob.glob(os.path.join(exp_path, "Depth", "*.txt")))
+        print("%s: converting %i depth files to %s" % (exp_path, len(txt_fnames), args.depth_format))
+
+        for fname in txt_fnames:
+            try:
+                convert_depth_file(fname, args.depth_format, remove_original=not args.keep)
+            except (OSError, ValueError) as e:
+                print("  failed to convert %s: %s" % (fname, e))
+                failed += 1
+
+        if os.path.isdir(os.path.dirname(get_settings_path(exp_path))):
+            settings = load_experiment_settings(exp_path)
+            settings["depth_format"] = args.depth_format
+            save_experiment_settings(exp_path, settings)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import sys
+from util import configure_plotcamlite, startup_profile
 from PyQt5.QtWidgets import QApplication
+startup_profile.mark("import util and PyQt5")
 from components.main_window import PlotCamLiteWindow_Monitor
-from util import configure_plotcamlite
+startup_profile.mark("import main window")
 
 
 def main():
@@ -9,12 +11,18 @@ def main():
     Plot Cam Lite main.
     Starts the PlotCamLite.
     Configures the PCL through command line arguments.
+    Runs the batch processing of experiments instead of the GUI with "batch" as the first argument.
     """
+    if sys.argv[1:2] == ["batch"]:
+        from components.batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
 
     configure_plotcamlite()
     app = QApplication(sys.argv)
+    startup_profile.mark("create application")
 
     ex = PlotCamLiteWindow_Monitor()
+    startup_profile.mark("build main window")
     ex.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,8 @@
+"""
+This code handles the setup shared by the tests, run them from the repository root with python -m pytest
+"""
+import os
+import sys
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
@@ -0,0 +1,61 @@
+"""
+This code handles the tests of the batch tool's metadata validation
+"""
+import os
+
+from components.batch import validate_metadata
+from components.metadata import Metadata
+
+
+def make_experiment(tmp_path, name="exp"):
+    """Creates an empty experiment, with its RGB, Depth and Metadata directories."""
+    exp_path = tmp_path / name
+    for directory in ("RGB", "Depth", "Metadata"):
+        (exp_path / directory).mkdir(parents=True)
+    return exp_path
+
+def add_capture(exp_path, number, serial=None, color=True, depth=True, entry=True):
+    """Adds a capture's images and metadata entry to an experiment, the images are empty files."""
+    name = os.path.basename(str(exp_path))
+    image_name = "%s_%s" % (name, number) if serial is None else "%s_%s_%s" % (name, number, serial)
+    if color:
+        (exp_path / "RGB" / (image_name + ".png")).write_bytes(b"")
+    if depth:
+        (exp_path / "Depth" / (image_name + ".npy")).write_bytes(b"")
+    if entry:
+        metadata = Metadata(str(exp_path / "Metadata" / ("%s.json" % name)))
+        metadata.add_entry(number, "12:00:00", "01/05/2021", 0, 0, name, serial=serial)
+        metadata.close()
+
+
+def test_consistent_experiment(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_capture(exp_path, "001")
+    add_capture(exp_path, "002")
+    assert validate_metadata(str(exp_path)) == []
+
+def test_multi_camera_images_match_by_serial(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_capture(exp_path, "001", serial="111")
+    add_capture(exp_path, "001", serial="222")
+    assert validate_metadata(str(exp_path)) == []
+
+def test_missing_and_orphaned_images(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_capture(exp_path, "001")
+    add_capture(exp_path, "002", depth=False)
+    add_capture(exp_path, "003", entry=False)
+    assert validate_metadata(str(exp_path)) == [
+        "1 metadata entries without both images: exp_002",
+        "1 images without a metadata entry: exp_003",
+    ]
+
+def test_leftover_files_are_not_images(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_capture(exp_path, "001")
+    (exp_path / "RGB" / "exp_002.png.tmp").write_bytes(b"")
+    (exp_path / "Depth" / "exp_001.npy.corrupt").write_bytes(b"")
+    (exp_path / "RGB" / "notes.txt").write_bytes(b"")
+    assert validate_metadata(str(exp_path)) == [
+        "2 files left by an interrupted save or set aside by recovery: exp_002.png.tmp, exp_001.npy.corrupt",
+    ]
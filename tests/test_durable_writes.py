@@ -0,0 +1,102 @@
+"""
+This code handles the tests of the durable writes and their durability policies
+"""
+import os
+
+import pytest
+
+from components import durable_writes
+from components.durable_writes import TMP_SUFFIX, DurableWriter
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Records the file descriptors synced instead of syncing them."""
+    synced = []
+    monkeypatch.setattr(durable_writes.os, "fsync", synced.append)
+    return synced
+
+def write_file(writer, tmp_path, name, data=b"data"):
+    """Writes a file through the writer, returning its path."""
+    fname = str(tmp_path / name)
+    writer.write(fname, lambda f: f.write(data))
+    return fname
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DurableWriter("sometimes")
+
+def test_write_replaces_file(tmp_path):
+    writer = DurableWriter("none")
+    fname = write_file(writer, tmp_path, "a.bin", b"old")
+    write_file(writer, tmp_path, "a.bin", b"new")
+    with open(fname, "rb") as f:
+        assert f.read() == b"new"
+    assert os.listdir(str(tmp_path)) == ["a.bin"]
+
+def test_failed_write_keeps_previous_file(tmp_path):
+    writer = DurableWriter("capture")
+    fname = write_file(writer, tmp_path, "a.bin", b"old")
+
+    def write_data(f):
+        f.write(b"half")
+        raise IOError("disk full")
+    with pytest.raises(IOError):
+        writer.write(fname, write_data)
+
+    with open(fname, "rb") as f:
+        assert f.read() == b"old"
+    assert not os.path.exists(fname + TMP_SUFFIX)
+
+def test_capture_policy_syncs_every_capture(tmp_path, fsyncs):
+    writer = DurableWriter("capture")
+    write_file(writer, tmp_path, "a.png")
+    write_file(writer, tmp_path, "a.npy")
+    assert len(fsyncs) == 2  # each file before it is renamed
+    assert writer.unsynced == []
+
+    writer.capture_done()
+    assert writer.sync_due() is None
+    assert writer.unsynced_dirs == set()
+
+def test_batched_policy_syncs_every_batch(tmp_path, fsyncs, monkeypatch):
+    monkeypatch.setattr(durable_writes, "DURABILITY_BATCH_CAPTURES", 3)
+    writer = DurableWriter("batched")
+    for number in range(2):
+        write_file(writer, tmp_path, "%i.png" % number)
+        writer.capture_done()
+    assert fsyncs == []
+    assert len(writer.unsynced) == 2
+    assert writer.sync_due() > 0
+
+    write_file(writer, tmp_path, "2.png")
+    writer.capture_done()
+    assert len(fsyncs) >= 3  # the files, and the directory outside of windows
+    assert writer.unsynced == []
+    assert writer.ncaptures == 0
+    assert writer.sync_due() is None
+
+def test_batched_policy_syncs_old_captures(tmp_path, fsyncs, monkeypatch):
+    monkeypatch.setattr(durable_writes, "DURABILITY_BATCH_SEC", 0)
+    writer = DurableWriter("batched")
+    write_file(writer, tmp_path, "0.png")
+    writer.capture_done()
+    assert fsyncs
+    assert writer.unsynced == []
+
+def test_batched_policy_tolerates_deleted_files(tmp_path, fsyncs):
+    writer = DurableWriter("batched")
+    fname = write_file(writer, tmp_path, "0.png")
+    os.remove(fname)
+    writer.sync()
+    assert writer.unsynced == []
+
+def test_none_policy_never_syncs(tmp_path, fsyncs):
+    writer = DurableWriter("none")
+    write_file(writer, tmp_path, "0.png")
+    assert writer.capture_done() == 0.0
+    writer.sync()
+    assert fsyncs == []
+    assert writer.unsynced == []
+    assert writer.unsynced_dirs == set()
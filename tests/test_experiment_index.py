@@ -0,0 +1,92 @@
+"""
+This code handles the tests of the experiment index
+"""
+import shutil
+
+import cv2
+import numpy as np
+
+from components.experiment_index import ExperimentIndex
+from components.metadata import Metadata
+
+
+def add_capture(exp_path, number):
+    """Adds a capture to an experiment, creating the experiment if needed, with a small color image and an empty depth file."""
+    name = exp_path.name
+    for directory in ("RGB", "Depth", "Metadata"):
+        (exp_path / directory).mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(exp_path / "RGB" / ("%s_%s.png" % (name, number))), np.full((32, 48, 3), 128, np.uint8))
+    (exp_path / "Depth" / ("%s_%s.npy" % (name, number))).write_bytes(b"")
+    metadata = Metadata(str(exp_path / "Metadata" / ("%s.json" % name)))
+    metadata.add_entry(number, "12:00:00", "01/05/2021", 0, 0, name)
+    metadata.close()
+
+def refresh(index):
+    """Runs a refresh to the end, returning the names of the experiments it reindexed or forgot."""
+    return list(index.refresh())
+
+
+def test_refresh_indexes_new_experiments(tmp_path):
+    add_capture(tmp_path / "a", "001")
+    add_capture(tmp_path / "a", "002")
+    add_capture(tmp_path / "b", "001")
+    (tmp_path / "not_an_experiment").mkdir()
+
+    index = ExperimentIndex(str(tmp_path))
+    assert refresh(index) == ["a", "b"]
+    entry = index.get("a")
+    assert entry["captures"] == 2
+    assert entry["plots"] == 2
+    assert entry["last_plot_number"] == 2
+    assert entry["disk_bytes"] > 0
+    assert entry["thumbnail"]
+    assert index.get("not_an_experiment") is None
+    index.close()
+
+def test_refresh_skips_unchanged_experiments(tmp_path):
+    add_capture(tmp_path / "a", "001")
+    add_capture(tmp_path / "b", "001")
+    index = ExperimentIndex(str(tmp_path))
+    refresh(index)
+    assert refresh(index) == []
+
+    add_capture(tmp_path / "b", "002")
+    assert refresh(index) == ["b"]
+    assert index.get("b")["captures"] == 2
+    index.close()
+
+def test_refresh_forgets_deleted_experiments(tmp_path):
+    add_capture(tmp_path / "a", "001")
+    add_capture(tmp_path / "b", "001")
+    index = ExperimentIndex(str(tmp_path))
+    refresh(index)
+
+    shutil.rmtree(str(tmp_path / "a"))
+    assert refresh(index) == ["a"]
+    assert [entry["name"] for entry in index.experiments()] == ["b"]
+    index.close()
+
+def test_recorded_capture_needs_no_rescan(tmp_path):
+    add_capture(tmp_path / "a", "001")
+    index = ExperimentIndex(str(tmp_path))
+    refresh(index)
+
+    add_capture(tmp_path / "a", "002")
+    index.record_capture(str(tmp_path / "a"), 2, 1620000000.0, 100, b"thumbnail", True)
+    assert refresh(index) == []
+    entry = index.get("a")
+    assert entry["captures"] == 2
+    assert entry["plots"] == 2
+    assert entry["last_plot_number"] == 2
+    index.close()
+
+def test_index_is_kept_across_opens(tmp_path):
+    add_capture(tmp_path / "a", "001")
+    index = ExperimentIndex(str(tmp_path))
+    refresh(index)
+    index.close()
+
+    reopened = ExperimentIndex(str(tmp_path))
+    assert reopened.get("a")["captures"] == 1
+    assert refresh(reopened) == []
+    reopened.close()
@@ -0,0 +1,134 @@
+"""
+This code handles the tests of the metadata journal, its replay, compaction and migration
+"""
+import json
+import os
+
+from components import metadata as metadata_module
+from components.metadata import Metadata, read_entries
+
+
+def add_plots(metadata, start, count, serial=None):
+    """Adds count entries to the metadata, numbered from start."""
+    for number in range(start, start + count):
+        metadata.add_entry("%03i" % number, "12:00:00", "01/05/2021", 0, 0, "exp", serial=serial)
+
+def read_legacy(metadata_fpath):
+    """Reads the legacy metadata file, a JSON array of the entries."""
+    with open(metadata_fpath, "r") as f:
+        return json.load(f)
+
+
+def test_new_metadata_is_empty(tmp_path):
+    metadata = Metadata(str(tmp_path / "exp.json"))
+    assert metadata.get_last_index() == -1
+    assert metadata.entries() == []
+    assert os.path.exists(metadata.journal_path)
+    metadata.close()
+
+def test_journal_is_replayed_on_reopen(tmp_path):
+    fpath = str(tmp_path / "exp.json")
+    metadata = Metadata(fpath)
+    add_plots(metadata, 1, 3)
+    metadata.save()
+    metadata.close()
+
+    reopened = Metadata(fpath)
+    assert reopened.get_last_index() == 3
+    assert [entry["number"] for entry in reopened.entries()] == ["001", "002", "003"]
+    add_plots(reopened, 4, 1)
+    reopened.close()
+    assert [entry["number"] for entry in read_entries(fpath)] == ["001", "002", "003", "004"]
+
+def test_entries_include_unsaved(tmp_path):
+    metadata = Metadata(str(tmp_path / "exp.json"))
+    add_plots(metadata, 1, 2)
+    assert metadata.get_last_index() == 2
+    assert len(metadata.entries()) == 2
+    metadata.close()
+
+def test_save_compacts_every_so_often(tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata_module, "METADATA_COMPACT_EVERY", 5)
+    fpath = str(tmp_path / "exp.json")
+    metadata = Metadata(fpath)
+    for number in range(1, 13):
+        add_plots(metadata, number, 1)
+        metadata.save()
+
+    # compacted after the 5th and 10th entries, the last two only in the journal
+    assert len(read_legacy(fpath)) == 10
+    assert metadata.nuncompacted == 2
+    assert len(read_entries(fpath)) == 12
+
+    metadata.close()
+    assert len(read_legacy(fpath)) == 12
+    assert not os.path.exists(fpath + ".tmp")
+
+def test_close_writes_legacy_file_of_empty_metadata(tmp_path):
+    fpath = str(tmp_path / "exp.json")
+    Metadata(fpath).close()
+    assert read_legacy(fpath) == []
+
+def test_torn_last_line_is_cut(tmp_path):
+    fpath = str(tmp_path / "exp.json")
+    metadata = Metadata(fpath)
+    add_plots(metadata, 1, 2)
+    metadata.close()
+    with open(metadata.journal_path, "a") as f:
+        f.write('{"number": "003", "ti')
+
+    reopened = Metadata(fpath)
+    assert reopened.get_last_index() == 2
+    add_plots(reopened, 3, 1)
+    reopened.save()
+    assert [entry["number"] for entry in reopened.entries()] == ["001", "002", "003"]
+    reopened.close()
+
+def test_read_entries_skips_torn_last_line(tmp_path):
+    fpath = str(tmp_path / "exp.json")
+    metadata = Metadata(fpath)
+    add_plots(metadata, 1, 2)
+    metadata.close()
+    with open(metadata.journal_path, "a") as f:
+        f.write('{"number": "003"')
+    assert len(read_entries(fpath)) == 2
+
+def test_legacy_metadata_is_migrated(tmp_path):
+    fpath = str(tmp_path / "exp.json")
+    legacy = [{"number": "%03i" % number, "time": "12:00:00", "date": "01/05/2021", "xpos": 0, "ypos": 0, "name": "exp"}
+              for number in range(1, 5)]
+    with open(fpath, "w") as f:
+        json.dump(legacy, f)
+    assert read_entries(fpath) == legacy
+
+    metadata = Metadata(fpath)
+    assert metadata.get_last_index() == 4
+    assert metadata.entries() == legacy
+    assert not os.path.exists(metadata.journal_path + ".tmp")
+    metadata.close()
+
+def test_capture_fields(tmp_path):
+    metadata = Metadata(str(tmp_path / "exp.json"))
+    metadata.add_entry("001", "12:00:00", "01/05/2021", 1, 2, "exp", frame_number=7, frame_timestamp=1000.0,
+                       trigger_timestamp=990.0, level_timestamp=995.0, serial="123")
+    metadata.add_entry("002", "12:00:01", "01/05/2021", 1, 2, "exp")
+    first, second = metadata.entries()
+    assert first["frame_number"] == 7
+    assert first["trigger_to_frame_ms"] == 10.0
+    assert first["level_to_frame_ms"] == 5.0
+    assert first["camera_serial"] == "123"
+    assert "recovered" not in first
+    assert "frame_timestamp_ms" not in second and "camera_serial" not in second
+    metadata.close()
+
+def test_none_durability_leaves_journal_to_os(tmp_path, monkeypatch):
+    metadata = Metadata(str(tmp_path / "exp.json"), durability="none")
+    synced = []
+    monkeypatch.setattr(metadata_module.os, "fsync", synced.append)
+    add_plots(metadata, 1, 1)
+    metadata.save()
+    metadata.sync()
+    assert metadata.nunsynced == 0
+    assert synced == []
+    monkeypatch.undo()
+    metadata.close()
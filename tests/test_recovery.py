@@ -0,0 +1,131 @@
+"""
+This code handles the tests of recovering an experiment after a crash mid-capture
+"""
+import os
+
+import cv2
+import numpy as np
+
+from util import DURABILITY_BATCH_CAPTURES, NWORKERS, RECOVERY_VERIFY_LAST
+from components.metadata import Metadata
+from components.recovery import CORRUPT_SUFFIX, recover_experiment, verify_window
+
+EXP_NAME = "exp"
+
+
+def make_experiment(tmp_path):
+    """Creates an empty experiment, with its RGB, Depth and Metadata directories."""
+    exp_path = tmp_path / EXP_NAME
+    for directory in ("RGB", "Depth", "Metadata"):
+        (exp_path / directory).mkdir(parents=True)
+    return exp_path
+
+def metadata_path(exp_path):
+    """Returns the path of the experiment's metadata file."""
+    return str(exp_path / "Metadata" / ("%s.json" % EXP_NAME))
+
+def save_images(exp_path, number, serial=None):
+    """Saves a capture's color and depth images, returning their paths."""
+    image_name = "%s_%s" % (EXP_NAME, number) if serial is None else "%s_%s_%s" % (EXP_NAME, number, serial)
+    color_fname = str(exp_path / "RGB" / (image_name + ".png"))
+    depth_fname = str(exp_path / "Depth" / (image_name + ".npy"))
+    cv2.imwrite(color_fname, np.full((8, 8, 3), 128, np.uint8))
+    np.save(depth_fname, np.ones((8, 8), np.uint16))
+    return color_fname, depth_fname
+
+def add_captures(exp_path, numbers, durability="capture"):
+    """Saves captures with their metadata entries."""
+    metadata = Metadata(metadata_path(exp_path), durability)
+    for number in numbers:
+        save_images(exp_path, number)
+        metadata.add_entry(number, "12:00:00", "01/05/2021", 0, 0, EXP_NAME)
+    metadata.close()
+
+def recover(exp_path, durability="capture"):
+    """Opens an experiment's metadata and recovers the experiment, returning the report and the entries after it."""
+    metadata = Metadata(metadata_path(exp_path), durability)
+    report = recover_experiment(str(exp_path), metadata)
+    entries = metadata.entries()
+    metadata.close()
+    return report, entries
+
+def age(fname, seconds):
+    """Moves a file's modification time into the past."""
+    mtime = os.path.getmtime(fname) - seconds
+    os.utime(fname, (mtime, mtime))
+
+
+def test_verify_window():
+    assert verify_window("none", 1) is None
+    assert verify_window("capture", 2) == RECOVERY_VERIFY_LAST
+    assert verify_window("batched", 2) == DURABILITY_BATCH_CAPTURES * NWORKERS * 2 + RECOVERY_VERIFY_LAST
+
+def test_consistent_experiment(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["001", "002"])
+    report, entries = recover(exp_path)
+    assert report == ([], [], [], [])
+    assert len(entries) == 2
+
+def test_temporary_files_are_removed(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["001"])
+    (exp_path / "RGB" / "exp_002.png.tmp").write_bytes(b"half")
+    (exp_path / "Metadata" / "exp.json.tmp").write_bytes(b"[")
+    report, _ = recover(exp_path)
+    assert sorted(report.removed_tmp) == ["exp.json.tmp", "exp_002.png.tmp"]
+    assert sorted(os.listdir(str(exp_path / "RGB"))) == ["exp_001.png"]
+
+def test_unrecorded_capture_gets_entry(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["001"])
+    save_images(exp_path, "002", serial="123")
+    report, entries = recover(exp_path)
+    assert report.unrecorded == ["exp_002_123"]
+    assert entries[-1]["number"] == "002"
+    assert entries[-1]["camera_serial"] == "123"
+    assert entries[-1]["recovered"] is True
+
+def test_half_capture_is_set_aside(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["001"])
+    _, depth_fname = save_images(exp_path, "002")
+    os.remove(depth_fname)
+    report, entries = recover(exp_path)
+    assert report.corrupt == ["exp_002"]
+    assert report.unrecorded == []
+    assert len(entries) == 1
+    assert os.path.exists(str(exp_path / "RGB" / ("exp_002.png" + CORRUPT_SUFFIX)))
+
+def test_corrupt_newest_image_is_set_aside(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["001", "002"])
+    (exp_path / "RGB" / "exp_002.png").write_bytes(b"")
+    report, entries = recover(exp_path)
+    assert report.corrupt == ["exp_002"]
+    assert report.missing == ["exp_002"]
+    assert len(entries) == 2  # the metadata is never rewritten
+    assert os.path.exists(str(exp_path / "RGB" / ("exp_002.png" + CORRUPT_SUFFIX)))
+
+def test_only_newest_captures_are_verified(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    numbers = ["%03i" % number for number in range(1, RECOVERY_VERIFY_LAST + 3)]
+    add_captures(exp_path, numbers)
+    (exp_path / "RGB" / "exp_001.png").write_bytes(b"")
+
+    report, _ = recover(exp_path, "capture")
+    assert report.corrupt == []  # synced before it was reported saved, not decoded
+
+    report, _ = recover(exp_path, "none")
+    assert report.corrupt == ["exp_001"]
+
+def test_old_images_without_entry_are_left_alone(tmp_path):
+    exp_path = make_experiment(tmp_path)
+    add_captures(exp_path, ["002"])
+    for fname in save_images(exp_path, "001"):
+        age(fname, 3600)
+    report, entries = recover(exp_path)
+    assert report.unrecorded == []
+    assert report.corrupt == []
+    assert len(entries) == 1
+    assert os.path.exists(str(exp_path / "RGB" / "exp_001.png"))
@@ -9,6 +9,7 @@ This code stores constant variables and important paths so that they are easily
 
 import logging
 import os
+import time
 from argparse import ArgumentParser
 from contextlib import contextmanager
 
@@ -24,28 +25,108 @@ ICON_IMAGE_PATH = os.path.join(PCL_SRC_PATH, "resources", "icons", "cameraleaf.p
 TARGET_ICON_PATH = os.path.join(PCL_SRC_PATH, "resources", "icons", "target_png_375.png")
 ALERT_AUDIO_PATH = os.path.join(PCL_SRC_PATH, "resources", "audio", "camera-shutter-click.wav")
 ABOUT_DIALOG_PATH = os.path.join(PCL_SRC_PATH, "resources", "ui", "PlotCamLiteUI_AboutDialog.ui")
+PREVIEW_CACHE_PATH = os.path.join(PCL_SRC_PATH, "preview_cache") # previews of the captures, kept beside the code so reviewing doesn't read the experiments' disk
 HELP_DOCUMENTATION_PATH = os.path.join(PCL_SRC_PATH, "resources", "documents", "Help_Documentation.pdf")
 HELP_DOCUMENTATION_URL = bytearray(QUrl.fromLocalFile(HELP_DOCUMENTATION_PATH).toEncoded()).decode()
 
 
 FRAME_NCHANNELS = 3 # number of channels in the image
 
-SM_BUF_SIZE = 1  # num of frames to store in shared memory
+FRAME_ROTATION = 90  # counterclockwise rotation of the camera's frames, in degrees, for both the display and the saved images
+
+SM_BUF_SIZE = 3  # num of frame slots in the shared memory ring, at least 2 so the camera never overwrites the frame being displayed
+STREAM_CONFIGURE_TIMEOUT_SEC = 5  # how long the GUI waits for the camera process to restart its camera with new stream settings
+STREAM_STOP_TIMEOUT_SEC = 60  # how long the GUI waits for a camera process to finish its queued saves and stop before killing it
+CAMERA_DISCOVERY_PERIOD_SEC = 1  # how often the camera process looks for a camera while none is connected
+FRAME_HISTORY_SIZE = 16  # num of recent color+depth frames the camera process keeps to pick captures from, about 74 MB at 1280x720
 
 PLOT_NUMBER_PADDING = 3  # How many numbers the plot number must occupy, for example 1 will need to be 001 and 11 will need to be 011
 
 LEVEL_TOLERANCE = 0.2  # the absolute value which the accelerometer must return for the camera to be level
-ACCELEROMETER_PERIOD_MS = 50  # in ms, how frequent the accelerometer is read
+ACCELEROMETER_DATA_INTERVAL_MS = 50  # in ms, how often the accelerometer reports readings while it moves
+ACCELEROMETER_CHANGE_TRIGGER = 0.005  # in g, the accelerometer only reports a reading once it changed by more than this
+LEVEL_SMOOTHING = 0.3  # weight of a new reading in the exponential moving average of the accelerometer readings
+TARGET_MOVE_THRESHOLD = 0.01  # in g, how far the smoothed reading must move before the target is redrawn
+
+SHARPNESS_DOWNSAMPLE = 4  # the camera process scores the sharpness of every frame on every 4th pixel of it
+AUTO_CAPTURE_DWELL_MS = 500  # in ms, how long the camera must stay level before auto-capture triggers, it then saves the sharpest frame of the dwell
+AUTO_CAPTURE_SHARPNESS_RATIO = 0.8  # auto-capture holds off while the newest frame is less sharp than this fraction of the sharpest one of the dwell
+ACCELEROMETER_ATTACH_TIMEOUT_MS = 1000  # in ms, how long after startup to warn that no accelerometer attached, it is still picked up later
+LEVEL_HISTORY_SIZE = 100  # num of timestamped accelerometer samples kept to match captured frames against
+
+DEPTH_OVERLAY_DECIMATION = 4  # the live depth overlay is computed on every 4th depth pixel, 320x180 at 1280x720
+DEPTH_OVERLAY_MAX_HZ = 5  # the camera process updates the depth overlay at most this often
+DEPTH_OVERLAY_CPU_BUDGET = 0.05  # fraction of the camera process's time the depth overlay may take, its rate drops below the max to stay within it
+CANOPY_PERCENTILE = 5  # percentile of the depth taken as the top of the canopy, ignores the odd stray pixel closer to the camera
+GROUND_PERCENTILE = 95  # percentile of the depth taken as the ground, the plant height is the distance between the two
+DEPTH_OVERLAY_SIZE = 0.3  # the depth overlay's thumbnail takes up this fraction of the camera view's width
 
 IMG_SAVE_REQ_Q_SIZE = 100  # max size of queue storing pending frames to save.
 NWORKERS = 5  # num of worker processes crunching thru the frames-to-save queue.
-
-METADATA_UPDATE_PERIOD_SEC = 60  # save metadata to disk every minute
+SAVE_WORKER_NICENESS = 10  # the save workers run at a lower priority than the stream, where the OS supports it
+SAVE_STATUS_POLL_SEC = 0.1  # how long the capture watcher blocks on the save status queue before checking if it should stop
+CAPTURE_CLOCK_TOLERANCE_MS = 5  # frames stamped up to this long before a capture was triggered still count as fresh, covers the sensor to host clock skew
+
+REPLAY_MAX_FRAMES = 100  # max num of captures the replay camera loads into memory
+
+METADATA_UPDATE_PERIOD_SEC = 60  # fsync the metadata journal at least every minute
+METADATA_FSYNC_BATCH = 10  # fsync the metadata journal once this many entries are unsynced
+METADATA_COMPACT_EVERY = 200  # rewrite the legacy metadata json from the journal once this many entries were added
+
+DEFAULT_DURABILITY = "batched"  # when captures are forced to disk, one of capture (before each is reported saved), batched or none (left to the OS)
+DURABILITY_BATCH_CAPTURES = 10  # with batched durability, a save worker forces its files to disk once it saved this many captures
+DURABILITY_BATCH_SEC = 5  # with batched durability, or once its oldest unsynced capture is this old, even if no more captures come in
+RECOVERY_VERIFY_LAST = 5  # num of newest captures whose images are decoded when an experiment is opened, on top of the ones batched durability can leave unsynced
+
+DISK_CHECK_PERIOD_SEC = 10  # the disk monitor checks the free space of the experiment's disk this often, and after a capture fails
+DISK_RESERVE_MB = 200  # space kept free on the experiment's disk, captures that would eat into it are refused
+DISK_WARN_PLOTS = 100  # warn once fewer plots than this fit on the experiment's disk
+DISK_DEGRADE_PLOTS = 300  # with auto-degrade, captures switch to the smallest formats once fewer plots than this fit in the experiment's
+SAVE_BACKLOG_DEGRADE = 20  # with auto-degrade, captures switch to the fastest formats once this many wait on the save workers
+SAVE_BACKLOG_RESTORE = 5  # and switch back to the experiment's once the backlog is down to this many
+SAVE_STATS_WINDOW = 20  # num of the last captures the capture size and save throughput are averaged over
+STATUS_MESSAGE_MS = 10000  # in ms, how long warnings stay in the status bar
+
+TELEMETRY_PERIOD_SEC = 1  # the GUI and camera processes hand off their telemetry this often, the stats overlay and dump are updated with it
+TELEMETRY_QUEUE_SIZE = 10  # num of telemetry snapshots a camera process queues for the GUI, the ones past it are dropped
+TELEMETRY_DUMP_MAX_MB = 10  # the telemetry dump file is rotated once it reaches this size
+TELEMETRY_DUMP_BACKUPS = 3  # num of rotated telemetry dump files kept
+
+DEFAULT_DEPTH_FORMAT = "npy"  # depth format of new experiments, one of txt, npy, npz, png
+LEGACY_DEPTH_FORMAT = "txt"  # depth format of experiments created before depth formats were selectable
+DEFAULT_COLOR_FORMAT = "png"  # color format of new experiments, one of bmp, png, webp, jpeg
+LEGACY_COLOR_FORMAT = "bmp"  # color format of experiments created before color formats were selectable
+PNG_COMPRESSION = 1  # zlib level of png color images, 0-9, higher levels take several times longer to shave off a few % more
+JPEG_QUALITY = 95  # quality of jpeg color images, captured or converted by the batch
+DEFAULT_DEPTH_PROCESSING = "raw"  # depth processing preset of new experiments, raw saves the depth as the camera streamed it
+
+# depth processing of the captured frames, the defaults of the RealSense SDK's filters
+DECIMATION_FACTOR = 2  # the decimation stage keeps the median of every 2x2 block of depth pixels
+SPATIAL_FILTER_ALPHA = 0.5  # weight of a pixel against its smoothed neighbour in the edge preserving spatial filter
+SPATIAL_FILTER_DELTA = 20  # in depth units, neighbours further apart than this are an edge and aren't smoothed across
+SPATIAL_FILTER_ITERATIONS = 2  # num of times the spatial filter sweeps the frame
+TEMPORAL_FILTER_ALPHA = 0.4  # weight of the newer frame in the temporal filter's moving average
+TEMPORAL_FILTER_DELTA = 20  # in depth units, a pixel changing by more than this between frames restarts its average
+TEMPORAL_FILTER_FRAMES = 4  # num of frames before the captured one the temporal filter averages over
+
+BATCH_CHUNK_SIZE = 32  # num of images a batch worker processes per task, amortizes handing tasks to the workers
+THUMBNAIL_SIZE = 256  # in px, long side of the thumbnails the batch generates
+
+INDEX_THUMBNAIL_SIZE = 160  # in px, long side of the thumbnail of the last capture the experiment index keeps per experiment
+INDEX_BUSY_TIMEOUT_SEC = 5  # how long a write to the experiment index waits for another connection writing to it
+
+PREVIEW_SIZE = 320  # in px, long side of the capture previews the save workers make for the review strip
+PREVIEW_CACHE_MAX_MB = 200  # the least recently viewed previews are evicted from the preview cache beyond this, about 10000 previews
+PREVIEW_PIXMAP_CACHE_MB = 16  # in memory cache of the previews scaled for the review strip, about 500 of them
+REVIEW_STRIP_ICON_SIZE = 96  # in px, height of the previews in the review strip
 
 DEFAULT_FONT = QFont('Times', 15)
 
 # String constants
 LOG_FILENAME = "plotcamlite_log.txt"
+EXPERIMENT_SETTINGS_FILENAME = "settings.json"  # per experiment settings, stored in the experiment's Metadata directory
+BATCH_PROGRESS_FILENAME = "batch_progress.jsonl"  # images the batch processed per experiment, stored in the experiment's Metadata directory
+EXPERIMENT_INDEX_FILENAME = "experiment_index.sqlite3"  # index of the experiments, stored in PCL_EXP_PATH
 PLOT_NUM_DEFAULT_TEXT = "Enter Plot Number here"
 PLATFORM = "Windows" 
 LAST_UPDATED_YEAR = 2021
@@ -58,7 +139,22 @@ pcl_config = {"monitor": False,
                 "main_window_ui_path" : os.path.join(PCL_SRC_PATH, "resources", "ui", "PlotCamLiteUI_VR.ui"), 
                 "stream_width" : 720,
                 "stream_height" : 1280,
-                "stream_fps": 30} # frame rate limiter 
+                "stream_fps": 30, # frame rate limiter 
+                "camera": "realsense", # camera source, one of realsense, sim, replay
+                "replay_path": None, # experiment directory or .bag recording the replay camera plays
+                "camera_serials": None, # serial numbers of the RealSense cameras to stream, defaults to every camera connected
+                "accelerometer_interval_ms": ACCELEROMETER_DATA_INTERVAL_MS,
+                "accelerometer_change_trigger": ACCELEROMETER_CHANGE_TRIGGER,
+                "auto_capture": False, # wait for the camera to be steady and pick the sharpest frame when taking a picture
+                "auto_capture_dwell_ms": AUTO_CAPTURE_DWELL_MS,
+                "frame_history": FRAME_HISTORY_SIZE, # num of recent frames the camera process keeps
+                "depth_overlay": True, # show the distance, plant height and depth coverage over the stream
+                "review_strip": True, # show the previews of the last captures under the stream
+                "durability": DEFAULT_DURABILITY, # when captures and metadata are forced to disk, one of capture, batched, none
+                "auto_degrade": False, # switch captures to cheaper formats when the disk is nearly full or the saves fall behind
+                "stats_overlay": False, # show the performance telemetry over the stream
+                "telemetry_path": None, # file the performance telemetry is dumped to, csv or json lines
+                "profile_startup": False} # print how long each step of the startup took
 
 
 # Advanced variables
@@ -108,6 +204,139 @@ def configure_plotcamlite():
         help="set the stream's fps, either 15 or 30",
     )
 
+    # change the camera source
+    parser.add_argument(
+        '--camera',
+        dest="camera",
+        type=str,
+        default="realsense",
+        choices=["realsense", "sim", "replay"],
+        help="camera to stream from, the RealSense camera(default), a synthetic scene or a replay of --replay-path",
+    )
+
+    # recording for the replay camera
+    parser.add_argument(
+        '--replay-path',
+        dest="replay_path",
+        type=str,
+        default=None,
+        help="experiment directory or RealSense .bag recording for --camera replay",
+    )
+
+    # cameras of a multi-camera rig
+    parser.add_argument(
+        '--serials',
+        dest="serials",
+        type=str,
+        nargs='+',
+        default=None,
+        help="serial numbers of the RealSense cameras to stream, the first is displayed, defaults to every camera connected",
+    )
+
+    # accelerometer reporting rate
+    parser.add_argument(
+        '--accel-interval',
+        dest="accel_interval",
+        type=int,
+        default=ACCELEROMETER_DATA_INTERVAL_MS,
+        help="ms between accelerometer readings while it moves, defaults to %i" % ACCELEROMETER_DATA_INTERVAL_MS,
+    )
+
+    # accelerometer sensitivity
+    parser.add_argument(
+        '--accel-trigger',
+        dest="accel_trigger",
+        type=float,
+        default=ACCELEROMETER_CHANGE_TRIGGER,
+        help="change in g the accelerometer must see to report a reading, defaults to %g" % ACCELEROMETER_CHANGE_TRIGGER,
+    )
+
+    # auto-capture
+    parser.add_argument(
+        '--auto-capture',
+        dest="auto_capture",
+        action='store_true',
+        help="take pictures once the camera has been level for the dwell time, on the sharpest frame",
+    )
+
+    # auto-capture dwell
+    parser.add_argument(
+        '--dwell',
+        dest="dwell",
+        type=int,
+        default=AUTO_CAPTURE_DWELL_MS,
+        help="ms the camera must stay level before auto-capture takes the picture, defaults to %i" % AUTO_CAPTURE_DWELL_MS,
+    )
+
+    # frame history
+    parser.add_argument(
+        '--history',
+        dest="history",
+        type=int,
+        default=FRAME_HISTORY_SIZE,
+        help="num of recent frames kept to pick captures from, defaults to %i" % FRAME_HISTORY_SIZE,
+    )
+
+    # depth overlay
+    parser.add_argument(
+        '--no-depth-overlay',
+        dest="depth_overlay",
+        action='store_false',
+        help="start with the depth overlay hidden, it can be shown from the Edit menu",
+    )
+
+    # durability
+    parser.add_argument(
+        '--durability',
+        dest="durability",
+        default=DEFAULT_DURABILITY,
+        choices=["capture", "batched", "none"],
+        help="when captures and metadata are forced to disk: before every capture is reported saved, in batches of %i "
+             "captures or %i s, or left to the OS, defaults to %s" % (DURABILITY_BATCH_CAPTURES, DURABILITY_BATCH_SEC, DEFAULT_DURABILITY),
+    )
+
+    # auto-degrade
+    parser.add_argument(
+        '--auto-degrade',
+        dest="auto_degrade",
+        action='store_true',
+        help="save captures as jpeg and npz when fewer than %i plots fit on the disk, or as jpeg and npy when %i wait on the "
+             "save workers, until it clears" % (DISK_DEGRADE_PLOTS, SAVE_BACKLOG_DEGRADE),
+    )
+
+    # stats overlay
+    parser.add_argument(
+        '--stats-overlay',
+        dest="stats_overlay",
+        action='store_true',
+        help="start with the performance stats shown over the stream, they can be toggled from the Edit menu",
+    )
+
+    # telemetry dump
+    parser.add_argument(
+        '--telemetry-dump',
+        dest="telemetry_path",
+        default=None,
+        help="append the performance telemetry to this file every %i s, as csv if it ends in .csv, json lines otherwise, "
+             "rotated at %i MB" % (TELEMETRY_PERIOD_SEC, TELEMETRY_DUMP_MAX_MB),
+    )
+
+    # review strip
+    parser.add_argument(
+        '--no-review-strip',
+        dest="review_strip",
+        action='store_false',
+        help="start with the review strip hidden, it can be shown from the Edit menu",
+    )
+
+    # startup profiling
+    parser.add_argument(
+        '--profile-startup',
+        dest="profile_startup",
+        action='store_true',
+        help="print how long the imports and each step of the startup took",
+    )
+
     # Log Level
     parser.add_argument(
         '-l', '--log',
@@ -119,6 +348,10 @@ def configure_plotcamlite():
     )
 
     args = parser.parse_args()
+    if args.camera == "replay" and not args.replay_path:
+        parser.error("--camera replay needs a --replay-path")
+    if args.history < 1:
+        parser.error("--history must keep at least 1 frame")
 
     # handle monitor view 
     pcl_config["monitor"] = args.monitor
@@ -128,6 +361,41 @@ def configure_plotcamlite():
     # handle fps
     pcl_config["stream_fps"] = args.fps
 
+    # handle camera source
+    pcl_config["camera"] = args.camera
+    pcl_config["replay_path"] = args.replay_path
+    pcl_config["camera_serials"] = args.serials
+
+    # handle accelerometer
+    pcl_config["accelerometer_interval_ms"] = args.accel_interval
+    pcl_config["accelerometer_change_trigger"] = args.accel_trigger
+
+    # handle auto-capture
+    pcl_config["auto_capture"] = args.auto_capture
+    pcl_config["auto_capture_dwell_ms"] = args.dwell
+
+    # handle frame history
+    pcl_config["frame_history"] = args.history
+
+    # handle depth overlay
+    pcl_config["depth_overlay"] = args.depth_overlay
+
+    # handle durability
+    pcl_config["durability"] = args.durability
+
+    # handle auto-degrade
+    pcl_config["auto_degrade"] = args.auto_degrade
+
+    # handle telemetry
+    pcl_config["stats_overlay"] = args.stats_overlay
+    pcl_config["telemetry_path"] = args.telemetry_path
+
+    # handle review strip
+    pcl_config["review_strip"] = args.review_strip
+
+    # handle startup profiling
+    pcl_config["profile_startup"] = args.profile_startup
+
     # handle resolution
     pcl_config["stream_height"] = args.res
     pcl_config["stream_width"] = resolution_width[pcl_config["stream_height"]]
@@ -222,3 +490,59 @@ def within_tolerance(x, y, tolerance):
         bool: true if the position is within the tolerance
     """    
     return abs(x) <= tolerance and abs(y) <= tolerance
+
+class StartupProfiler:
+    """
+    Times the steps of the startup, from the start of the program to the devices streaming.
+    The steps are always recorded, they are only printed with --profile-startup.
+    Steps finishing after the breakdown was printed, like the devices found in the background, are printed as they finish.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.steps = []  # (step, ms since the previous step, ms since the start)
+        self.reported = False
+
+    def mark(self, step, at=None):
+        """Records that a step finished.
+
+        Args:
+            step (str): description of the step
+            at (float): time.perf_counter() the step finished at, defaults to now
+        """
+        now = time.perf_counter() if at is None else at
+        self.steps.append((step, (now - self.last_time) * 1000, (now - self.start_time) * 1000))
+        self.last_time = now
+        if self.reported:
+            self.print_step(*self.steps[-1])
+
+    def mark_since(self, step, start):
+        """Records a step that ran in the background, timed from its own start rather than the previous step.
+
+        Args:
+            step (str): description of the step
+            start (float): time.perf_counter() the step started at
+        """
+        now = time.perf_counter()
+        self.steps.append((step, (now - start) * 1000, (now - self.start_time) * 1000))
+        if self.reported:
+            self.print_step(*self.steps[-1])
+
+    def print_step(self, step, duration, elapsed):
+        if pcl_config["profile_startup"]:
+            print("%-40s %8.1f ms %8.1f ms" % (step, duration, elapsed))
+
+    def report(self):
+        """Prints the steps so far, if startup profiling is on."""
+        if self.reported:
+            return
+
+        self.reported = True
+        if pcl_config["profile_startup"]:
+            print("%-40s %11s %11s" % ("startup step", "took", "since start"))
+            for step in self.steps:
+                self.print_step(*step)
+
+
+startup_profile = StartupProfiler()